@@ -0,0 +1,134 @@
+# backend/adaptive.py
+#
+# Tự điều chỉnh tải detect theo độ trễ đo được: khi Pi nóng / bị throttle,
+# inference chậm đi -> giãn chu kỳ detect và giảm kích thước ảnh đưa vào model
+# thay vì để hàng đợi dồn ngày càng dài; máy rảnh lại thì tăng dần trở lại.
+#
+# Tín hiệu đầu vào:
+#   - lag: thời gian từ lúc frame được chụp tới lúc có kết quả detect (EWMA theo camera),
+#   - queue_depth() của INFERENCE,
+#   - last_batch_ms / last_batch_size -> ước lượng ms mỗi frame, so với tổng tần suất detect.
+
+import threading
+import time
+
+# các mức kích thước ảnh, giảm dần khi quá tải (chỉ có tác dụng với model nhận size bất kỳ:
+# ONNX export dynamic=True, ultralytics; model size cố định thì chỉ giãn chu kỳ)
+SIZE_LEVELS = (640, 512, 416, 320)
+
+
+class AdaptiveController:
+    """
+    factor >= 1: hệ số nhân chu kỳ detect (1 = đúng detect_fps cấu hình).
+    level: chỉ số trong SIZE_LEVELS (0 = 640).
+    Camera có ưu tiên (vừa có chuyển động / sự kiện) được giãn ít hơn và giữ ảnh lớn hơn 1 mức.
+    fixed_hw: input (h, w) cố định của detector (inference.readiness()["input_hw"]) -> không
+    giảm size (detector letterbox phóng lên lại, không bớt tải), ảnh gửi đi đúng size đó.
+    """
+    def __init__(self, inference, lag_budget: float = 1.0, period: float = 1.0,
+                 max_factor: float = 8.0, calm_period: float = 5.0, alpha: float = 0.3):
+        self.inference = inference
+        self.lag_budget = lag_budget
+        self.period = period
+        self.max_factor = max_factor
+        self.calm_period = calm_period
+        self.alpha = alpha
+
+        self.factor = 1.0
+        self.level = 0
+        self.lag = {}          # cam_id -> (lag EWMA giây, ts mẫu cuối)
+        self.utilization = 0.0
+        self.fixed_hw = None
+        self.last_reason = ""
+        self._last_step = 0.0
+        self._calm_since = None
+        self.lock = threading.Lock()
+
+    def observe(self, cam_id: str, lag_s: float):
+        now = time.time()
+        with self.lock:
+            prev = self.lag.get(cam_id)
+            val = lag_s if prev is None else prev[0] + self.alpha * (lag_s - prev[0])
+            self.lag[cam_id] = (val, now)
+
+    def _max_lag(self, now: float) -> float:
+        with self.lock:
+            # bỏ mẫu quá cũ (camera đã tắt detect)
+            return max([v for v, ts in self.lag.values() if now - ts < 10.0], default=0.0)
+
+    def _utilization(self, demand_fps: float) -> float:
+        size = getattr(self.inference, "last_batch_size", 0)
+        batch_ms = getattr(self.inference, "last_batch_ms", 0.0)
+        if size <= 0 or batch_ms <= 0:
+            return 0.0
+        per_frame_s = batch_ms / 1000.0 / size
+        workers = max(1, getattr(self.inference, "num_workers", 1))
+        return demand_fps * per_frame_s / workers
+
+    def step(self, demand_fps: float):
+        """
+        Gọi định kỳ (DetectionScheduler.run); tự giới hạn tối đa 1 lần mỗi `period` giây.
+        demand_fps: tổng số lần detect mỗi giây theo chu kỳ hiện tại.
+        """
+        now = time.time()
+        if now - self._last_step < self.period:
+            return
+        self._last_step = now
+
+        lag = self._max_lag(now)
+        depth = self.inference.queue_depth()
+        self.utilization = self._utilization(demand_fps)
+        self.fixed_hw = self.inference.readiness().get("input_hw")
+        if self.fixed_hw:
+            self.level = 0
+
+        if lag > self.lag_budget or depth > 4 or self.utilization > 0.9:
+            self._calm_since = None
+            self.last_reason = f"lag={lag:.2f}s depth={depth} util={self.utilization:.2f}"
+            if self.factor < 2.0 or self.fixed_hw or self.level >= len(SIZE_LEVELS) - 1:
+                self.factor = min(self.max_factor, self.factor * 1.5)
+            else:
+                # đã giãn chu kỳ khá nhiều -> giảm cả độ phân giải
+                self.level += 1
+            return
+
+        if lag < 0.5 * self.lag_budget and depth == 0 and self.utilization < 0.6:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.calm_period:
+                # rảnh đủ lâu -> phục hồi từ từ: độ phân giải trước, rồi tới tần suất
+                self._calm_since = now
+                if self.level > 0:
+                    self.level -= 1
+                elif self.factor > 1.0:
+                    self.factor = max(1.0, self.factor / 1.25)
+        else:
+            self._calm_since = None
+
+    def interval_factor(self, priority: int = 0) -> float:
+        if priority > 0:
+            return max(1.0, self.factor / 2.0)
+        return self.factor
+
+    def infer_size(self, priority: int = 0) -> int:
+        if self.fixed_hw:
+            return max(self.fixed_hw)
+        level = max(0, self.level - 1) if priority > 0 else self.level
+        return SIZE_LEVELS[level]
+
+    def lag_ms(self, cam_id: str):
+        with self.lock:
+            v = self.lag.get(cam_id)
+        return round(v[0] * 1000.0, 1) if v else None
+
+    def status(self) -> dict:
+        return {
+            "lag_budget_s": self.lag_budget,
+            "max_lag_ms": round(self._max_lag(time.time()) * 1000.0, 1),
+            "queue_depth": self.inference.queue_depth(),
+            "utilization": round(self.utilization, 2),
+            "interval_factor": round(self.factor, 2),
+            "infer_size": max(self.fixed_hw) if self.fixed_hw else SIZE_LEVELS[self.level],
+            "fixed_input": bool(self.fixed_hw),
+            "last_reason": self.last_reason,
+        }
@@ -0,0 +1,135 @@
+# backend/camera_client.py
+#
+# Client async (httpx) cho các endpoint nói chuyện với ESP32-CAM
+# (/status, /servo, ...): giữ kết nối keep-alive theo pool, giới hạn số request
+# đồng thời trên mỗi camera, timeout dùng chung. Camera chết không còn chiếm
+# thread của FastAPI trong lúc chờ timeout.
+#
+# Firmware chỉ giữ 1 session (1 SID) tại 1 thời điểm, nên SID được lưu chung
+# trong cam["sid"] cho cả client async này lẫn requests.Session của luồng ingest.
+
+import asyncio
+import time
+
+import httpx
+from fastapi import HTTPException
+
+# login thành công trong khoảng này thì coi SID còn hiệu lực (tránh spam /login)
+LOGIN_TTL = 60.0
+# nếu bên khác vừa login lại trong khoảng này -> dùng luôn SID mới, không login chồng
+RELOGIN_GRACE = 2.0
+
+
+def sid_headers(cam: dict) -> dict:
+    """
+    Header Cookie chứa SID dùng chung của camera (rỗng nếu chưa login).
+    """
+    sid = cam.get("sid")
+    return {"Cookie": f"SID={sid}"} if sid else {}
+
+
+class AsyncCameraClient:
+    """
+    Client async dùng chung cho mọi camera trong SYSTEM_STATE["cameras"].
+    """
+    def __init__(self, cameras: dict, timeout: float = 2.0, connect_timeout: float = 1.0,
+                 max_per_camera: int = 2, max_connections: int = 32):
+        self.cameras = cameras
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=30.0,
+        )
+        self.max_per_camera = max_per_camera
+        self._client = None
+        self._sems = {}
+        self._login_locks = {}
+
+    def _http(self) -> httpx.AsyncClient:
+        # tạo lazy bên trong event loop của uvicorn
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                follow_redirects=False,
+            )
+        return self._client
+
+    def _sem(self, cam_id: str) -> asyncio.Semaphore:
+        sem = self._sems.get(cam_id)
+        if sem is None:
+            sem = self._sems[cam_id] = asyncio.Semaphore(self.max_per_camera)
+        return sem
+
+    def _login_lock(self, cam_id: str) -> asyncio.Lock:
+        lock = self._login_locks.get(cam_id)
+        if lock is None:
+            lock = self._login_locks[cam_id] = asyncio.Lock()
+        return lock
+
+    def _cam(self, cam_id: str) -> dict:
+        cam = self.cameras.get(cam_id)
+        if cam is None:
+            raise HTTPException(status_code=404, detail="camera not found")
+        return cam
+
+    async def login(self, cam_id: str, force: bool = False) -> bool:
+        """
+        Bản async của camera_login: POST /login, lưu SID vào cam["sid"].
+        """
+        cam = self.cameras.get(cam_id)
+        if cam is None:
+            return False
+
+        async with self._login_lock(cam_id):
+            since = time.time() - cam.get("last_login", 0)
+            if since < (RELOGIN_GRACE if force else LOGIN_TTL) and cam.get("sid"):
+                return True
+
+            data = {"user": cam["username"], "pass": cam["password"]}
+            try:
+                r = await self._http().post(cam["host"].strip() + "/login", data=data)
+            except Exception as e:
+                print(f"[AsyncCameraClient] login EXCEPTION {cam_id}: {e}")
+                return False
+
+            if r.status_code not in (200, 302):
+                print(f"[AsyncCameraClient] login FAIL {cam_id}: status={r.status_code}")
+                return False
+
+            sid = r.cookies.get("SID")
+            if sid:
+                cam["sid"] = sid
+            cam["last_login"] = time.time()
+            return True
+
+    async def get(self, cam_id: str, path: str, params=None, timeout: float = None) -> httpx.Response:
+        """
+        Bản async của camera_get: GET <host><path> với SID, 302 -> login lại, thử 1 lần nữa.
+        Raise HTTPException nếu camera không tồn tại / login lỗi / request lỗi.
+        """
+        cam = self._cam(cam_id)
+        if not await self.login(cam_id):
+            raise HTTPException(status_code=500, detail="camera login failed")
+
+        url = cam["host"].strip() + path
+        req_timeout = self.timeout if timeout is None else httpx.Timeout(timeout, connect=min(timeout, 1.0))
+
+        async with self._sem(cam_id):
+            try:
+                r = await self._http().get(url, params=params, headers=sid_headers(cam), timeout=req_timeout)
+                if r.status_code == 302:
+                    if not await self.login(cam_id, force=True):
+                        raise HTTPException(status_code=500, detail="camera re-login failed")
+                    r = await self._http().get(url, params=params, headers=sid_headers(cam), timeout=req_timeout)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"camera request failed: {e}")
+        return r
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
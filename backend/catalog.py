@@ -0,0 +1,187 @@
+# backend/catalog.py
+#
+# Danh mục video (ghi liên tục + clip sự kiện) trong SQLite thay cho glob + stat
+# toàn bộ thư mục mỗi lần gọi /api/recordings: recorder báo khi 1 đoạn ghi xong,
+# janitor báo khi xoá; truy vấn theo camera / khoảng thời gian qua index,
+# phân trang bằng cursor (start_ts, id) nên trang nào cũng nhanh như trang đầu.
+
+import glob
+import os
+import time
+
+import cv2
+
+from .media_index import media_id
+from .recorder import index_path, is_part, parse_segment_name
+
+VIDEO_EXTS = (".mp4", ".avi")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT NOT NULL UNIQUE,
+    cam_id      TEXT NOT NULL,
+    kind        TEXT NOT NULL,          -- recording | clip
+    start_ts    REAL NOT NULL,
+    duration_s  REAL,
+    size_bytes  INTEGER NOT NULL,
+    fps         REAL,
+    mode        TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_cam_ts ON recordings (cam_id, start_ts);
+CREATE INDEX IF NOT EXISTS idx_recordings_kind_ts ON recordings (kind, start_ts);
+"""
+
+
+def video_duration(path: str):
+    """
+    Độ dài video (giây): ưu tiên file index đi kèm (đọc dòng cuối),
+    không có thì hỏi OpenCV. Trả None nếu không xác định được.
+    """
+    idx = index_path(path)
+    if os.path.isfile(idx):
+        try:
+            with open(idx, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 256))
+                last = f.read().decode("utf-8", "ignore").strip().splitlines()[-1]
+            return float(last.split(",")[1])
+        except (IndexError, ValueError, OSError):
+            pass
+    cap = cv2.VideoCapture(path)
+    try:
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return frames / fps if frames > 0 and fps > 0 else None
+    finally:
+        cap.release()
+
+
+def _row(r: dict) -> dict:
+    r["ts"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["start_ts"]))
+    r["file"] = r["path"]
+    r["media_id"] = media_id(r["path"])
+    r["size_kb"] = int(r["size_bytes"] / 1024)
+    return r
+
+
+class RecordingCatalog:
+    """
+    dirs: {"recording": RECORD_DIR, "clip": CLIP_DIR} -- dùng cho rebuild / sync.
+    """
+    def __init__(self, db, dirs: dict):
+        self.db = db
+        self.dirs = dirs
+        self.db.script(SCHEMA)
+
+    def add(self, cam_id: str, path: str, kind: str = "recording", start_ts: float = None,
+            duration_s: float = None, fps: float = None, mode: str = None):
+        size = os.path.getsize(path)
+        if start_ts is None:
+            start_ts = parse_segment_name(path)[1] or os.path.getmtime(path)
+        self.db.execute(
+            "INSERT INTO recordings (path, cam_id, kind, start_ts, duration_s, size_bytes, fps, mode) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size_bytes = excluded.size_bytes, "
+            "duration_s = excluded.duration_s",
+            (path, cam_id, kind, start_ts, duration_s, size, fps, mode),
+        )
+
+    def on_finalized(self, kind: str):
+        """Callback cho RecorderThread.on_segment / EventClipManager.on_clip."""
+        def _cb(cam_id: str, path: str, meta: dict):
+            self.add(cam_id, path, kind=kind, start_ts=meta.get("start_ts"),
+                     duration_s=meta.get("duration_s"), fps=meta.get("fps"), mode=meta.get("mode"))
+        return _cb
+
+    def remove(self, path: str):
+        self.db.execute("DELETE FROM recordings WHERE path = ?", (path,))
+
+    def get(self, path: str):
+        rows = self.db.query("SELECT * FROM recordings WHERE path = ?", (path,))
+        return _row(rows[0]) if rows else None
+
+    def query(self, cam_id: str = None, kind: str = None, start: float = None, end: float = None,
+              limit: int = 50, cursor: str = None):
+        """
+        Mới nhất trước. cursor = "next_cursor" của trang trước ("<start_ts>:<id>").
+        Trả (items, next_cursor hoặc None nếu hết).
+        """
+        where, params = [], []
+        if cam_id:
+            where.append("cam_id = ?")
+            params.append(cam_id)
+        if kind:
+            where.append("kind = ?")
+            params.append(kind)
+        if start is not None:
+            where.append("start_ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("start_ts < ?")
+            params.append(end)
+        if cursor:
+            try:
+                c_ts, c_id = cursor.split(":")
+                c_ts, c_id = float(c_ts), int(c_id)
+            except ValueError:
+                raise ValueError("bad cursor")
+            where.append("(start_ts < ? OR (start_ts = ? AND id < ?))")
+            params += [c_ts, c_ts, c_id]
+        sql = "SELECT * FROM recordings"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY start_ts DESC, id DESC LIMIT ?"
+        rows = self.db.query(sql, params + [limit + 1])
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['start_ts']!r}:{rows[-1]['id']}" if more else None
+        return [_row(r) for r in rows], next_cursor
+
+    def paths(self):
+        return [r["path"] for r in self.db.query("SELECT path FROM recordings")]
+
+    def cameras(self):
+        return [r["cam_id"] for r in self.db.query("SELECT DISTINCT cam_id FROM recordings ORDER BY cam_id")]
+
+    def _scan(self):
+        for kind, d in self.dirs.items():
+            for ext in VIDEO_EXTS:
+                for f in glob.glob(os.path.join(d, "*" + ext)):
+                    if not is_part(f):
+                        yield kind, f
+
+    def sync(self, full: bool = False, on_add=None, on_remove=None) -> dict:
+        """
+        Đồng bộ với ổ đĩa: thêm file chưa có trong catalog, xoá dòng của file đã mất.
+        full=True: tính lại metadata mọi file (lệnh rebuild).
+        on_add(path) / on_remove(path): gọi cho từng file thêm / xoá (sau khi ghi DB).
+        """
+        known = {r["path"] for r in self.db.query("SELECT path FROM recordings")}
+        on_disk = set()
+        added = 0
+        for kind, f in self._scan():
+            on_disk.add(f)
+            if f in known and not full:
+                continue
+            try:
+                cam_id, start_ts = parse_segment_name(f)
+                self.add(cam_id, f, kind=kind, start_ts=start_ts, duration_s=video_duration(f))
+                added += 1
+                if on_add is not None:
+                    on_add(f)
+            except OSError as e:
+                print(f"[RecordingCatalog] skip {f}: {e}")
+        missing = known - on_disk
+        if missing:
+            self.db.executemany("DELETE FROM recordings WHERE path = ?", [(p,) for p in missing])
+            if on_remove is not None:
+                for p in missing:
+                    on_remove(p)
+        print(f"[RecordingCatalog] sync: +{added} -{len(missing)}")
+        return {"added": added, "removed": len(missing)}
+
+    def rebuild(self) -> dict:
+        """Xoá sạch catalog rồi quét lại toàn bộ thư mục."""
+        self.db.execute("DELETE FROM recordings")
+        return self.sync(full=True)
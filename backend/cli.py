@@ -0,0 +1,59 @@
+# backend/cli.py
+#
+# Lệnh tiện ích chạy ngoài server (dùng chung data/sss.db):
+#   python -m backend.cli recordings rebuild
+#   python -m backend.cli recordings list --cam cam1 --limit 20
+
+import argparse
+import time
+
+from .catalog import RecordingCatalog
+from .db import Database
+from .state import CLIP_DIR, DB_PATH, RECORD_DIR
+
+
+def _catalog() -> RecordingCatalog:
+    return RecordingCatalog(Database(DB_PATH), {"recording": RECORD_DIR, "clip": CLIP_DIR})
+
+
+def recordings_rebuild(args):
+    """Quét lại data/recordings + data/clips và dựng lại catalog từ đầu."""
+    t0 = time.time()
+    res = _catalog().rebuild()
+    print(f"rebuilt: {res['added']} files in {time.time() - t0:.1f}s")
+
+
+def recordings_list(args):
+    """In các video mới nhất."""
+    items, _ = _catalog().query(cam_id=args.cam_id, kind=args.kind, limit=args.limit)
+    for r in items:
+        dur = f"{r['duration_s']:.0f}s" if r["duration_s"] is not None else "?"
+        print(f"{r['ts']}  {r['cam_id']:<10} {r['kind']:<9} {dur:>6} {r['size_kb']:>8} KB  {r['path']}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m backend.cli",
+                                     description="Tiện ích quản trị Security Camera Dashboard.")
+    groups = parser.add_subparsers(dest="group", required=True)
+
+    recordings = groups.add_parser("recordings", help="Danh mục video đã ghi.")
+    commands = recordings.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("rebuild", help=recordings_rebuild.__doc__)
+    p.set_defaults(func=recordings_rebuild)
+
+    p = commands.add_parser("list", help=recordings_list.__doc__)
+    p.add_argument("--cam", dest="cam_id", default=None, help="Lọc theo camera")
+    p.add_argument("--kind", choices=["recording", "clip"], default=None)
+    p.add_argument("--limit", type=int, default=20, help="(mặc định: 20)")
+    p.set_defaults(func=recordings_list)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
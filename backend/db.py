@@ -0,0 +1,57 @@
+# backend/db.py
+#
+# SQLite dùng chung cho backend (catalog video, event, ...): 1 file data/sss.db,
+# chế độ WAL để luồng ghi (recorder, detect) không chặn request đọc của API.
+# sqlite3 có sẵn trong Python, không cần cài thêm gì trên Pi.
+
+import sqlite3
+import threading
+
+
+class Database:
+    """
+    1 connection dùng chung giữa các thread (khoá lại khi dùng).
+    Mỗi module tự tạo bảng của mình bằng script() lúc khởi tạo (CREATE ... IF NOT EXISTS).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL: mất điện chỉ mất vài giao dịch cuối, DB không hỏng
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("PRAGMA busy_timeout=5000")
+
+    def script(self, sql: str):
+        with self.lock:
+            self.conn.executescript(sql)
+
+    def execute(self, sql: str, params=()) -> int:
+        """Chạy 1 lệnh ghi, trả số dòng bị ảnh hưởng."""
+        with self.lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def insert(self, sql: str, params=()) -> int:
+        """Chạy 1 lệnh INSERT, trả id (rowid) của dòng mới."""
+        with self.lock:
+            return self.conn.execute(sql, params).lastrowid
+
+    def executemany(self, sql: str, rows):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(sql, rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def query(self, sql: str, params=()):
+        with self.lock:
+            return [dict(r) for r in self.conn.execute(sql, params).fetchall()]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,19 +1,33 @@
 # backend/detector.py
 
-import time
+import os
 import cv2
 import numpy as np
 
+PERSON_CLASS_ID = 0  # class "person" trong COCO
+
 class BaseDetector:
     """
     Interface chung để server.py dùng.
     Các class con phải có:
       - detect_person(frame_bgr) -> list[ {bbox:[x1,y1,x2,y2], conf:float} ]
       - annotate(frame_bgr, boxes) -> frame_bgr_annotated
+    input_hw: (h, w) nếu model chỉ nhận đúng 1 kích thước ảnh (frame nhỏ hơn bị letterbox
+    phóng lên lại, giảm size không bớt tải), None = nhận size bất kỳ.
     """
+    input_hw = None
+
     def detect_person(self, frame_bgr):
         raise NotImplementedError
 
+    def detect_person_batch(self, frames_bgr):
+        """
+        Detect trên nhiều frame (có thể từ nhiều camera) 1 lần.
+        Trả về list kết quả, cùng thứ tự với frames_bgr.
+        Mặc định chạy lần lượt từng frame; detector nào batch được thì override.
+        """
+        return [self.detect_person(f) for f in frames_bgr]
+
     def annotate(self, frame_bgr, boxes):
         # Vẽ khung và score lên ảnh để lưu log / hiển thị sự kiện
         out = frame_bgr.copy()
@@ -52,7 +66,7 @@ class YoloDetector(BaseDetector):
         from ultralytics import YOLO  # import ở đây để tránh ImportError khi module ko tồn tại
         self.model = YOLO(model_path)
         self.conf_thres = conf_thres
-        self.person_class_id = 0  # class "person" trong COCO
+        self.person_class_id = PERSON_CLASS_ID
 
         # In ra info để debug
         try:
@@ -65,43 +79,261 @@ class YoloDetector(BaseDetector):
     def detect_person(self, frame_bgr):
         """
         frame_bgr: numpy array BGR (OpenCV)
-        YOLO muốn RGB.
+        Với numpy array, ultralytics nhận thẳng BGR (tự đảo kênh bên trong).
         Trả list box [{'bbox':[x1,y1,x2,y2], 'conf':float}, ...] chỉ cho class 'person'.
         """
-        img_rgb = frame_bgr[..., ::-1]
-
-        # chạy model
-        t0 = time.time()
-        results = self.model.predict(
-            img_rgb,
-            classes=[self.person_class_id],  # chỉ người
-            conf=self.conf_thres,
-            verbose=False
-        )
-        infer_time = (time.time() - t0) * 1000.0  # ms
-        # bạn có thể in ra infer_time để đo tốc độ
+        return self.detect_person_batch([frame_bgr])[0]
+
+    def detect_person_batch(self, frames_bgr):
+        """
+        Chạy 1 lần model.predict cho cả list frame (batch) -> list kết quả theo thứ tự.
+        Trên CPU, 1 lần predict N ảnh nhanh hơn N lần predict 1 ảnh.
+        Frame đã letterbox sẵn (backend/preprocess.py) được gom theo kích thước và
+        predict với imgsz đúng bằng kích thước đó -> ultralytics không resize lại.
+        """
+        if not frames_bgr:
+            return []
 
+        groups = {}
+        for i, f in enumerate(frames_bgr):
+            groups.setdefault(f.shape[:2], []).append(i)
+
+        results = [None] * len(frames_bgr)
+        for (h, w), idxs in groups.items():
+            kwargs = {}
+            if h == w and h % 32 == 0:
+                kwargs["imgsz"] = h
+            preds = self.model.predict(
+                [np.ascontiguousarray(frames_bgr[i]) for i in idxs],
+                classes=[self.person_class_id],  # chỉ người
+                conf=self.conf_thres,
+                verbose=False,
+                **kwargs
+            )
+            for i, r in zip(idxs, preds):
+                results[i] = self._boxes_from_result(r)
+
+        return results
+
+    def _boxes_from_result(self, r):
         boxes_out = []
-        # results là list, mỗi phần tử là 1 frame
-        for r in results:
-            # r.boxes là tensor kết quả cho frame này
-            for b in r.boxes:
-                # xyxy shape: [1,4]
-                x1, y1, x2, y2 = b.xyxy[0].tolist()
-                conf = float(b.conf[0].item())
-                boxes_out.append({
-                    "bbox": [int(x1), int(y1), int(x2), int(y2)],
-                    "conf": conf
-                })
+        # r.boxes là tensor kết quả cho frame này
+        for b in r.boxes:
+            # xyxy shape: [1,4]
+            x1, y1, x2, y2 = b.xyxy[0].tolist()
+            conf = float(b.conf[0].item())
+            boxes_out.append({
+                "bbox": [int(x1), int(y1), int(x2), int(y2)],
+                "conf": conf
+            })
         return boxes_out
 
 
-def build_detector():
+# ============================================================
+# Backend nhẹ cho Pi: chạy model YOLOv8 đã export ONNX, không cần torch
+# ============================================================
+
+def _stride_hw(frame_shape):
+    """Model dynamic H/W: làm tròn size frame lên bội số 32 (stride lớn nhất của YOLOv8)."""
+    h, w = frame_shape[:2]
+    return int(np.ceil(h / 32.0)) * 32, int(np.ceil(w / 32.0)) * 32
+
+
+def _letterbox(frame_bgr, size_hw):
+    """
+    Đưa frame về đúng kích thước input của model (giữ tỉ lệ, pad 114).
+    Frame đã letterbox sẵn đúng size (backend/preprocess.py) thì trả nguyên.
+    Trả (img, scale, (pad_x, pad_y)).
+    """
+    h, w = frame_bgr.shape[:2]
+    th, tw = size_hw
+    if (h, w) == (th, tw):
+        return frame_bgr, 1.0, (0, 0)
+    r = min(th / float(h), tw / float(w))
+    nw, nh = int(round(w * r)), int(round(h * r))
+    left, top = (tw - nw) // 2, (th - nh) // 2
+    out = np.full((th, tw, 3), 114, dtype=np.uint8)
+    out[top:top + nh, left:left + nw] = cv2.resize(frame_bgr, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return out, r, (left, top)
+
+
+def _yolov8_person_boxes(pred, frame_shape, scale, pad, conf_thres, iou_thres,
+                         class_id=PERSON_CLASS_ID):
+    """
+    Hậu xử lý output YOLOv8 (1 ảnh): pred dạng (4 + num_classes, N) gồm cx, cy, w, h
+    + điểm từng class (YOLOv8 không có objectness). Giữ box class person, NMS,
+    đổi toạ độ về frame gốc.
+    """
+    pred = np.asarray(pred, dtype=np.float32)
+    if pred.shape[0] > pred.shape[1]:
+        pred = pred.T  # vài bản export trả (N, 4 + num_classes)
+
+    cls_scores = pred[4:]
+    if cls_scores.shape[0] > 1:
+        best = cls_scores.argmax(axis=0)
+        scores = cls_scores[class_id]
+        keep = (best == class_id) & (scores >= conf_thres)
+    else:
+        scores = cls_scores[0]  # model chỉ có class person
+        keep = scores >= conf_thres
+    if not keep.any():
+        return []
+
+    cx, cy, bw, bh = pred[0, keep], pred[1, keep], pred[2, keep], pred[3, keep]
+    scores = scores[keep]
+    x1 = (cx - bw / 2 - pad[0]) / scale
+    y1 = (cy - bh / 2 - pad[1]) / scale
+    rects = np.stack([x1, y1, bw / scale, bh / scale], axis=1)
+
+    idxs = cv2.dnn.NMSBoxes(rects.tolist(), scores.tolist(), conf_thres, iou_thres)
+    h, w = frame_shape[:2]
+    boxes_out = []
+    for i in np.array(idxs).flatten():
+        x, y, rw, rh = rects[i]
+        boxes_out.append({
+            "bbox": [int(max(0, x)), int(max(0, y)), int(min(w - 1, x + rw)), int(min(h - 1, y + rh))],
+            "conf": float(scores[i]),
+        })
+    return boxes_out
+
+
+class OnnxDetector(BaseDetector):
+    """
+    YOLOv8 (export ONNX) chạy bằng ONNX Runtime.
+    - model fp16 (input float16) hoặc int8 (quantize, input vẫn float32) đều dùng được,
+    - model export dynamic batch thì cả batch chạy 1 lần, batch cố định = 1 thì chạy lần lượt.
+    """
+    def __init__(self, model_path="yolov8n.onnx", conf_thres=0.6, iou_thres=0.45, threads=0):
+        import onnxruntime as ort  # import ở đây để tránh ImportError khi không cài
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(model_path, sess_options=opts,
+                                            providers=ort.get_available_providers())
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.input_dtype = np.float16 if "float16" in inp.type else np.float32
+        n, _, h, w = inp.shape
+        self.dynamic_batch = not isinstance(n, int)
+        # input H/W cố định thì letterbox về đúng size đó, dynamic thì dùng size frame
+        self.input_hw = (h, w) if isinstance(h, int) and isinstance(w, int) else None
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+
+        print(f"[OnnxDetector] Loaded {model_path} (conf={conf_thres}, input={inp.shape} "
+              f"{inp.type}) on {self.session.get_providers()[0]}")
+
+    def _prepare(self, frame_bgr):
+        return _letterbox(frame_bgr, self.input_hw or _stride_hw(frame_bgr.shape))
+
+    def _run(self, imgs):
+        blob = cv2.dnn.blobFromImages(imgs, 1.0 / 255.0, swapRB=True)
+        if self.input_dtype != np.float32:
+            blob = blob.astype(self.input_dtype)
+        return self.session.run(None, {self.input_name: blob})[0]
+
+    def detect_person(self, frame_bgr):
+        return self.detect_person_batch([frame_bgr])[0]
+
+    def detect_person_batch(self, frames_bgr):
+        if not frames_bgr:
+            return []
+        prepped = [self._prepare(f) for f in frames_bgr]
+
+        if self.dynamic_batch and len({p[0].shape for p in prepped}) == 1:
+            preds = self._run([p[0] for p in prepped])
+        else:
+            preds = [self._run([p[0]])[0] for p in prepped]
+
+        return [
+            _yolov8_person_boxes(pred, f.shape, scale, pad, self.conf_thres, self.iou_thres)
+            for pred, f, (_, scale, pad) in zip(preds, frames_bgr, prepped)
+        ]
+
+
+class OpenCVDnnDetector(BaseDetector):
+    """
+    YOLOv8 (export ONNX) chạy bằng cv2.dnn: chỉ cần opencv-python, không thêm thư viện.
+    precision="fp16" dùng target CPU_FP16 nếu bản OpenCV hỗ trợ.
+    Model export dynamic=True thì chạy đúng size frame nhận được (ảnh đã thu nhỏ bởi
+    Preprocessor / AdaptiveController); model size cố định thì letterbox về input_size.
     """
-    Tự động chọn YOLO thật nếu có ultralytics + torch OK.
+    def __init__(self, model_path="yolov8n.onnx", conf_thres=0.6, iou_thres=0.45,
+                 input_size=640, precision="fp32", threads=0):
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        target = cv2.dnn.DNN_TARGET_CPU
+        if precision == "fp16" and hasattr(cv2.dnn, "DNN_TARGET_CPU_FP16"):
+            target = cv2.dnn.DNN_TARGET_CPU_FP16
+        self.net.setPreferableTarget(target)
+        if threads:
+            cv2.setNumThreads(int(threads))
+        self.input_hw = None if self._accepts_any_size(input_size) else (input_size, input_size)
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        print(f"[OpenCVDnnDetector] Loaded {model_path} (conf={conf_thres}, "
+              f"input={self.input_hw or 'dynamic'}, {precision})")
+
+    def _accepts_any_size(self, input_size: int) -> bool:
+        """Thử 1 lần lúc load: model có chạy được ở size khác input_size không."""
+        size = max(32, input_size // 64 * 32)
+        try:
+            self.net.setInput(np.zeros((1, 3, size, size), dtype=np.float32))
+            out = self.net.forward()
+        except cv2.error:
+            return False
+        # YOLOv8: số anchor = tổng (size / stride)^2 với stride 8, 16, 32
+        return out.shape[-1] == sum((size // s) ** 2 for s in (8, 16, 32))
+
+    def detect_person(self, frame_bgr):
+        img, scale, pad = _letterbox(frame_bgr, self.input_hw or _stride_hw(frame_bgr.shape))
+        self.net.setInput(cv2.dnn.blobFromImage(img, 1.0 / 255.0, swapRB=True))
+        pred = self.net.forward()[0]
+        return _yolov8_person_boxes(pred, frame_bgr.shape, scale, pad, self.conf_thres, self.iou_thres)
+
+
+def resolve_model_path(model_path=None, precision="fp32"):
+    """
+    Không chỉ định SSS_MODEL_PATH -> yolov8n.onnx / yolov8n_fp16.onnx / yolov8n_int8.onnx
+    theo precision.
+    """
+    if model_path:
+        return model_path
+    suffix = {"fp16": "_fp16", "int8": "_int8"}.get(precision, "")
+    return f"yolov8n{suffix}.onnx"
+
+
+def build_detector(backend="auto", model_path=None, precision="fp32",
+                   conf_thres=0.6, threads=0):
+    """
+    Chọn detector theo backend (SSS_DETECTOR):
+      - "ultralytics": YOLOv8n qua ultralytics + torch,
+      - "onnx":        ONNX Runtime (không cần torch),
+      - "opencv":      cv2.dnn (chỉ cần opencv),
+      - "mock":        không detect,
+      - "auto":        có file .onnx thì ONNX Runtime -> cv2.dnn, không thì ultralytics.
     Nếu lỗi import / lỗi GPU / lỗi kiến trúc (Pi không cài được torch),
     dùng MockDetector để hệ thống không sập.
     """
+    onnx_path = resolve_model_path(model_path, precision)
+
+    if backend == "mock":
+        return MockDetector()
+
+    if backend in ("onnx", "opencv") or (backend == "auto" and os.path.isfile(onnx_path)):
+        if backend in ("onnx", "auto"):
+            try:
+                return OnnxDetector(onnx_path, conf_thres=conf_thres, threads=threads)
+            except Exception as e:
+                print(f"[build_detector] ONNX Runtime unavailable ({e})")
+        try:
+            return OpenCVDnnDetector(onnx_path, conf_thres=conf_thres, precision=precision, threads=threads)
+        except Exception as e:
+            print(f"[build_detector] cv2.dnn init failed, fallback to MockDetector ({e})")
+            return MockDetector()
+
     try:
         # thử import ultralytics trước
         import ultralytics  # noqa: F401
@@ -113,7 +345,8 @@ def build_detector():
 
     # Nếu import ok thì dùng YOLOv8n
     try:
-        return YoloDetector(model_path="yolov8n.pt", conf_thres=0.6)
+        pt_path = model_path if model_path and model_path.endswith(".pt") else "yolov8n.pt"
+        return YoloDetector(model_path=pt_path, conf_thres=conf_thres)
     except Exception as e:
         # nếu model load lỗi thì vẫn fallback
         print(f"[build_detector] YOLO init failed, fallback to MockDetector ({e})")
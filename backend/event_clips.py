@@ -0,0 +1,262 @@
+# backend/event_clips.py
+#
+# Ghi clip theo sự kiện thay cho ghi 24/7: mỗi camera bật "event_record" giữ
+# vài giây JPEG gần nhất trong RAM (pre-roll, ~30KB/frame, không decode),
+# khi có người -> ghi pre-roll + post-roll ra 1 clip gắn với event.
+# Người còn trong khung hình (event mới tới khi clip đang ghi) thì clip được nối dài,
+# tối đa max_clip_s giây.
+
+import os
+import threading
+import time
+from collections import deque
+
+from .recorder import (FrameIndex, file_ext, finalize_part, index_path, open_writer, part_path,
+                       unique_segment_path)
+
+
+class EventClip:
+    """
+    1 clip đang ghi. Khung thời gian tính theo capture ts (pkt.ts) của frame:
+    frame thứ n ứng với start_wall + n/fps, slot trống được lấp bằng frame trước.
+    """
+    def __init__(self, cam_id: str, out_dir: str, preroll, trigger_ts: float,
+                 fps: float, mode: str, postroll_s: float, max_clip_s: float):
+        self.cam_id = cam_id
+        self.fps = fps
+        self.mode = mode
+        self.preroll = list(preroll)
+        self.start_wall = self.preroll[0].ts if self.preroll else trigger_ts
+        self.postroll_s = postroll_s
+        self.end_ts = trigger_ts + postroll_s
+        self.max_end_ts = self.start_wall + max_clip_s
+        self.path = unique_segment_path(out_dir, cam_id, self.start_wall, file_ext(mode))
+        self.triggers = 1
+
+        self.writer = None
+        self.index = None
+        self.frames = 0
+        self._last = None
+
+    def extend(self, trigger_ts: float):
+        self.end_ts = min(self.max_end_ts, max(self.end_ts, trigger_ts + self.postroll_s))
+        self.triggers += 1
+
+    def _open(self):
+        self.writer = open_writer(self.mode, part_path(self.path), self.fps)
+        self.writer.start_wall = self.start_wall
+        self.index = FrameIndex(index_path(self.path))
+
+    def feed(self, pkt):
+        if pkt.ts > self.end_ts:
+            return
+        if self.writer is None:
+            self._open()
+        slot = int((pkt.ts - self.start_wall) * self.fps)
+        while self._last is not None and self.frames < slot:
+            self.writer.write_packet(self._last)
+            self.frames += 1
+        if self.frames > slot:
+            return  # camera nhanh hơn fps -> bỏ frame ở giữa
+        self.index.add(self.frames, self.frames / float(self.fps), pkt)
+        self.writer.write_packet(pkt)
+        self.frames += 1
+        self._last = pkt
+
+    def close(self) -> bool:
+        """Đóng + đổi tên .part -> tên thật. Trả False nếu không ghi được frame nào."""
+        if self.writer is None:
+            return False
+        self.writer.close()
+        self.index.close()
+        return finalize_part(self.path, getattr(self.writer, "failed", False))
+
+
+class PrerollBuffer(threading.Thread):
+    """
+    Luồng của 1 camera: đọc frame từ FrameHub (giữ ingest luôn chạy), lấy mẫu
+    còn `fps` frame/giây vào ring preroll_s giây, và ghi clip khi đang có sự kiện.
+    """
+    def __init__(self, cam_id: str, hub, out_dir: str, fps: float = 5.0, preroll_s: float = 10.0,
+                 postroll_s: float = 10.0, max_clip_s: float = 120.0, mode: str = "opencv",
+                 on_clip=None):
+        super().__init__(daemon=True, name=f"preroll-{cam_id}")
+        self.cam_id = cam_id
+        self.hub = hub
+        self.out_dir = out_dir
+        self.fps = fps
+        self.preroll_s = preroll_s
+        self.postroll_s = postroll_s
+        self.max_clip_s = max_clip_s
+        self.mode = mode
+        self.on_clip = on_clip
+        self.running = True
+
+        self.ring = deque()
+        self.clip = None
+        self.clips = 0
+        self.lock = threading.Lock()
+
+    def _push(self, pkt):
+        with self.lock:
+            if self.ring and pkt.ts - self.ring[-1].ts < 0.9 / self.fps:
+                return False
+            self.ring.append(pkt)
+            while self.ring and pkt.ts - self.ring[0].ts > self.preroll_s:
+                self.ring.popleft()
+            return True
+
+    def trigger(self, ts: float = None) -> str:
+        """Bắt đầu (hoặc nối dài) clip, trả đường dẫn clip (file có sau khi ghi xong)."""
+        ts = ts or time.time()
+        with self.lock:
+            if self.clip is not None:
+                self.clip.extend(ts)
+                return self.clip.path
+            preroll = [p for p in self.ring if p.ts >= ts - self.preroll_s]
+            self.clip = EventClip(self.cam_id, self.out_dir, preroll, ts, self.fps, self.mode,
+                                  self.postroll_s, self.max_clip_s)
+            return self.clip.path
+
+    def _finish(self, clip):
+        with self.lock:
+            self.clip = None
+        try:
+            ok = clip.close()
+        except Exception as e:
+            print(f"[PrerollBuffer] close error {self.cam_id}: {e}")
+            return
+        if not ok:
+            return
+        self.clips += 1
+        print(f"[PrerollBuffer] {self.cam_id} clip {os.path.basename(clip.path)} "
+              f"({clip.frames / float(self.fps):.1f}s, {clip.triggers} event)")
+        if self.on_clip is not None:
+            try:
+                self.on_clip(self.cam_id, clip.path, {
+                    "start_ts": clip.start_wall,
+                    "duration_s": clip.frames / float(self.fps),
+                    "frames": clip.frames,
+                    "fps": self.fps,
+                    "mode": self.mode,
+                    "triggers": clip.triggers,
+                })
+            except Exception as e:
+                print(f"[PrerollBuffer] on_clip error {self.cam_id}: {e}")
+
+    def _service_clip(self, pkt):
+        clip = self.clip
+        if clip is None:
+            return
+        try:
+            # pre-roll ghi trong luồng này, không chặn callback detect
+            while clip.preroll:
+                clip.feed(clip.preroll.pop(0))
+            if pkt is not None:
+                clip.feed(pkt)
+        except Exception as e:
+            print(f"[PrerollBuffer] write error {self.cam_id}: {e}")
+            self._finish(clip)
+            return
+        # hết post-roll (hoặc camera mất hình quá 2s sau hạn) -> đóng clip
+        last_ts = pkt.ts if pkt is not None else 0.0
+        if last_ts > clip.end_ts or time.time() > clip.end_ts + 2.0:
+            self._finish(clip)
+
+    def run(self):
+        last_seq = 0
+        while self.running:
+            pkt = self.hub.wait_next(self.cam_id, last_seq, timeout=1.0)
+            if pkt is not None:
+                last_seq = pkt.seq
+                if not self._push(pkt):
+                    pkt = None
+            self._service_clip(pkt)
+        if self.clip is not None:
+            self._finish(self.clip)
+
+    def status(self) -> dict:
+        with self.lock:
+            clip = self.clip
+            return {
+                "alive": self.is_alive(),
+                "buffered_s": round(self.ring[-1].ts - self.ring[0].ts, 1) if self.ring else 0.0,
+                "buffered_kb": int(sum(len(p.jpeg) for p in self.ring) / 1024),
+                "recording": clip.path if clip is not None else None,
+                "clips": self.clips,
+            }
+
+
+class EventClipManager:
+    """
+    Giữ PrerollBuffer cho các camera có cam["event_record"] = True.
+    sync() sau khi đổi cấu hình; trigger(cam_id, ts) khi có sự kiện.
+    """
+    def __init__(self, cameras: dict, hub, out_dir: str, fps: float = 5.0,
+                 preroll_s: float = 10.0, postroll_s: float = 10.0, max_clip_s: float = 120.0,
+                 mode: str = "opencv", on_clip=None):
+        self.cameras = cameras
+        self.hub = hub
+        self.out_dir = out_dir
+        self.fps = fps
+        self.preroll_s = preroll_s
+        self.postroll_s = postroll_s
+        self.max_clip_s = max_clip_s
+        self.mode = mode
+        self.on_clip = on_clip
+        self._buffers = {}
+        self._lock = threading.Lock()
+        os.makedirs(out_dir, exist_ok=True)
+
+    def sync(self):
+        with self._lock:
+            for cam_id, cam in list(self.cameras.items()):
+                buf = self._buffers.get(cam_id)
+                if cam.get("event_record") and (buf is None or not buf.is_alive()):
+                    buf = PrerollBuffer(cam_id, self.hub, self.out_dir, fps=self.fps,
+                                        preroll_s=self.preroll_s, postroll_s=self.postroll_s,
+                                        max_clip_s=self.max_clip_s, mode=self.mode,
+                                        on_clip=self.on_clip)
+                    self._buffers[cam_id] = buf
+                    buf.start()
+                elif not cam.get("event_record") and buf is not None:
+                    buf.running = False
+                    del self._buffers[cam_id]
+            for cam_id in [c for c in self._buffers if c not in self.cameras]:
+                self._buffers.pop(cam_id).running = False
+
+    def trigger(self, cam_id: str, ts: float = None):
+        with self._lock:
+            buf = self._buffers.get(cam_id)
+        if buf is None or not buf.is_alive():
+            return None
+        return buf.trigger(ts)
+
+    def forget(self, cam_id: str):
+        with self._lock:
+            buf = self._buffers.pop(cam_id, None)
+        if buf is not None:
+            buf.running = False
+            buf.join(timeout=5.0)
+
+    def stop_all(self):
+        with self._lock:
+            bufs = list(self._buffers.values())
+            self._buffers.clear()
+        for buf in bufs:
+            buf.running = False
+        for buf in bufs:
+            buf.join(timeout=5.0)
+
+    def status(self, cam_id: str):
+        with self._lock:
+            buf = self._buffers.get(cam_id)
+        out = {
+            "enabled": bool((self.cameras.get(cam_id) or {}).get("event_record")),
+            "preroll_s": self.preroll_s,
+            "postroll_s": self.postroll_s,
+            "max_clip_s": self.max_clip_s,
+        }
+        if buf is not None:
+            out.update(buf.status())
+        return out
@@ -0,0 +1,234 @@
+# backend/event_store.py
+#
+# Lưu event phát hiện người vào SQLite (data/sss.db, WAL) thay cho list trong RAM:
+# không mất khi restart, RAM không tăng theo thời gian chạy, /api/events trả từng trang.
+# Vài trăm event mới nhất giữ thêm trong RAM (hot cache) để trang đầu của
+# dashboard (gọi liên tục) không phải đụng tới DB.
+# EventWriter: ghi event ở luồng nền, callback detect chỉ xếp hàng rồi trả ngay.
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from .media_index import media_id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY,
+    ts          REAL NOT NULL,
+    cam_id      TEXT NOT NULL,
+    confidence  REAL NOT NULL,
+    reason      TEXT NOT NULL,
+    track_ids   TEXT NOT NULL DEFAULT '[]',
+    img_path    TEXT,
+    clip_path   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_cam_ts ON events (cam_id, ts);
+"""
+
+
+def _to_dict(r: dict) -> dict:
+    return {
+        "id": r["id"],
+        "ts": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["ts"])),
+        "epoch": r["ts"],
+        "cam_id": r["cam_id"],
+        "confidence": r["confidence"],
+        "reason": r["reason"],
+        "track_ids": json.loads(r["track_ids"]) if isinstance(r["track_ids"], str) else r["track_ids"],
+        "img_path": r["img_path"],
+        "clip_path": r["clip_path"],
+        # ID dùng cho /api/event_image, /api/event_thumb, /api/preview_video
+        "img_id": media_id(r["img_path"]),
+        "clip_id": media_id(r["clip_path"]),
+    }
+
+
+class EventStore:
+    """
+    add(...) -> event dict (có "id").
+    query(...) -> (events mới nhất trước, next_cursor hoặc None).
+    Cursor là id của event cuối trang: id tăng dần theo thời gian ghi nên
+    "id < cursor" đi tiếp trang sau bằng index, không OFFSET.
+    """
+    def __init__(self, db, hot_size: int = 200):
+        self.db = db
+        self.db.script(SCHEMA)
+        self.hot = deque(maxlen=hot_size)
+        self.lock = threading.Lock()
+        rows = self.db.query("SELECT * FROM events ORDER BY id DESC LIMIT ?", (hot_size,))
+        self.hot.extend(_to_dict(r) for r in rows)
+
+    def add(self, cam_id: str, confidence: float, reason: str = "new", track_ids=None,
+            img_path: str = None, clip_path: str = None, ts: float = None) -> dict:
+        ts = ts or time.time()
+        track_ids = list(track_ids or [])
+        with self.lock:
+            # giữ lock qua cả INSERT để thứ tự id và thứ tự trong hot cache luôn khớp
+            event_id = self.db.insert(
+                "INSERT INTO events (ts, cam_id, confidence, reason, track_ids, img_path, clip_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ts, cam_id, float(confidence), reason, json.dumps(track_ids), img_path, clip_path),
+            )
+            ev = _to_dict({
+                "id": event_id, "ts": ts, "cam_id": cam_id, "confidence": float(confidence),
+                "reason": reason, "track_ids": track_ids, "img_path": img_path, "clip_path": clip_path,
+            })
+            self.hot.appendleft(ev)
+        return ev
+
+    def _from_hot(self, cam_id, start, end, min_conf, limit, cursor):
+        """
+        Trả trang từ hot cache nếu chắc chắn đủ; None nếu phải hỏi DB.
+        Hot cache chứa đúng hot_size event mới nhất, liên tục theo id.
+        """
+        with self.lock:
+            hot = list(self.hot)
+        out = []
+        for ev in hot:
+            if cursor is not None and ev["id"] >= cursor:
+                continue
+            if cam_id and ev["cam_id"] != cam_id:
+                continue
+            if start is not None and ev["epoch"] < start:
+                continue
+            if end is not None and ev["epoch"] >= end:
+                continue
+            if min_conf is not None and ev["confidence"] < min_conf:
+                continue
+            out.append(ev)
+            if len(out) > limit:
+                return out
+        # hết cache: chỉ đúng nếu cache chứa toàn bộ bảng
+        if len(hot) < self.hot.maxlen:
+            return out
+        return None
+
+    def query(self, cam_id: str = None, start: float = None, end: float = None,
+              min_conf: float = None, limit: int = 50, cursor: int = None):
+        rows = self._from_hot(cam_id, start, end, min_conf, limit, cursor)
+        if rows is None:
+            where, params = [], []
+            if cam_id:
+                where.append("cam_id = ?")
+                params.append(cam_id)
+            if start is not None:
+                where.append("ts >= ?")
+                params.append(start)
+            if end is not None:
+                where.append("ts < ?")
+                params.append(end)
+            if min_conf is not None:
+                where.append("confidence >= ?")
+                params.append(min_conf)
+            if cursor is not None:
+                where.append("id < ?")
+                params.append(cursor)
+            sql = "SELECT * FROM events"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY id DESC LIMIT ?"
+            rows = [_to_dict(r) for r in self.db.query(sql, params + [limit + 1])]
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return rows, (rows[-1]["id"] if more else None)
+
+    def latest(self, n: int = 20):
+        with self.lock:
+            return list(self.hot)[:n]
+
+    def image_paths(self):
+        """Ảnh của mọi event đã lưu (để dựng MediaIndex lúc startup)."""
+        return [r["img_path"] for r in self.db.query("SELECT img_path FROM events WHERE img_path IS NOT NULL")]
+
+    def count(self) -> int:
+        return self.db.query("SELECT COUNT(*) AS n FROM events")[0]["n"]
+
+
+class EventWriter(threading.Thread):
+    """
+    Ghi event ở luồng nền: callback detect (chạy trên luồng nhận kết quả inference,
+    dùng chung cho mọi camera) không phải chờ SQLite / mở clip / còi.
+    - submit(cam_id, confidence, ...) -> xếp hàng, trả ngay (False nếu hàng đợi đầy),
+    - prepare(job) -> job: chạy ở luồng nền trước INSERT (vd mở clip, điền clip_path),
+    - on_added(event): chạy sau khi INSERT xong (vd còi, cập nhật index).
+    """
+    def __init__(self, store: EventStore, prepare=None, on_added=None, max_queue: int = 1024):
+        super().__init__(daemon=True, name="event-writer")
+        self.store = store
+        self.prepare = prepare
+        self.on_added = on_added
+        self.q = queue.Queue(maxsize=max_queue)
+        self.running = True
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def submit(self, cam_id: str, confidence: float, reason: str = "new", track_ids=None,
+               img_path: str = None, clip_path: str = None, ts: float = None) -> bool:
+        job = {"cam_id": cam_id, "confidence": confidence, "reason": reason,
+               "track_ids": list(track_ids or []), "img_path": img_path,
+               "clip_path": clip_path, "ts": ts or time.time()}
+        try:
+            self.q.put_nowait(job)
+        except queue.Full:
+            self.dropped += 1
+            print(f"[EventWriter] queue full, drop event {cam_id}")
+            return False
+        return True
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """Chờ ghi hết các event đang xếp hàng (True nếu xong trong timeout)."""
+        deadline = time.time() + timeout
+        with self.q.all_tasks_done:
+            while self.q.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.q.all_tasks_done.wait(remaining)
+        return True
+
+    def _handle(self, job: dict):
+        if self.prepare is not None:
+            try:
+                job = self.prepare(job)
+            except Exception as e:
+                print(f"[EventWriter] prepare error {job['cam_id']}: {e}")
+        ev = self.store.add(**job)
+        self.written += 1
+        if self.on_added is not None:
+            try:
+                self.on_added(ev)
+            except Exception as e:
+                print(f"[EventWriter] on_added error {job['cam_id']}: {e}")
+
+    def run(self):
+        while self.running or not self.q.empty():
+            try:
+                job = self.q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._handle(job)
+            except Exception as e:
+                self.errors += 1
+                print(f"[EventWriter] ghi event lỗi {job['cam_id']}: {e}")
+            finally:
+                self.q.task_done()
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng sau khi ghi nốt hàng đợi."""
+        self.running = False
+        if self.is_alive():
+            self.join(timeout=timeout)
+
+    def status(self) -> dict:
+        return {
+            "queue": self.q.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
@@ -0,0 +1,324 @@
+# backend/frame_hub.py
+#
+# Frame hub: mỗi camera chỉ có ĐÚNG 1 luồng ingest lấy ảnh từ ESP32-CAM,
+# các consumer (RecorderThread, /api/stream_frame, /api/detect_frame,
+# /api/detect_only_frame, ...) đều đọc frame mới nhất từ hub thay vì tự gọi
+# /capture. ESP32 chỉ có fb_count = 1 nên gọi song song chỉ làm chậm cả hệ thống.
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+# seq tăng dần trên toàn hub (kể cả khi luồng ingest bị tạo lại),
+# nên các cache theo seq (detect, motion) không bao giờ nhầm frame cũ/mới
+_SEQ = itertools.count(1)
+
+
+class FramePacket:
+    """
+    1 frame lấy từ camera:
+      - jpeg: bytes JPEG gốc camera trả về (dùng lại được, không cần encode lại)
+      - bgr(): decode sang numpy BGR khi có consumer cần pixel (lazy, cache lại)
+    LƯU Ý: array trả về từ bgr() được chia sẻ giữa các consumer,
+    muốn vẽ lên thì phải .copy() trước.
+    """
+    __slots__ = ("cam_id", "seq", "ts", "jpeg", "_bgr", "_lock")
+
+    def __init__(self, cam_id: str, seq: int, jpeg: bytes, ts: float = None):
+        self.cam_id = cam_id
+        self.seq = seq
+        self.ts = ts if ts is not None else time.time()
+        self.jpeg = jpeg
+        self._bgr = None
+        self._lock = threading.Lock()
+
+    def age(self) -> float:
+        return time.time() - self.ts
+
+    def bgr(self):
+        """
+        Decode JPEG -> BGR (chỉ decode 1 lần cho mọi consumer). Raise nếu lỗi.
+        """
+        if self._bgr is not None:
+            return self._bgr
+        with self._lock:
+            if self._bgr is None:
+                img_arr = np.frombuffer(self.jpeg, dtype=np.uint8)
+                frame = cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
+                if frame is None:
+                    raise RuntimeError("decode failed (frame is None)")
+                self._bgr = frame
+        return self._bgr
+
+
+def _set_done(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+class CameraIngest(threading.Thread):
+    """
+    Luồng ingest của 1 camera:
+      - ưu tiên giữ 1 kết nối MJPEG lâu dài (open_stream) nếu camera hỗ trợ,
+      - nếu stream không dùng được -> fallback gọi fetch_jpeg(cam_id) (/capture)
+        liên tục (tối đa max_fps), định kỳ thử lại stream,
+      - giữ vài frame gần nhất trong ring buffer,
+      - đánh thức các consumer đang chờ frame mới.
+    Tự dừng khi không còn ai đọc frame trong idle_timeout giây
+    (để không spam camera khi không có ai xem / ghi).
+    """
+    def __init__(self, cam_id: str, fetch_jpeg, open_stream=None, ring_size: int = 4,
+                 max_fps: float = 15.0, idle_timeout: float = 10.0,
+                 stream_retry: float = 30.0):
+        super().__init__(daemon=True, name=f"ingest-{cam_id}")
+        self.cam_id = cam_id
+        self.fetch_jpeg = fetch_jpeg
+        self.open_stream = open_stream
+        self.ring = deque(maxlen=ring_size)
+        self.min_interval = 1.0 / float(max_fps)
+        self.idle_timeout = idle_timeout
+        self.stream_retry = stream_retry
+        self.mode = None  # "mjpeg" | "capture"
+        self.running = True
+        self.last_access = time.time()
+        self.last_error = None
+        self.seq = 0
+        self.cond = threading.Condition()
+        self._async_waiters = set()  # asyncio.Future của các consumer async đang chờ frame
+
+    def touch(self):
+        self.last_access = time.time()
+
+    def latest(self):
+        with self.cond:
+            return self.ring[-1] if self.ring else None
+
+    def publish(self, jpeg: bytes, ts: float = None):
+        with self.cond:
+            self.seq = next(_SEQ)
+            pkt = FramePacket(self.cam_id, self.seq, jpeg, ts)
+            self.ring.append(pkt)
+            self.last_error = None
+            self.cond.notify_all()
+            self._wake_async()
+        return pkt
+
+    def _wake_async(self):
+        # gọi trong self.cond; mỗi waiter thuộc event loop của nó -> đánh thức qua call_soon_threadsafe
+        for fut in self._async_waiters:
+            try:
+                fut.get_loop().call_soon_threadsafe(_set_done, fut)
+            except RuntimeError:
+                pass  # event loop đã đóng
+        self._async_waiters.clear()
+
+    async def wait_next_async(self, after_seq: int, timeout: float):
+        """Như wait_next nhưng chờ bằng asyncio.Future, publish() đánh thức (không poll)."""
+        deadline = time.time() + timeout
+        while True:
+            with self.cond:
+                if self.ring and self.ring[-1].seq > after_seq:
+                    return self.ring[-1]
+                remaining = deadline - time.time()
+                if not self.running or remaining <= 0:
+                    return None
+                fut = asyncio.get_running_loop().create_future()
+                self._async_waiters.add(fut)
+            try:
+                await asyncio.wait_for(fut, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.cond:
+                    self._async_waiters.discard(fut)
+
+    def wait_next(self, after_seq: int, timeout: float):
+        """
+        Chờ tới khi có frame seq > after_seq (hoặc hết timeout / luồng dừng).
+        Trả về FramePacket mới nhất hoặc None.
+        """
+        with self.cond:
+            self.cond.wait_for(
+                lambda: (self.ring and self.ring[-1].seq > after_seq) or not self.running,
+                timeout=timeout
+            )
+            if self.ring and self.ring[-1].seq > after_seq:
+                return self.ring[-1]
+            return None
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+            self._wake_async()
+
+    def _idle(self) -> bool:
+        return time.time() - self.last_access > self.idle_timeout
+
+    def _run_stream(self) -> int:
+        """
+        Đọc frame từ kết nối MJPEG tới khi stream đứt / luồng dừng / hết consumer.
+        Trả về số frame đã nhận. Raise nếu không mở được stream.
+        """
+        frames = self.open_stream(self.cam_id)
+        if frames is None:
+            raise RuntimeError("stream disabled")
+
+        count = 0
+        self.mode = "mjpeg"
+        try:
+            for jpeg in frames:
+                self.publish(jpeg)
+                count += 1
+                if not self.running or self._idle():
+                    break
+        finally:
+            frames.close()
+        return count
+
+    def run(self):
+        backoff = 0.5
+        stream_retry_at = 0.0
+        while self.running:
+            if self._idle():
+                # không còn consumer -> nhả camera
+                break
+
+            if self.open_stream is not None and time.time() >= stream_retry_at:
+                try:
+                    got = self._run_stream()
+                    # stream đứt sau khi đã chạy được -> nối lại gần như ngay
+                    stream_retry_at = time.time() + (1.0 if got else self.stream_retry)
+                except Exception as e:
+                    self.last_error = str(getattr(e, "detail", e))
+                    print(f"[CameraIngest] {self.cam_id} stream unavailable, fallback /capture: {self.last_error}")
+                    stream_retry_at = time.time() + self.stream_retry
+                continue
+
+            self.mode = "capture"
+            t0 = time.time()
+            try:
+                jpeg = self.fetch_jpeg(self.cam_id)
+                self.publish(jpeg)
+                backoff = 0.5
+            except Exception as e:
+                self.last_error = str(getattr(e, "detail", e))
+                print(f"[CameraIngest] {self.cam_id} fetch error: {self.last_error}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 5.0)
+                continue
+
+            # giới hạn tốc độ poll camera
+            spent = time.time() - t0
+            if spent < self.min_interval:
+                time.sleep(self.min_interval - spent)
+
+        self.stop()
+
+
+class FrameHub:
+    """
+    Quản lý CameraIngest cho từng camera (khởi động lazy khi có consumer đầu tiên).
+    """
+    def __init__(self, fetch_jpeg, open_stream=None, ring_size: int = 4,
+                 max_fps: float = 15.0, idle_timeout: float = 10.0):
+        self.fetch_jpeg = fetch_jpeg
+        self.open_stream = open_stream
+        self.ring_size = ring_size
+        self.max_fps = max_fps
+        self.idle_timeout = idle_timeout
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def _worker(self, cam_id: str) -> CameraIngest:
+        with self._lock:
+            w = self._workers.get(cam_id)
+            if w is None or not w.is_alive() or not w.running:
+                w = CameraIngest(
+                    cam_id,
+                    self.fetch_jpeg,
+                    open_stream=self.open_stream,
+                    ring_size=self.ring_size,
+                    max_fps=self.max_fps,
+                    idle_timeout=self.idle_timeout,
+                )
+                self._workers[cam_id] = w
+                w.start()
+            w.touch()
+            return w
+
+    def get_latest(self, cam_id: str, max_age: float = 1.0, timeout: float = 2.0) -> FramePacket:
+        """
+        Lấy frame mới nhất của camera (không cũ hơn max_age giây).
+        Nếu chưa có frame đủ mới thì chờ tối đa timeout giây. Raise nếu không có.
+        """
+        w = self._worker(cam_id)
+        pkt = w.latest()
+        if pkt is not None and pkt.age() <= max_age:
+            return pkt
+
+        pkt = w.wait_next(pkt.seq if pkt else 0, timeout)
+        if pkt is None:
+            raise RuntimeError(f"no frame from camera ({w.last_error or 'timeout'})")
+        return pkt
+
+    def wait_next(self, cam_id: str, after_seq: int, timeout: float = 2.0):
+        """
+        Chờ frame có seq > after_seq (dùng cho consumer chạy liên tục).
+        Trả về FramePacket hoặc None nếu hết timeout.
+        """
+        w = self._worker(cam_id)
+        return w.wait_next(after_seq, timeout)
+
+    async def wait_next_async(self, cam_id: str, after_seq: int, timeout: float = 2.0):
+        """
+        Bản async của wait_next cho endpoint streaming (MJPEG / WebSocket):
+        không giữ thread nào trong lúc chờ, publish() đánh thức đúng lúc có frame mới.
+        """
+        w = self._worker(cam_id)
+        return await w.wait_next_async(after_seq, timeout)
+
+    def frame_age(self, cam_id: str):
+        """
+        Tuổi (giây) của frame mới nhất nếu camera đang được ingest, ngược lại None.
+        Không khởi động luồng ingest (dùng cho health monitor).
+        """
+        with self._lock:
+            w = self._workers.get(cam_id)
+        if w is None or not w.running:
+            return None
+        pkt = w.latest()
+        return pkt.age() if pkt else None
+
+    def stop(self, cam_id: str):
+        with self._lock:
+            w = self._workers.pop(cam_id, None)
+        if w is not None:
+            w.stop()
+
+    def stop_all(self):
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for w in workers:
+            w.stop()
+
+    def status(self):
+        out = {}
+        with self._lock:
+            for cam_id, w in self._workers.items():
+                pkt = w.latest()
+                out[cam_id] = {
+                    "running": w.is_alive() and w.running,
+                    "mode": w.mode,
+                    "seq": w.seq,
+                    "last_frame_age": round(pkt.age(), 3) if pkt else None,
+                    "last_error": w.last_error,
+                }
+        return out
@@ -0,0 +1,135 @@
+# backend/health.py
+#
+# Theo dõi online/offline của camera ở nền: probe /status song song cho mọi
+# camera theo chu kỳ, cache kết quả để /api/cameras trả lời ngay lập tức.
+# Camera offline liên tục thì giãn dần chu kỳ probe (exponential backoff).
+
+import asyncio
+import time
+
+
+class CameraHealthMonitor:
+    """
+    health[cam_id] = {
+        "online": bool,
+        "last_seen": float | None,   # lần cuối camera trả lời OK (epoch)
+        "latency_ms": float | None,  # độ trễ /status gần nhất
+        "last_check": float | None,
+        "fails": int,                # số lần fail liên tiếp
+        "next_probe": float,
+        "last_error": str | None,
+    }
+    """
+    def __init__(self, client, cameras: dict, interval: float = 5.0, timeout: float = 1.5,
+                 max_backoff: float = 120.0, recent_frame_age=None):
+        self.client = client
+        self.cameras = cameras
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        # callable(cam_id) -> tuổi frame mới nhất (giây) hoặc None;
+        # camera đang có frame mới thì chắc chắn online, khỏi gọi /status
+        self.recent_frame_age = recent_frame_age
+        self.health = {}
+        self._task = None
+
+    def _entry(self, cam_id: str) -> dict:
+        h = self.health.get(cam_id)
+        if h is None:
+            h = self.health[cam_id] = {
+                "online": False,
+                "last_seen": None,
+                "latency_ms": None,
+                "last_check": None,
+                "fails": 0,
+                "next_probe": 0.0,
+                "last_error": None,
+            }
+        return h
+
+    def _mark_online(self, h: dict, latency_ms):
+        now = time.time()
+        h["online"] = True
+        h["last_seen"] = now
+        h["last_check"] = now
+        h["latency_ms"] = latency_ms
+        h["fails"] = 0
+        h["last_error"] = None
+        h["next_probe"] = now + self.interval
+
+    async def probe(self, cam_id: str):
+        h = self._entry(cam_id)
+
+        if self.recent_frame_age is not None:
+            age = self.recent_frame_age(cam_id)
+            if age is not None and age < self.interval:
+                self._mark_online(h, h["latency_ms"])
+                return
+
+        t0 = time.time()
+        try:
+            r = await self.client.get(cam_id, "/status", timeout=self.timeout)
+            ok = r.status_code == 200
+            err = None if ok else f"status={r.status_code}"
+        except Exception as e:
+            ok = False
+            err = str(getattr(e, "detail", e))
+
+        if ok:
+            self._mark_online(h, round((time.time() - t0) * 1000.0, 1))
+            return
+
+        if h["online"] or h["fails"] == 0:
+            print(f"[CameraHealthMonitor] {cam_id} offline: {err}")
+        h["online"] = False
+        h["last_check"] = time.time()
+        h["last_error"] = err
+        h["fails"] += 1
+        # offline liên tục -> giãn chu kỳ: interval, 2x, 4x, ... tối đa max_backoff
+        delay = min(self.interval * (2 ** (h["fails"] - 1)), self.max_backoff)
+        h["next_probe"] = time.time() + delay
+
+    async def probe_due(self):
+        now = time.time()
+        due = [cid for cid in list(self.cameras.keys())
+               if self._entry(cid)["next_probe"] <= now]
+        if due:
+            await asyncio.gather(*(self.probe(cid) for cid in due))
+
+    async def run(self):
+        while True:
+            try:
+                await self.probe_due()
+            except Exception as e:
+                print(f"[CameraHealthMonitor] loop error: {e}")
+            await asyncio.sleep(1.0)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset(self, cam_id: str):
+        """
+        Camera mới thêm / vừa sửa -> probe lại ngay ở vòng kế tiếp.
+        """
+        self.health.pop(cam_id, None)
+
+    def get(self, cam_id: str) -> dict:
+        h = self._entry(cam_id)
+        return {
+            "online": h["online"],
+            "last_seen": h["last_seen"],
+            "latency_ms": h["latency_ms"],
+            "last_check": h["last_check"],
+            "fails": h["fails"],
+            "last_error": h["last_error"],
+        }
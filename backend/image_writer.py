@@ -0,0 +1,207 @@
+# backend/image_writer.py
+#
+# Ghi ảnh event xuống thẻ SD ở luồng nền thay vì cv2.imwrite ngay trong callback detect
+# (chặn luồng nhận kết quả inference vài chục ms mỗi ảnh):
+#   - submit() trả đường dẫn ngay, ảnh được ghi sau (gom theo lô),
+#   - mode "raw": ghi thẳng bytes JPEG camera gửi về (không decode / encode lại),
+#     mode "annotated": vẽ box rồi encode JPEG -- cũng làm ở luồng nền,
+#   - fsync: "always" (mỗi ảnh), "batch" (1 lần cho cả lô, mặc định), "never" (để OS tự flush).
+# Ghi ra file .tmp rồi os.replace -> không bao giờ có ảnh ghi dở.
+# Mỗi ảnh kèm 1 thumbnail nhỏ (thumbs/<tên>.jpg, ~10KB) cho trang Events.
+
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+THUMB_WIDTH = 240
+
+
+def thumb_path(img_path: str) -> str:
+    d, name = os.path.split(img_path)
+    return os.path.join(d, "thumbs", name)
+
+
+def make_thumbnail(jpeg: bytes = None, frame=None, width: int = THUMB_WIDTH, quality: int = 70) -> bytes:
+    """
+    Thumbnail JPEG rộng `width` px từ frame BGR, hoặc từ bytes JPEG
+    (decode ở 1/4 độ phân giải: libjpeg bỏ bớt hệ số DCT, nhanh hơn decode đủ nhiều lần).
+    """
+    if frame is None:
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_COLOR_4)
+        if frame is None:
+            raise RuntimeError("decode failed")
+        if frame.shape[1] < width:
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    h, w = frame.shape[:2]
+    if w > width:
+        frame = cv2.resize(frame, (width, max(1, int(h * width / w))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("imencode failed")
+    return buf.tobytes()
+
+
+def write_atomic(path: str, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class EventImageWriter(threading.Thread):
+    """
+    annotate(frame_bgr, boxes) -> frame mới (vd detector.annotate), dùng cho mode "annotated".
+    """
+    def __init__(self, out_dir: str, mode: str = "annotated", fsync: str = "batch", annotate=None,
+                 jpeg_quality: int = 85, max_queue: int = 256, batch_max: int = 16,
+                 batch_window: float = 0.2):
+        super().__init__(daemon=True, name="event-image-writer")
+        self.out_dir = out_dir
+        self.mode = mode
+        self.fsync = fsync
+        self.annotate = annotate
+        self.jpeg_quality = jpeg_quality
+        self.batch_max = batch_max
+        self.batch_window = batch_window
+        self.q = queue.Queue(maxsize=max_queue)
+        self.running = True
+
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._last_name = {}
+
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_batch_ms = 0.0
+        os.makedirs(os.path.join(out_dir, "thumbs"), exist_ok=True)
+
+    def _path_for(self, cam_id: str, ts: float) -> str:
+        base = f"{cam_id}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(ts))}_{int(ts * 1000) % 1000:03d}"
+        # 2 event cùng camera cùng mili-giây -> thêm hậu tố, không ghi đè ảnh cũ
+        n = self._last_name.get(cam_id, (None, 0))
+        n = (base, n[1] + 1) if n[0] == base else (base, 0)
+        self._last_name[cam_id] = n
+        suffix = f"_{n[1]}" if n[1] else ""
+        return os.path.join(self.out_dir, f"{base}{suffix}.jpg")
+
+    def submit(self, cam_id: str, pkt, boxes=None):
+        """
+        Xếp ảnh của frame pkt vào hàng đợi ghi. Trả đường dẫn (file có sau vài trăm ms),
+        hoặc None nếu hàng đợi đầy (thẻ SD quá chậm) -- event vẫn được ghi, chỉ thiếu ảnh.
+        """
+        with self._cond:
+            path = self._path_for(cam_id, pkt.ts)
+            try:
+                self.q.put_nowait((path, pkt, boxes))
+            except queue.Full:
+                self.dropped += 1
+                print(f"[EventImageWriter] queue full, drop image {cam_id}")
+                return None
+            self._pending.add(path)
+        return path
+
+    def wait_written(self, path: str, timeout: float = 2.0) -> bool:
+        """Chờ ảnh đang xếp hàng được ghi xong (dùng cho /api/event_image)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: path not in self._pending, timeout=timeout)
+
+    def _encode(self, pkt, boxes):
+        """-> (bytes ảnh, bytes thumbnail)"""
+        if self.mode == "raw" or self.annotate is None:
+            return pkt.jpeg, make_thumbnail(jpeg=pkt.jpeg)
+        frame = self.annotate(pkt.bgr(), boxes or [])
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise RuntimeError("imencode failed")
+        return buf.tobytes(), make_thumbnail(frame=frame)
+
+    def _write_batch(self, batch):
+        t0 = time.time()
+        opened = []
+        for path, pkt, boxes in batch:
+            tmp = path + ".tmp"
+            f = None
+            try:
+                data, thumb = self._encode(pkt, boxes)
+                # thumbnail không cần fsync: mất thì tạo lại được từ ảnh gốc
+                write_atomic(thumb_path(path), thumb)
+                f = open(tmp, "wb")
+                f.write(data)
+                if self.fsync == "always":
+                    f.flush()
+                    os.fsync(f.fileno())
+                opened.append((path, tmp, f))
+            except Exception as e:
+                self.errors += 1
+                print(f"[EventImageWriter] write error {path}: {e}")
+                if f is not None:
+                    f.close()
+
+        for path, tmp, f in opened:
+            try:
+                if self.fsync == "batch":
+                    f.flush()
+                    os.fsync(f.fileno())
+                f.close()
+                os.replace(tmp, path)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"[EventImageWriter] finalize error {path}: {e}")
+
+        if opened and self.fsync != "never" and hasattr(os, "O_DIRECTORY"):
+            # fsync thư mục 1 lần để các lần rename ở trên cũng bền
+            try:
+                fd = os.open(self.out_dir, os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+        self.last_batch_ms = (time.time() - t0) * 1000.0
+        with self._cond:
+            for path, _, _ in batch:
+                self._pending.discard(path)
+            self._cond.notify_all()
+
+    def run(self):
+        while self.running or not self.q.empty():
+            try:
+                item = self.q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [item]
+            deadline = time.time() + self.batch_window
+            while len(batch) < self.batch_max:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng sau khi ghi nốt hàng đợi."""
+        self.running = False
+        if self.is_alive():
+            self.join(timeout=timeout)
+
+    def status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "fsync": self.fsync,
+            "queue": self.q.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_batch_ms": round(self.last_batch_ms, 1),
+        }
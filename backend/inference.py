@@ -0,0 +1,520 @@
+# backend/inference.py
+#
+# Dịch vụ inference dùng chung: gom frame từ nhiều camera trong 1 cửa sổ thời gian
+# ngắn rồi chạy 1 lần detector.detect_person_batch, trả kết quả về cho từng request.
+# Nếu có preprocessor (backend/preprocess.py): frame được cắt ROI + letterbox vào
+# buffer cấp phát sẵn ngay trước khi detect, box được map lại về toạ độ frame gốc.
+#
+# Detector được load ở nền sau khi server start (start()), kèm 1 lần warm-up trên
+# frame giả; trong lúc đó submit() báo DetectorWarming thay vì chặn request.
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# frame giả cho lần warm-up (màu padding letterbox, đúng kích thước mặc định)
+WARMUP_SHAPE = (640, 640, 3)
+# worker process chết -> spawn lại sau 1, 2, 4, ... giây (tối đa 60s)
+RESPAWN_MAX_DELAY = 60.0
+
+
+class DetectorWarming(RuntimeError):
+    """
+    Detector chưa sẵn sàng (đang load model / warm-up). Endpoint bắt lỗi này
+    để trả note "detector warming" thay vì chờ.
+    """
+
+
+def _fail(futs, err):
+    """set_exception cho các future chưa xong (bỏ qua future đã có kết quả)."""
+    for fut in futs:
+        try:
+            fut.set_exception(err)
+        except InvalidStateError:
+            pass
+
+
+def _warm_up(det):
+    """
+    Chạy 1 lần detect trên frame giả để model cấp phát bộ nhớ / chọn kernel
+    trước khi frame thật tới. Trả thời gian warm-up (ms).
+    """
+    t0 = time.time()
+    det.detect_person_batch([np.full(WARMUP_SHAPE, 114, dtype=np.uint8)])
+    return round((time.time() - t0) * 1000.0, 1)
+
+
+class BatchInferenceService:
+    """
+    - start() -> load detector ở nền (detector_factory()) + warm-up, rồi chạy batch.
+    - submit(cam_id, frame) -> Future (kết quả: list box như detect_person);
+      detector chưa sẵn sàng -> raise DetectorWarming.
+    - detect(cam_id, frame) -> chờ Future, trả list box.
+    Luồng nền lấy request đầu tiên trong hàng đợi, chờ thêm tối đa window_ms
+    để gom tới max_batch frame, rồi chạy 1 batch.
+    """
+    def __init__(self, detector_factory, max_batch: int = 4, window_ms: float = 20.0,
+                 preprocessor=None):
+        self.detector_factory = detector_factory
+        self.detector = None
+        self.preprocessor = preprocessor
+        self._buffers = {}  # (vị trí trong batch, size) -> buffer letterbox dùng lại
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self.q = queue.Queue()
+        self.running = True
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        # "stopped" -> "loading" -> "warming" -> "ready" (hoặc "error")
+        self.state = "stopped"
+        self.load_s = None
+        self.warmup_ms = None
+        self.error = None
+        self.th = threading.Thread(target=self._loop, daemon=True, name="inference-batcher")
+
+    def start(self):
+        if self.state == "stopped":
+            self.state = "loading"
+            self.th.start()
+
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def readiness(self) -> dict:
+        return {
+            "state": self.state,
+            "detector": type(self.detector).__name__ if self.detector is not None else None,
+            "load_s": self.load_s,
+            "warmup_ms": self.warmup_ms,
+            "input_hw": getattr(self.detector, "input_hw", None),
+            "error": self.error,
+        }
+
+    def submit(self, cam_id: str, frame_bgr) -> Future:
+        if self.state != "ready":
+            raise DetectorWarming(f"detector {self.state}")
+        fut = Future()
+        self.q.put((cam_id, frame_bgr, fut))
+        return fut
+
+    def detect(self, cam_id: str, frame_bgr, timeout: float = 10.0):
+        return self.submit(cam_id, frame_bgr).result(timeout=timeout)
+
+    def queue_depth(self) -> int:
+        return self.q.qsize()
+
+    def stop(self):
+        self.running = False
+        self.q.put(None)
+
+    def _collect(self):
+        first = self.q.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.time() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                item = self.q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _buffer(self, slot: int, plan):
+        key = (slot, plan.size)
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = self._buffers[key] = self.preprocessor.alloc(plan)
+        return buf
+
+    def _load(self):
+        t0 = time.time()
+        try:
+            self.detector = self.detector_factory()
+            self.load_s = round(time.time() - t0, 2)
+            self.state = "warming"
+            self.warmup_ms = _warm_up(self.detector)
+        except Exception as e:
+            self.error = str(e)
+            self.state = "error"
+            print(f"[BatchInferenceService] detector load failed: {e}")
+            return False
+        self.state = "ready"
+        print(f"[BatchInferenceService] {type(self.detector).__name__} ready "
+              f"(load {self.load_s}s, warm-up {self.warmup_ms}ms)")
+        return True
+
+    def _loop(self):
+        if not self._load():
+            return
+        while self.running:
+            batch = self._collect()
+            if not batch:
+                continue
+
+            t0 = time.time()
+            try:
+                if self.preprocessor is None:
+                    results = self.detector.detect_person_batch([item[1] for item in batch])
+                else:
+                    # buffer theo vị trí trong batch: chỉ thread này dùng,
+                    # batch trước đã xong nên ghi đè an toàn
+                    plans, frames = [], []
+                    for slot, (cam_id, frame, _) in enumerate(batch):
+                        plan = self.preprocessor.plan(cam_id, frame.shape)
+                        frames.append(self.preprocessor.fill(frame, plan, self._buffer(slot, plan)))
+                        plans.append(plan)
+                    results = self.detector.detect_person_batch(frames)
+                    results = [self.preprocessor.restore(boxes, plan)
+                               for boxes, plan in zip(results, plans)]
+            except Exception as e:
+                print(f"[BatchInferenceService] batch error: {e}")
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.last_batch_ms = (time.time() - t0) * 1000.0
+            self.last_batch_size = len(batch)
+
+            for (_, _, fut), boxes in zip(batch, results):
+                fut.set_result(boxes)
+
+
+# ============================================================
+# Inference chạy trong process riêng (tận dụng đủ core, không dính GIL của API)
+# ============================================================
+
+def _worker_main(idx: int, gen: int, task_q, result_q, threads: int, detector_cfg: dict):
+    """
+    Hàm chạy trong worker process: tự build detector, nhận task
+    (tên shared memory + vị trí từng frame), chạy detect_person_batch, trả kết quả.
+    gen: lần spawn thứ mấy của worker idx (kết quả của process cũ đã chết bị bỏ qua).
+    """
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    from .detector import build_detector
+
+    t0 = time.time()
+    det = build_detector(threads=threads, **detector_cfg)
+    load_s = round(time.time() - t0, 2)
+    warmup_ms = _warm_up(det)
+    result_q.put((idx, gen, "ready", {
+        "detector": type(det).__name__,
+        "load_s": load_s,
+        "warmup_ms": warmup_ms,
+        "input_hw": det.input_hw,
+    }))
+
+    shm = None
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        shm_name, layout = task
+        try:
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+            frames = [
+                np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+                for offset, shape in layout
+            ]
+            boxes = det.detect_person_batch(frames)
+            del frames  # bỏ view trước khi shm có thể bị close
+            result_q.put((idx, gen, "ok", boxes))
+        except Exception as e:
+            result_q.put((idx, gen, "error", str(e)))
+
+    if shm is not None:
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, ctx, idx: int, result_q, shm_size: int, threads: int, detector_cfg: dict,
+                 gen: int = 0):
+        self.idx = idx
+        self.gen = gen
+        self.task_q = ctx.Queue()
+        self.shm = shared_memory.SharedMemory(create=True, size=shm_size)
+        self.busy = None  # list futures theo từng frame của batch đang chạy
+        self.ready = False
+        self.info = {}    # detector / load_s / warmup_ms / input_hw worker báo về khi sẵn sàng
+        self.respawn_at = None  # process đã chết: lúc sẽ spawn lại
+        self.proc = ctx.Process(
+            target=_worker_main,
+            args=(idx, gen, self.task_q, result_q, threads, detector_cfg),
+            daemon=True,
+            name=f"inference-worker-{idx}",
+        )
+        self.proc.start()
+
+    def ensure_shm(self, size: int):
+        # frame lớn hơn vùng nhớ hiện tại -> tạo vùng mới (worker tự attach theo tên)
+        if size > self.shm.size:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+
+    def close(self):
+        try:
+            if self.proc.is_alive():
+                self.task_q.put(None)
+                self.proc.join(timeout=2.0)
+        except Exception:
+            pass
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ProcessInferenceService:
+    """
+    Cùng interface với BatchInferenceService (start / submit / detect / stop),
+    nhưng detector chạy trong `workers` process riêng (spawn khi start(), mỗi
+    worker tự load model + warm-up; sẵn sàng khi có ít nhất 1 worker xong):
+      - frame được copy vào shared memory của worker (không pickle numpy array);
+        có preprocessor thì letterbox thẳng vào shared memory (không copy thêm),
+      - mỗi camera chỉ giữ tối đa 1 frame chờ: frame mới tới khi frame cũ chưa
+        được gửi đi thì frame cũ bị bỏ (drop-oldest), mọi request đang chờ của
+        camera đó nhận kết quả của frame mới nhất,
+      - mỗi lần gửi worker gom tối đa max_batch camera đang chờ thành 1 batch,
+      - worker chết (crash / bị OOM kill) -> batch nó đang chạy báo lỗi, worker được
+        spawn lại (chờ lâu dần nếu chết liên tục); không còn worker nào sẵn sàng thì
+        các frame đang chờ cũng báo lỗi, không để future treo mãi.
+    """
+    def __init__(self, workers: int = 2, max_batch: int = 4,
+                 shm_size: int = 4 * 640 * 640 * 3, preprocessor=None, detector_cfg=None):
+        self.num_workers = workers
+        self.shm_size = shm_size
+        # detector_cfg: tham số build_detector (backend, model_path, precision, conf_thres)
+        self.detector_cfg = detector_cfg or {}
+        self.max_batch = max_batch
+        self.preprocessor = preprocessor
+        self.result_q = None
+        self.workers = []
+        self.pending = OrderedDict()  # cam_id -> [frame, [futures]]
+        self.dropped = 0
+        self.cond = threading.Condition()
+        self.running = True
+        self.started = False
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        self._sent_at = {}
+        self._ctx = None
+        self._threads = 1
+        self.restarts = 0
+        self._crashes = {}  # idx -> số lần chết liên tiếp (chưa kịp sẵn sàng lại)
+
+    def _spawn(self, idx: int, gen: int = 0) -> _Worker:
+        return _Worker(self._ctx, idx, self.result_q, self.shm_size, self._threads,
+                       self.detector_cfg, gen=gen)
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self._ctx = mp.get_context("spawn")
+        self._threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.result_q = self._ctx.Queue()
+        self.workers = [self._spawn(i) for i in range(self.num_workers)]
+        threading.Thread(target=self._dispatch_loop, daemon=True, name="inference-dispatch").start()
+        threading.Thread(target=self._result_loop, daemon=True, name="inference-results").start()
+
+    def ready(self) -> bool:
+        return any(w.ready for w in self.workers)
+
+    def readiness(self) -> dict:
+        workers = [dict(w.info, ready=w.ready, alive=w.proc.is_alive()) for w in self.workers]
+        if self.ready():
+            state = "ready"
+        elif not self.started:
+            state = "stopped"
+        elif self.workers and not any(w["alive"] for w in workers):
+            state = "error"
+        else:
+            state = "loading"
+        first = next((w for w in workers if w["ready"]), {})
+        return {
+            "state": state,
+            "detector": first.get("detector"),
+            "load_s": first.get("load_s"),
+            "warmup_ms": first.get("warmup_ms"),
+            "input_hw": first.get("input_hw"),
+            "error": "all inference workers exited" if state == "error" else None,
+            "workers": workers,
+            "restarts": self.restarts,
+        }
+
+    def submit(self, cam_id: str, frame_bgr) -> Future:
+        if not self.ready():
+            raise DetectorWarming("detector loading")
+        fut = Future()
+        frame = np.ascontiguousarray(frame_bgr, dtype=np.uint8)
+        with self.cond:
+            entry = self.pending.get(cam_id)
+            if entry is not None:
+                # drop-oldest: thay frame cũ chưa xử lý bằng frame mới
+                entry[0] = frame
+                entry[1].append(fut)
+                self.dropped += 1
+            else:
+                self.pending[cam_id] = [frame, [fut]]
+            self.cond.notify_all()
+        return fut
+
+    def detect(self, cam_id: str, frame_bgr, timeout: float = 10.0):
+        return self.submit(cam_id, frame_bgr).result(timeout=timeout)
+
+    def queue_depth(self) -> int:
+        with self.cond:
+            return len(self.pending)
+
+    def _idle_worker(self):
+        for w in self.workers:
+            if w.ready and w.busy is None and w.proc.is_alive():
+                return w
+        return None
+
+    def _check_workers(self):
+        """
+        Gọi trong self.cond. Worker chết -> lấy futures batch nó đang chạy, spawn lại
+        khi tới hạn. Trả list futures phải báo lỗi (resolve ngoài lock).
+        """
+        failed = []
+        now = time.time()
+        for i, w in enumerate(self.workers):
+            if w.proc.is_alive():
+                if w.ready:
+                    self._crashes.pop(i, None)
+                continue
+            if w.respawn_at is None:
+                print(f"[ProcessInferenceService] worker {i} died (exitcode {w.proc.exitcode})")
+                for futs, _ in w.busy or []:
+                    failed.extend(futs)
+                w.busy = None
+                w.ready = False
+                n = self._crashes.get(i, 0)
+                self._crashes[i] = n + 1
+                w.respawn_at = now + min(RESPAWN_MAX_DELAY, 2.0 ** n)
+            if now >= w.respawn_at:
+                w.close()
+                self.workers[i] = self._spawn(i, gen=w.gen + 1)
+                self.restarts += 1
+                print(f"[ProcessInferenceService] worker {i} respawned")
+        if not any(w.ready for w in self.workers):
+            # không worker nào nhận được frame -> không để request chờ vô hạn
+            for _, futs in self.pending.values():
+                failed.extend(futs)
+            self.pending.clear()
+        return failed
+
+    def _send(self, w: _Worker, batch):
+        """Copy batch vào shared memory của worker rồi gửi task. Gọi trong self.cond."""
+        if self.preprocessor is not None:
+            plans = [self.preprocessor.plan(cam_id, frame.shape) for cam_id, (frame, _) in batch]
+            shapes = [(p.size, p.size, 3) for p in plans]
+        else:
+            plans = [None] * len(batch)
+            shapes = [frame.shape for _, (frame, _) in batch]
+
+        w.ensure_shm(sum(int(np.prod(shape)) for shape in shapes))
+        layout = []
+        offset = 0
+        for (_, (frame, _)), plan, shape in zip(batch, plans, shapes):
+            view = np.ndarray(shape, dtype=np.uint8, buffer=w.shm.buf, offset=offset)
+            if plan is not None:
+                self.preprocessor.fill(frame, plan, view)
+            else:
+                view[...] = frame
+            layout.append((offset, shape))
+            offset += view.nbytes
+            del view
+        w.busy = [(futs, plan) for (_, (_, futs)), plan in zip(batch, plans)]
+        self._sent_at[w.idx] = time.time()
+        w.task_q.put((w.shm.name, layout))
+
+    def _dispatch_loop(self):
+        while self.running:
+            failed, err = [], None
+            with self.cond:
+                self.cond.wait_for(
+                    lambda: not self.running or (self.pending and self._idle_worker() is not None),
+                    timeout=1.0
+                )
+                if not self.running:
+                    break
+                failed = self._check_workers()
+                if failed:
+                    err = RuntimeError("inference worker unavailable")
+                w = self._idle_worker()
+                if w is not None and self.pending:
+                    batch = []
+                    while self.pending and len(batch) < self.max_batch:
+                        batch.append(self.pending.popitem(last=False))
+                    try:
+                        self._send(w, batch)
+                    except Exception as e:
+                        print(f"[ProcessInferenceService] dispatch error: {e}")
+                        w.busy = None
+                        failed += [fut for _, (_, futs) in batch for fut in futs]
+                        err = e
+            if failed:
+                _fail(failed, err)
+
+    def _result_loop(self):
+        while self.running:
+            try:
+                idx, gen, kind, payload = self.result_q.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            with self.cond:
+                w = self.workers[idx]
+                if gen != w.gen:
+                    continue  # process cũ đã chết, batch của nó đã báo lỗi
+                if kind == "ready":
+                    w.ready = True
+                    w.info = payload or {}
+                    print(f"[ProcessInferenceService] worker {idx} ready: {w.info}")
+                    self.cond.notify_all()
+                    continue
+                futs_per_frame = w.busy or []
+                w.busy = None
+                if kind == "ok":
+                    self.last_batch_size = len(futs_per_frame)
+                    self.last_batch_ms = (time.time() - self._sent_at.get(idx, time.time())) * 1000.0
+                self.cond.notify_all()
+
+            if kind == "ok":
+                for (futs, plan), boxes in zip(futs_per_frame, payload):
+                    if plan is not None:
+                        boxes = self.preprocessor.restore(boxes, plan)
+                    for fut in futs:
+                        fut.set_result(boxes)
+            else:
+                _fail([fut for futs, _ in futs_per_frame for fut in futs],
+                      RuntimeError(f"inference worker error: {payload}"))
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for w in self.workers:
+            w.close()
@@ -0,0 +1,239 @@
+# backend/media.py
+#
+# Trả file media (video ghi hình, clip, ảnh event) cho browser:
+#   - ETag / Last-Modified + If-None-Match / If-Modified-Since -> 304, không gửi lại file,
+#   - Range: 1 đoạn (206), nhiều đoạn (206 multipart/byteranges), ngoài file -> 416,
+#     If-Range lệch (file đã đổi) -> trả cả file,
+#   - gửi thân file: chỉ zero-copy khi ASGI server có extension tương ứng:
+#       "http.response.zerocopysend" -> sendfile() cho cả file lẫn từng đoạn range,
+#       "http.response.pathsend"     -> server tự gửi cả file theo đường dẫn,
+#     uvicorn (server mặc định của project) không có extension nào -> đọc từng khối
+#     CHUNK_SIZE trong thread pool (mỗi khối 1 lần đổi thread, nên khối phải lớn).
+
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from secrets import token_hex
+from urllib.parse import quote
+
+import anyio
+from starlette.responses import Response
+
+MAX_RANGES = 16
+CHUNK_SIZE = 1024 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _etag_list(value: str):
+    # so sánh yếu (RFC 9110 13.1.2): bỏ tiền tố W/
+    return [t.strip().removeprefix("W/") for t in value.split(",") if t.strip()]
+
+
+def not_modified(req_headers, etag: str, mtime: float) -> bool:
+    inm = req_headers.get("if-none-match")
+    if inm is not None:
+        tags = _etag_list(inm)
+        return "*" in tags or etag in tags
+    ims = req_headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+    return False
+
+
+def parse_ranges(value: str, size: int):
+    """
+    "bytes=0-99,200-" -> [(start, end_exclusive), ...] đã sắp xếp + gộp đoạn chồng nhau.
+    Trả None nếu header sai cú pháp / quá nhiều đoạn (-> bỏ qua Range, trả cả file).
+    Raise RangeNotSatisfiable nếu không đoạn nào nằm trong file.
+    """
+    units, _, spec = value.partition("=")
+    if units.strip().lower() != "bytes" or not spec:
+        return None
+    parts = [p.strip() for p in spec.split(",") if p.strip()]
+    if not parts or len(parts) > MAX_RANGES:
+        return None
+    ranges = []
+    for p in parts:
+        first, dash, last = p.partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) + 1 if last else size
+                if last and end <= start:
+                    return None  # "5-1": sai cú pháp
+            else:
+                n = int(last)  # "-n": n byte cuối
+                if n == 0:
+                    continue
+                start, end = max(size - n, 0), size
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size)))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _read_at(f, n: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), n, offset)
+    # Windows (môi trường dev) không có pread
+    f.seek(offset)
+    return f.read(n)
+
+
+class MediaResponse(Response):
+    """
+    Response cho 1 file trên đĩa (dùng thay FileResponse / StreamingResponse tự đọc file).
+    cache_control: vd "public, max-age=604800, immutable" cho file không bao giờ đổi.
+    """
+    def __init__(self, path: str, media_type: str, filename: str = None,
+                 cache_control: str = "no-cache", headers: dict = None):
+        # không gọi Response.__init__: header / body do __call__ tự tính theo request
+        self.status_code = 200
+        self.background = None
+        self.path = path
+        self.media_type = media_type
+        self.filename = filename
+        self.cache_control = cache_control
+        self.extra_headers = headers or {}
+
+    def _headers(self, st: os.stat_result) -> dict:
+        h = {
+            "accept-ranges": "bytes",
+            "etag": file_etag(st),
+            "last-modified": formatdate(st.st_mtime, usegmt=True),
+            "cache-control": self.cache_control,
+        }
+        if self.filename:
+            h["content-disposition"] = f"attachment; filename*=utf-8''{quote(self.filename)}"
+        h.update({k.lower(): v for k, v in self.extra_headers.items()})
+        return h
+
+    @staticmethod
+    async def _start(send, status: int, headers: dict):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.encode("latin-1"), str(v).encode("latin-1")) for k, v in headers.items()],
+        })
+
+    async def _send_span(self, send, f, extensions, offset: int, count: int, more_body: bool):
+        if "http.response.zerocopysend" in extensions:
+            await send({"type": "http.response.zerocopysend", "file": f,
+                        "offset": offset, "count": count, "more_body": more_body})
+            return
+        end = offset + count
+        while offset < end:
+            n = min(CHUNK_SIZE, end - offset)
+            chunk = await anyio.to_thread.run_sync(_read_at, f, n, offset)
+            if not chunk:
+                raise RuntimeError(f"{self.path} is shorter than expected")
+            offset += len(chunk)
+            await send({"type": "http.response.body", "body": chunk,
+                        "more_body": more_body or offset < end})
+        if count == 0 and not more_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def __call__(self, scope, receive, send):
+        await self._respond(scope, send)
+        if self.background is not None:
+            await self.background()
+
+    async def _respond(self, scope, send):
+        try:
+            st = await anyio.to_thread.run_sync(os.stat, self.path)
+        except FileNotFoundError:
+            await self._start(send, 404, {"content-type": "text/plain", "content-length": "9"})
+            await send({"type": "http.response.body", "body": b"not found"})
+            return
+
+        req = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        head_only = scope.get("method", "GET").upper() == "HEAD"
+        extensions = scope.get("extensions") or {}
+        size = st.st_size
+        headers = self._headers(st)
+
+        if not_modified(req, headers["etag"], st.st_mtime):
+            await self._start(send, 304, headers)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        if "range" in req:
+            if_range = req.get("if-range")
+            if if_range is None or if_range in (headers["etag"], headers["last-modified"]):
+                try:
+                    ranges = parse_ranges(req["range"], size)
+                except RangeNotSatisfiable:
+                    await self._start(send, 416, {"content-range": f"bytes */{size}",
+                                                  "content-length": "0"})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+
+        if ranges is None:
+            headers["content-type"] = self.media_type
+            headers["content-length"] = str(size)
+            await self._start(send, 200, headers)
+            if head_only:
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.pathsend" in extensions and "http.response.zerocopysend" not in extensions:
+                await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            else:
+                with open(self.path, "rb") as f:
+                    await self._send_span(send, f, extensions, 0, size, False)
+            return
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers["content-type"] = self.media_type
+            headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            headers["content-length"] = str(end - start)
+            await self._start(send, 206, headers)
+            if head_only:
+                await send({"type": "http.response.body", "body": b""})
+                return
+            with open(self.path, "rb") as f:
+                await self._send_span(send, f, extensions, start, end - start, False)
+            return
+
+        boundary = token_hex(13)
+        part_heads = [
+            (f"--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+             f"Content-Range: bytes {s}-{e - 1}/{size}\r\n\r\n").encode("latin-1")
+            for s, e in ranges
+        ]
+        tail = f"--{boundary}--\r\n".encode("latin-1")
+        headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        headers["content-length"] = str(
+            sum(len(h) + (e - s) + 2 for h, (s, e) in zip(part_heads, ranges)) + len(tail))
+        await self._start(send, 206, headers)
+        if head_only:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        with open(self.path, "rb") as f:
+            for part_head, (start, end) in zip(part_heads, ranges):
+                await send({"type": "http.response.body", "body": part_head, "more_body": True})
+                await self._send_span(send, f, extensions, start, end - start, True)
+                await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": tail, "more_body": False})
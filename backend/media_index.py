@@ -0,0 +1,66 @@
+# backend/media_index.py
+#
+# ID cho file media (ảnh event, video ghi hình, clip sự kiện) dùng trong URL thay cho
+# đường dẫn thật: /api/event_image?id=..., /api/preview_video?id=...
+#   - backend chỉ trả file nằm trong index (event / catalog đã biết) -> không đọc được
+#     file tuỳ ý bằng "?path=../../etc/passwd",
+#   - tra ID là 1 lần tra dict, không os.path.isfile() mỗi request.
+# ID = hash của đường dẫn: cố định qua các lần restart (URL browser đã cache vẫn đúng),
+# tính được trước khi file tồn tại (clip của event chỉ ghi xong sau post-roll).
+
+import hashlib
+import threading
+
+
+def media_id(path: str):
+    """Đường dẫn -> ID 16 ký tự hex (None nếu path rỗng)."""
+    if not path:
+        return None
+    return hashlib.blake2b(path.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class MediaIndex:
+    """
+    {id: (kind, path)} trong RAM. kind: "image" (ảnh event) | "video" (ghi hình + clip).
+    rebuild() lúc startup từ DB, add() / remove() khi có file mới / file bị xoá.
+    """
+    def __init__(self):
+        self._items = {}
+        self.lock = threading.Lock()
+
+    def add(self, kind: str, path: str):
+        mid = media_id(path)
+        if mid is not None:
+            with self.lock:
+                self._items[mid] = (kind, path)
+        return mid
+
+    def remove(self, path: str):
+        with self.lock:
+            self._items.pop(media_id(path), None)
+
+    def resolve(self, mid: str, kind: str):
+        """ID -> đường dẫn, None nếu ID lạ hoặc khác loại."""
+        item = self._items.get(mid)
+        if item is None or item[0] != kind:
+            return None
+        return item[1]
+
+    def rebuild(self, load) -> int:
+        """
+        Dựng lại toàn bộ index. load() -> (ảnh, video): danh sách đường dẫn đọc từ DB,
+        gọi trong lock để add() / remove() xảy ra lúc đang dựng không bị mất.
+        """
+        with self.lock:
+            images, videos = load()
+            items = {}
+            for kind, paths in (("image", images), ("video", videos)):
+                for p in paths:
+                    if p:
+                        items[media_id(p)] = (kind, p)
+            self._items = items
+        print(f"[MediaIndex] rebuilt: {len(items)} files")
+        return len(items)
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,122 @@
+# backend/mjpeg.py
+#
+# Đọc stream MJPEG (multipart/x-mixed-replace) từ ESP32-CAM (:81/stream)
+# hoặc fake_cam (/stream) qua 1 kết nối HTTP giữ lâu dài.
+
+import re
+
+_BOUNDARY_RE = re.compile(r'boundary="?([^";,]+)"?', re.IGNORECASE)
+_CONTENT_LENGTH_RE = re.compile(rb"content-length:\s*(\d+)", re.IGNORECASE)
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+# nếu buffer phình quá mức mà vẫn không ra frame -> stream hỏng, bỏ dữ liệu cũ
+MAX_BUFFER_BYTES = 4 * 1024 * 1024
+
+
+def parse_boundary(content_type: str):
+    """
+    Lấy boundary từ header Content-Type, ví dụ:
+      "multipart/x-mixed-replace;boundary=123456789000000000000987654321"
+    Trả về bytes dạng b"--<boundary>" hoặc None nếu không có.
+    """
+    if not content_type or "multipart" not in content_type.lower():
+        return None
+    m = _BOUNDARY_RE.search(content_type)
+    if not m:
+        return None
+    boundary = m.group(1).strip()
+    # vài camera tự thêm "--" vào giá trị boundary
+    if boundary.startswith("--"):
+        boundary = boundary[2:]
+    return b"--" + boundary.encode("latin-1")
+
+
+class MjpegParser:
+    """
+    Tách từng ảnh JPEG ra khỏi luồng multipart theo kiểu incremental:
+      parser.feed(chunk) -> list các JPEG bytes hoàn chỉnh đã tách được.
+    Dữ liệu dở dang được giữ lại trong 1 bytearray dùng lại giữa các lần feed.
+    Ưu tiên Content-Length của từng part; nếu không có thì cắt theo boundary kế tiếp.
+    """
+    def __init__(self, boundary: bytes):
+        self.boundary = boundary
+        self.buf = bytearray()
+
+    def feed(self, chunk: bytes):
+        frames = []
+        if chunk:
+            self.buf += chunk
+
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+
+        if len(self.buf) > MAX_BUFFER_BYTES:
+            print("[MjpegParser] buffer overflow, reset")
+            del self.buf[:]
+        return frames
+
+    def _next_frame(self):
+        buf = self.buf
+        b_idx = buf.find(self.boundary)
+        if b_idx < 0:
+            # giữ lại phần đuôi phòng khi boundary bị cắt giữa 2 chunk
+            keep = len(self.boundary)
+            if len(buf) > keep:
+                del buf[:len(buf) - keep]
+            return None
+
+        hdr_end = buf.find(b"\r\n\r\n", b_idx)
+        if hdr_end < 0:
+            if b_idx > 0:
+                del buf[:b_idx]
+            return None
+
+        headers = bytes(buf[b_idx:hdr_end])
+        body_start = hdr_end + 4
+
+        m = _CONTENT_LENGTH_RE.search(headers)
+        if m:
+            length = int(m.group(1))
+            body_end = body_start + length
+            if len(buf) < body_end:
+                return None
+            frame = bytes(buf[body_start:body_end])
+            del buf[:body_end]
+        else:
+            next_b = buf.find(self.boundary, body_start)
+            if next_b < 0:
+                return None
+            frame = bytes(buf[body_start:next_b]).rstrip(b"\r\n")
+            del buf[:next_b]
+
+        if not frame.startswith(JPEG_SOI):
+            # part không phải JPEG (hoặc hỏng) -> bỏ qua, đọc part tiếp theo
+            return self._next_frame()
+        return frame
+
+
+def iter_mjpeg_frames(resp, chunk_size: int = 16384):
+    """
+    Đọc requests.Response (stream=True) của 1 endpoint MJPEG, trả về generator
+    yield từng JPEG bytes. Đóng kết nối khi generator bị đóng.
+    Raise ngay (không lazy) nếu response không phải multipart.
+    """
+    boundary = parse_boundary(resp.headers.get("Content-Type", ""))
+    if boundary is None:
+        resp.close()
+        raise RuntimeError("not a multipart stream")
+    return _iter_frames(resp, MjpegParser(boundary), chunk_size)
+
+
+def _iter_frames(resp, parser: MjpegParser, chunk_size: int):
+    try:
+        for chunk in resp.iter_content(chunk_size=chunk_size):
+            for frame in parser.feed(chunk):
+                yield frame
+    finally:
+        resp.close()
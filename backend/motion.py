@@ -0,0 +1,145 @@
+# backend/motion.py
+#
+# Lọc chuyển động rẻ tiền trước YOLO: so sánh frame xám thu nhỏ với nền
+# (running average). Cảnh tĩnh -> không gửi frame đi detect.
+#
+# Cấu hình theo camera trong cameras.json:
+#   "motion": {
+#       "enabled": true,
+#       "sensitivity": 0.5,          # 0..1, càng cao càng nhạy
+#       "mask": [[[0,0],[0.3,0],[0.3,0.2],[0,0.2]], ...]  # polygon bỏ qua (toạ độ 0..1)
+#   }
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_MOTION_CFG = {
+    "enabled": True,
+    "sensitivity": 0.5,
+    "mask": [],
+}
+
+
+class MotionGate:
+    """
+    Bộ lọc chuyển động cho 1 camera.
+    check_jpeg(seq, jpeg) -> True nếu có chuyển động (hoặc vừa có trong hold giây).
+    Decode thẳng JPEG ở độ phân giải 1/4 dạng xám (IMREAD_REDUCED_GRAYSCALE_4),
+    rẻ hơn nhiều so với decode BGR full size.
+    """
+    def __init__(self, sensitivity: float = 0.5, mask=None, alpha: float = 0.05,
+                 pixel_thresh: int = 25, hold: float = 2.0):
+        s = max(0.0, min(float(sensitivity), 1.0))
+        # tỉ lệ pixel thay đổi tối thiểu: sensitivity 0 -> 5%, 1 -> 0.1%
+        self.ratio_thresh = 0.05 * (1.0 - s) + 0.001 * s
+        self.mask_polys = mask or []
+        self.alpha = alpha
+        self.pixel_thresh = pixel_thresh
+        self.hold = hold
+
+        self.bg = None
+        self.mask = None
+        self.valid_pixels = 0
+        self.last_seq = None
+        self.last_result = True
+        self.last_score = 0.0
+        self.last_motion_ts = 0.0
+        self.lock = threading.Lock()
+
+    def _build_mask(self, shape):
+        h, w = shape
+        mask = np.full((h, w), 255, dtype=np.uint8)
+        for poly in self.mask_polys:
+            pts = np.array([[int(x * w), int(y * h)] for x, y in poly], dtype=np.int32)
+            if len(pts) >= 3:
+                cv2.fillPoly(mask, [pts], 0)
+        self.mask = mask
+        self.valid_pixels = max(1, cv2.countNonZero(mask))
+
+    def check_jpeg(self, seq: int, jpeg: bytes) -> bool:
+        with self.lock:
+            if self.last_seq is not None and seq <= self.last_seq:
+                # frame này (hoặc frame cũ hơn) đã xét rồi
+                return self.last_result
+
+            gray = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+            if gray is None:
+                # không decode được -> cứ cho qua, để detector tự xử lý
+                return True
+            gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+            if self.bg is None or self.bg.shape != gray.shape:
+                self.bg = gray.astype(np.float32)
+                self._build_mask(gray.shape)
+                self.last_seq = seq
+                self.last_result = True
+                self.last_motion_ts = time.time()
+                return True
+
+            diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.bg))
+            _, moving = cv2.threshold(diff, self.pixel_thresh, 255, cv2.THRESH_BINARY)
+            moving = cv2.bitwise_and(moving, self.mask)
+            self.last_score = cv2.countNonZero(moving) / float(self.valid_pixels)
+
+            cv2.accumulateWeighted(gray, self.bg, self.alpha)
+
+            now = time.time()
+            if self.last_score >= self.ratio_thresh:
+                self.last_motion_ts = now
+            self.last_seq = seq
+            self.last_result = now - self.last_motion_ts <= self.hold
+            return self.last_result
+
+
+class MotionGateRegistry:
+    """
+    Giữ MotionGate cho từng camera, tự tạo lại khi cấu hình "motion" thay đổi.
+    check(cam_id, pkt) -> True nếu nên gửi frame đi detect.
+    """
+    def __init__(self, cameras: dict, on_motion=None):
+        self.cameras = cameras
+        self.on_motion = on_motion
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def config(self, cam_id: str) -> dict:
+        cam = self.cameras.get(cam_id) or {}
+        cfg = dict(DEFAULT_MOTION_CFG)
+        cfg.update(cam.get("motion") or {})
+        return cfg
+
+    def _gate(self, cam_id: str, cfg: dict) -> MotionGate:
+        key = (float(cfg["sensitivity"]), repr(cfg["mask"]))
+        with self._lock:
+            entry = self._gates.get(cam_id)
+            if entry is None or entry[0] != key:
+                entry = (key, MotionGate(sensitivity=cfg["sensitivity"], mask=cfg["mask"]))
+                self._gates[cam_id] = entry
+            return entry[1]
+
+    def check(self, cam_id: str, pkt) -> bool:
+        cfg = self.config(cam_id)
+        if not cfg.get("enabled", True):
+            return True
+        moving = self._gate(cam_id, cfg).check_jpeg(pkt.seq, pkt.jpeg)
+        if moving and self.on_motion is not None:
+            self.on_motion(cam_id)
+        return moving
+
+    def status(self, cam_id: str) -> dict:
+        with self._lock:
+            entry = self._gates.get(cam_id)
+        gate = entry[1] if entry else None
+        return {
+            "config": self.config(cam_id),
+            "score": round(gate.last_score, 4) if gate else None,
+            "moving": gate.last_result if gate else None,
+            "last_motion_ts": gate.last_motion_ts if gate else None,
+        }
+
+    def forget(self, cam_id: str):
+        with self._lock:
+            self._gates.pop(cam_id, None)
@@ -0,0 +1,146 @@
+# backend/preprocess.py
+#
+# Tiền xử lý frame trước khi đưa vào detector:
+#   - cắt theo vùng quan tâm (ROI polygon) của camera -> chỉ lấy bounding box của ROI,
+#   - thu nhỏ 1 lần duy nhất + letterbox vào buffer vuông, liền bộ nhớ, cấp phát sẵn
+#     (detector không phải copy / resize thêm),
+#   - map bbox từ ảnh letterbox về toạ độ frame gốc, bỏ box nằm ngoài ROI.
+#
+# Cấu hình theo camera trong cameras.json:
+#   "roi": [[x,y], [x,y], [x,y], ...]   # polygon toạ độ 0..1, null = cả khung hình
+#   "infer_size": 640                   # cạnh dài tối đa của ảnh đưa vào model
+
+import math
+import threading
+
+import cv2
+import numpy as np
+
+LETTERBOX_COLOR = 114  # giống màu padding của ultralytics
+STRIDE = 32
+
+
+class LetterboxPlan:
+    """
+    Cách biến đổi 1 frame (kích thước cố định) thành ảnh vuông size x size:
+      crop [y0:y1, x0:x1] -> resize (nw, nh) theo scale -> đặt tại (left, top).
+    """
+    __slots__ = ("x0", "y0", "x1", "y1", "scale", "nw", "nh", "size", "left", "top", "roi_px")
+
+    def __init__(self, x0, y0, x1, y1, scale, nw, nh, size, roi_px):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.scale = scale
+        self.nw, self.nh = nw, nh
+        self.size = size
+        self.left = (size - nw) // 2
+        self.top = (size - nh) // 2
+        self.roi_px = roi_px
+
+
+class Preprocessor:
+    """
+    Dùng chung cho mọi camera (đọc "roi" / "infer_size" từ SYSTEM_STATE["cameras"]).
+      plan(cam_id, shape) -> LetterboxPlan
+      fill(frame, plan, out) -> out (ảnh BGR size x size liền bộ nhớ)
+      restore(boxes, plan) -> boxes theo toạ độ frame gốc (đã lọc theo ROI)
+    """
+    def __init__(self, cameras: dict, default_size: int = 640, size_limit=None):
+        self.cameras = cameras
+        self.default_size = default_size
+        # size_limit(cam_id) -> cạnh tối đa do AdaptiveController cho phép (None = không giới hạn)
+        self.size_limit = size_limit
+        self._tmp = threading.local()  # buffer resize tạm, theo từng thread
+
+    def infer_size(self, cam_id: str) -> int:
+        cam = self.cameras.get(cam_id) or {}
+        size = int(cam.get("infer_size") or self.default_size)
+        if self.size_limit is not None:
+            limit = self.size_limit(cam_id)
+            if limit:
+                size = min(size, int(limit))
+        return max(STRIDE, (size // STRIDE) * STRIDE)
+
+    def plan(self, cam_id: str, shape, infer_size: int = None) -> LetterboxPlan:
+        h, w = shape[:2]
+        cam = self.cameras.get(cam_id) or {}
+        roi = cam.get("roi")
+
+        roi_px = None
+        x0, y0, x1, y1 = 0, 0, w, h
+        if roi and len(roi) >= 3:
+            roi_px = np.array([[x * w, y * h] for x, y in roi], dtype=np.float32)
+            bx, by, bw, bh = cv2.boundingRect(roi_px)
+            x0, y0 = max(0, bx), max(0, by)
+            x1, y1 = min(w, bx + bw), min(h, by + bh)
+            if x1 - x0 < 2 or y1 - y0 < 2:
+                x0, y0, x1, y1 = 0, 0, w, h
+                roi_px = None
+
+        cw, ch = x1 - x0, y1 - y0
+        target = infer_size or self.infer_size(cam_id)
+        # chỉ thu nhỏ, không phóng to ảnh nhỏ (tốn CPU mà không thêm thông tin)
+        scale = min(1.0, target / float(max(cw, ch)))
+        nw = max(1, int(round(cw * scale)))
+        nh = max(1, int(round(ch * scale)))
+        size = min(target, int(math.ceil(max(nw, nh) / float(STRIDE))) * STRIDE)
+        return LetterboxPlan(x0, y0, x1, y1, scale, nw, nh, size, roi_px)
+
+    def alloc(self, plan: LetterboxPlan):
+        return np.empty((plan.size, plan.size, 3), dtype=np.uint8)
+
+    def _resize_buf(self, nh: int, nw: int):
+        bufs = getattr(self._tmp, "bufs", None)
+        if bufs is None:
+            bufs = self._tmp.bufs = {}
+        buf = bufs.get((nh, nw))
+        if buf is None:
+            buf = bufs[(nh, nw)] = np.empty((nh, nw, 3), dtype=np.uint8)
+        return buf
+
+    def fill(self, frame_bgr, plan: LetterboxPlan, out=None):
+        """
+        Ghi ảnh letterbox vào `out` (size x size x 3, uint8). Không cấp phát mới
+        nếu out được truyền vào (ví dụ vùng shared memory của worker inference).
+        """
+        if out is None:
+            out = self.alloc(plan)
+        crop = frame_bgr[plan.y0:plan.y1, plan.x0:plan.x1]
+        t, l, nh, nw = plan.top, plan.left, plan.nh, plan.nw
+
+        if (nh, nw) == crop.shape[:2]:
+            out[t:t + nh, l:l + nw] = crop
+        else:
+            resized = self._resize_buf(nh, nw)
+            cv2.resize(crop, (nw, nh), dst=resized, interpolation=cv2.INTER_AREA)
+            out[t:t + nh, l:l + nw] = resized
+
+        # padding (chỉ các dải viền, không tô lại cả ảnh)
+        out[:t] = LETTERBOX_COLOR
+        out[t + nh:] = LETTERBOX_COLOR
+        out[t:t + nh, :l] = LETTERBOX_COLOR
+        out[t:t + nh, l + nw:] = LETTERBOX_COLOR
+        return out
+
+    def restore(self, boxes, plan: LetterboxPlan):
+        out = []
+        for b in boxes:
+            x1, y1, x2, y2 = b["bbox"]
+            fx1 = (x1 - plan.left) / plan.scale + plan.x0
+            fy1 = (y1 - plan.top) / plan.scale + plan.y0
+            fx2 = (x2 - plan.left) / plan.scale + plan.x0
+            fy2 = (y2 - plan.top) / plan.scale + plan.y0
+            fx1, fx2 = max(plan.x0, fx1), min(plan.x1 - 1, fx2)
+            fy1, fy2 = max(plan.y0, fy1), min(plan.y1 - 1, fy2)
+            if fx2 <= fx1 or fy2 <= fy1:
+                continue
+
+            if plan.roi_px is not None:
+                # giữ box có tâm nằm trong ROI
+                center = (float(fx1 + fx2) / 2.0, float(fy1 + fy2) / 2.0)
+                if cv2.pointPolygonTest(plan.roi_px, center, False) < 0:
+                    continue
+
+            nb = dict(b)
+            nb["bbox"] = [int(fx1), int(fy1), int(fx2), int(fy2)]
+            out.append(nb)
+        return out
@@ -0,0 +1,538 @@
+# backend/recorder.py
+#
+# Ghi hình từ FrameHub. Các kiểu ghi (SSS_RECORD_BACKEND hoặc "mode" khi start):
+#   - "ffmpeg": đẩy thẳng JPEG từ camera vào tiến trình ffmpeg (không decode ở Python),
+#               encode H.264 bằng encoder phần cứng của Pi (h264_v4l2m2m) nếu có,
+#               không thì libx264 ultrafast; timestamp vẽ bằng filter drawtext.
+#   - "copy":   ghép nguyên các frame MJPEG của camera vào file .avi, không encode lại
+#               (gần như không tốn CPU, file lớn hơn H.264, trình duyệt không xem trực tiếp được).
+#   - "opencv": cách cũ: decode + cv2.putText + cv2.VideoWriter (mp4v).
+#   - "auto":   có ffmpeg thì "ffmpeg", không thì "opencv".
+#
+# Nhịp ghi bám theo đồng hồ monotonic: frame thứ n luôn ứng với thời điểm start + n/fps
+# (camera chậm hơn fps -> lặp lại frame trước, nhanh hơn -> chỉ lấy frame mới nhất),
+# nên thời lượng video = thời gian thực. Thời điểm chụp thật của từng frame được ghi vào
+# file index đi kèm (<tên video>.idx.csv) để tua video theo giờ thực.
+#
+# Ghi theo đoạn (segment) cố định: mỗi đoạn ghi vào "<tên>.part.<ext>", ghi xong mới
+# đổi tên (os.replace) thành "<cam_id>_<YYYYmmdd_HHMMSS>.<ext>" -> mất điện chỉ hỏng
+# đoạn đang ghi, file đã hoàn tất luôn nguyên vẹn.
+
+import bisect
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from .utils import draw_timestamp
+
+_CAPS = None
+_CAPS_LOCK = threading.Lock()
+
+# bị trễ quá số giây này (máy treo / suspend) thì không lặp frame bù nữa, đặt lại nhịp
+RESYNC_AFTER = 30.0
+
+
+def ffmpeg_path():
+    return os.environ.get("SSS_FFMPEG") or shutil.which("ffmpeg")
+
+
+def ffmpeg_capabilities() -> dict:
+    """
+    Hỏi ffmpeg 1 lần: có những encoder / filter nào (cache lại cho các lần sau).
+    """
+    global _CAPS
+    with _CAPS_LOCK:
+        if _CAPS is not None:
+            return _CAPS
+        caps = {"path": ffmpeg_path(), "encoders": set(), "drawtext": False}
+        if caps["path"]:
+            try:
+                out = subprocess.run([caps["path"], "-hide_banner", "-encoders"],
+                                     capture_output=True, text=True, timeout=10).stdout
+                caps["encoders"] = {line.split()[1] for line in out.splitlines()
+                                    if len(line.split()) > 1 and line.startswith(" V")}
+                out = subprocess.run([caps["path"], "-hide_banner", "-filters"],
+                                     capture_output=True, text=True, timeout=10).stdout
+                caps["drawtext"] = " drawtext " in out
+            except Exception as e:
+                print(f"[recorder] ffmpeg probe failed: {e}")
+                caps["path"] = None
+        _CAPS = caps
+        return caps
+
+
+def resolve_mode(mode: str) -> str:
+    mode = (mode or "auto").lower()
+    if mode in ("ffmpeg", "copy") and not ffmpeg_capabilities()["path"]:
+        print(f"[recorder] ffmpeg not found, '{mode}' -> opencv")
+        return "opencv"
+    if mode == "auto":
+        return "ffmpeg" if ffmpeg_capabilities()["path"] else "opencv"
+    return mode if mode in ("ffmpeg", "copy", "opencv") else "opencv"
+
+
+def file_ext(mode: str) -> str:
+    return ".avi" if mode == "copy" else ".mp4"
+
+
+class OpenCVWriter:
+    """
+    Cách ghi cũ: decode JPEG, vẽ timestamp, encode mp4v bằng cv2.VideoWriter.
+    """
+    def __init__(self, out_path: str, fps: float):
+        self.out_path = out_path
+        self.fps = fps
+        self.writer = None
+        self.encoder = "mp4v"
+        self._last = (None, None)  # (seq, frame đã vẽ timestamp) để ghi lặp không phải vẽ lại
+
+    def write_packet(self, pkt):
+        if self._last[0] == pkt.seq:
+            frame_with_ts = self._last[1]
+        else:
+            # vẽ timestamp lên bản copy (frame decode dùng chung với các consumer khác)
+            frame_with_ts = draw_timestamp(pkt.bgr().copy(), pkt.ts)
+            self._last = (pkt.seq, frame_with_ts)
+
+        # khởi tạo VideoWriter khi biết kích thước frame
+        if self.writer is None:
+            h, w = frame_with_ts.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            self.writer = cv2.VideoWriter(self.out_path, fourcc, self.fps, (w, h))
+            if not self.writer.isOpened():
+                raise RuntimeError(f"cannot open VideoWriter for {self.out_path}")
+
+        self.writer.write(frame_with_ts)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+class EncoderDied(RuntimeError):
+    """ffmpeg chết sau khi đã ghi dữ liệu vào file: đoạn hiện tại hỏng, phải mở file mới."""
+
+
+class FfmpegWriter:
+    """
+    Ghi bằng tiến trình ffmpeg, nhận JPEG qua stdin (image2pipe).
+    Thử lần lượt các cấu hình (encoder phần cứng -> libx264, có / không drawtext);
+    cấu hình nào ffmpeg chết ngay (không mở được encoder / font, chưa ghi được gì ra file)
+    thì chuyển cấu hình sau. Chết giữa chừng (đã ghi ra file) -> raise EncoderDied,
+    không ghi đè file, không bỏ cấu hình.
+    stderr được 1 luồng nền đọc liên tục (giữ STDERR_TAIL dòng cuối để in khi lỗi):
+    MJPEG hỏng từ ESP32 làm ffmpeg in lỗi decode liên tục, pipe đầy thì ffmpeg treo.
+    """
+    STDERR_TAIL = 20
+    HW_ENCODER = "h264_v4l2m2m"
+    _hw_broken = False  # encoder phần cứng đã lỗi 1 lần -> không thử lại
+
+    def __init__(self, out_path: str, fps: float, copy: bool = False):
+        self.out_path = out_path
+        self.fps = fps
+        self.proc = None
+        self._drain = None
+        self.encoder = None
+        # epoch ứng với frame đầu tiên: timestamp vẽ = start_wall + pts (đúng giờ chụp
+        # vì nhịp ghi bám đồng hồ thực); None -> dùng giờ lúc encode
+        self.start_wall = None
+        self.configs = self._configs(copy)
+        self.failed = False
+        self._stderr = deque(maxlen=self.STDERR_TAIL)
+
+    def _configs(self, copy: bool):
+        if copy:
+            return [("copy", False)]
+        caps = ffmpeg_capabilities()
+        encoders = []
+        if (self.HW_ENCODER in caps["encoders"] and not FfmpegWriter._hw_broken
+                and os.path.exists("/dev/video11")):
+            encoders.append(self.HW_ENCODER)
+        if "libx264" in caps["encoders"]:
+            encoders.append("libx264")
+        if not encoders:
+            encoders.append("mpeg4")
+        configs = []
+        if caps["drawtext"]:
+            configs += [(enc, True) for enc in encoders]
+        configs += [(enc, False) for enc in encoders]
+        return configs
+
+    def _cmd(self, encoder: str, overlay: bool):
+        cmd = [
+            ffmpeg_capabilities()["path"], "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "image2pipe", "-c:v", "mjpeg", "-framerate", str(self.fps), "-i", "pipe:0",
+        ]
+        if encoder == "copy":
+            return cmd + ["-c:v", "copy", self.out_path]
+
+        if overlay:
+            if self.start_wall is not None:
+                text = "%{pts\\:localtime\\:" + f"{self.start_wall:.3f}" + "}"
+            else:
+                text = "%{localtime}"
+            cmd += ["-vf", f"drawtext=text='{text}':x=10:y=h-th-10:fontsize=20:"
+                           "fontcolor=white:box=1:boxcolor=black@0.5"]
+        cmd += ["-pix_fmt", "yuv420p", "-c:v", encoder]
+        if encoder == "libx264":
+            cmd += ["-preset", "ultrafast", "-crf", "26"]
+        elif encoder == self.HW_ENCODER:
+            cmd += ["-b:v", "2M"]
+        else:
+            cmd += ["-q:v", "5"]
+        return cmd + ["-movflags", "+faststart", self.out_path]
+
+    def _spawn(self):
+        encoder, overlay = self.configs[0]
+        self.encoder = encoder + ("+drawtext" if overlay else "")
+        self.proc = subprocess.Popen(
+            self._cmd(encoder, overlay),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        self._stderr.clear()
+        self._drain = threading.Thread(target=self._drain_stderr, args=(self.proc.stderr,),
+                                       daemon=True, name="ffmpeg-stderr")
+        self._drain.start()
+
+    def _drain_stderr(self, pipe):
+        for line in iter(pipe.readline, b""):
+            self._stderr.append(line.decode(errors="ignore").strip())
+        pipe.close()
+
+    def _stderr_tail(self) -> str:
+        if self._drain is not None:
+            self._drain.join(timeout=2.0)  # ffmpeg đã thoát -> đọc nốt tới EOF
+        return " | ".join(self._stderr)[-300:]
+
+    def _output_started(self) -> bool:
+        try:
+            return os.path.getsize(self.out_path) > 0
+        except OSError:
+            return False
+
+    def write_packet(self, pkt):
+        while True:
+            if self.proc is None:
+                self._spawn()
+            try:
+                self.proc.stdin.write(pkt.jpeg)
+                return
+            except (BrokenPipeError, OSError):
+                try:
+                    self.proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.proc.kill()
+                err = self._stderr_tail()
+                self.proc = None
+                if self._output_started():
+                    # file đã có dữ liệu (muxer chỉ ghi sau khi encoder mở được) -> không phải
+                    # lỗi cấu hình: không bỏ cấu hình, không spawn lại ghi đè lên file
+                    self.failed = True
+                    raise EncoderDied(f"ffmpeg {self.encoder} exited mid-stream: {err}")
+                failed = self.configs.pop(0)
+                print(f"[FfmpegWriter] {failed} failed for {self.out_path}: {err}")
+                if failed[0] == self.HW_ENCODER:
+                    FfmpegWriter._hw_broken = True
+                if not self.configs:
+                    raise RuntimeError("no working ffmpeg configuration")
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=15)
+        except Exception:
+            self.proc.kill()
+            self.failed = True
+        if self.proc.returncode not in (0, None):
+            print(f"[FfmpegWriter] ffmpeg exit {self.proc.returncode} for {self.out_path}: "
+                  f"{self._stderr_tail()}")
+        self.proc = None
+
+
+def open_writer(mode: str, out_path: str, fps: float):
+    if mode == "ffmpeg":
+        return FfmpegWriter(out_path, fps)
+    if mode == "copy":
+        return FfmpegWriter(out_path, fps, copy=True)
+    return OpenCVWriter(out_path, fps)
+
+
+def part_path(final_path: str) -> str:
+    base, ext = os.path.splitext(final_path)
+    return f"{base}.part{ext}"
+
+
+def is_part(path: str) -> bool:
+    return ".part." in os.path.basename(path)
+
+
+def segment_name(cam_id: str, wall_ts: float, ext: str, n: int = 0) -> str:
+    suffix = f"-{n}" if n else ""
+    return f"{cam_id}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(wall_ts))}{suffix}{ext}"
+
+
+def unique_segment_path(out_dir: str, cam_id: str, wall_ts: float, ext: str) -> str:
+    """
+    Đường dẫn cho đoạn / clip mới, không trùng file đã có (kể cả .part đang ghi):
+    2 đoạn cùng camera bắt đầu trong cùng 1 giây -> thêm hậu tố -1, -2, ...
+    (tránh os.replace lúc đóng đoạn ghi đè mất đoạn trước).
+    """
+    n = 0
+    while True:
+        path = os.path.join(out_dir, segment_name(cam_id, wall_ts, ext, n))
+        if not os.path.exists(path) and not os.path.exists(part_path(path)):
+            return path
+        n += 1
+
+
+def parse_segment_name(path: str):
+    """
+    cam1_20251026_224500.mp4 (hoặc cam1_20251026_224500-1.mp4)
+    -> ("cam1", epoch lúc bắt đầu) (cam_id có thể chứa '_').
+    Tên không đúng mẫu -> (phần trước '_', None).
+    """
+    name = re.sub(r"-\d+$", "", os.path.splitext(os.path.basename(path))[0])
+    parts = name.rsplit("_", 2)
+    if len(parts) < 3:
+        return parts[0], None
+    try:
+        return parts[0], time.mktime(time.strptime(parts[1] + parts[2], "%Y%m%d%H%M%S"))
+    except ValueError:
+        return parts[0], None
+
+
+def finalize_part(final_path: str, failed: bool = False) -> bool:
+    """
+    Đổi tên <tên>.part.<ext> -> tên thật khi đóng đoạn / clip. Trả False (và xoá index
+    đi kèm) nếu không có file. failed: ffmpeg chết giữa chừng -> .mp4 thiếu moov, không
+    mở được nên bỏ luôn (giống recover_parts lúc khởi động); .avi vẫn giữ.
+    """
+    part = part_path(final_path)
+    if failed and final_path.lower().endswith(".mp4") and os.path.isfile(part):
+        print(f"[recorder] drop broken {os.path.basename(final_path)}")
+        os.remove(part)
+    if not os.path.isfile(part):
+        try:
+            os.remove(index_path(final_path))
+        except OSError:
+            pass
+        return False
+    os.replace(part, final_path)
+    return True
+
+
+def index_path(video_path: str) -> str:
+    return os.path.splitext(video_path)[0] + ".idx.csv"
+
+
+class FrameIndex:
+    """
+    File index đi kèm video: mỗi dòng 1 frame mới (frame lặp không ghi),
+    "frame,pts,capture_ts,seq" -- pts = giây tính từ đầu video, capture_ts = epoch lúc chụp.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.f = open(path, "w", encoding="utf-8")
+        self.f.write("frame,pts,capture_ts,seq\n")
+        self._last_flush = time.monotonic()
+
+    def add(self, frame_no: int, pts: float, pkt):
+        self.f.write(f"{frame_no},{pts:.3f},{pkt.ts:.3f},{pkt.seq}\n")
+        now = time.monotonic()
+        if now - self._last_flush >= 1.0:
+            self.f.flush()
+            self._last_flush = now
+
+    def close(self):
+        self.f.close()
+
+
+def find_offset(video_path: str, wall_ts: float):
+    """
+    Tra index: vị trí (giây) trong video của frame chụp gần nhất trước wall_ts.
+    Trả None nếu không có index hoặc wall_ts nằm ngoài video.
+    """
+    path = index_path(video_path)
+    if not os.path.isfile(path):
+        return None
+    ts_list, pts_list = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        next(f, None)
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) >= 3:
+                pts_list.append(float(parts[1]))
+                ts_list.append(float(parts[2]))
+    i = bisect.bisect_right(ts_list, wall_ts) - 1
+    if i < 0 or wall_ts - ts_list[-1] > 5.0:
+        return None
+    return pts_list[i]
+
+
+class RecorderThread(threading.Thread):
+    """
+    Lấy frame mới nhất của camera từ FrameHub và ghi ra file đúng `fps`:
+    slot thứ n ứng với thời điểm start + n/fps trên đồng hồ monotonic.
+    - Vòng lặp bị chậm (encode lâu, camera trễ) -> các slot đã lỡ được lấp bằng
+      frame trước (lặp frame), không fetch thêm cho từng slot.
+    - Camera nhanh hơn fps -> các frame ở giữa bị bỏ, chỉ ghi frame mới nhất.
+    - Mỗi segment_s giây đóng đoạn hiện tại (đổi tên .part -> tên thật) và mở đoạn mới.
+    on_segment(cam_id, path, meta): gọi sau khi 1 đoạn hoàn tất.
+    """
+    def __init__(self, cam_id: str, out_dir: str, hub, fps: int = 10, mode: str = "opencv",
+                 segment_s: float = 300.0, on_segment=None):
+        super().__init__(daemon=True)
+        self.cam_id = cam_id
+        self.out_dir = out_dir
+        self.hub = hub
+        self.fps = fps
+        self.mode = mode
+        self.segment_frames = max(1, int(segment_s * fps))
+        self.on_segment = on_segment
+        self.running = True
+
+        self.path = None      # đoạn đang ghi (tên cuối cùng, chưa tồn tại tới khi đóng)
+        self.writer = None
+        self.index = None
+        self.segments = []    # các đoạn đã hoàn tất
+        self._seg_first = 0   # số thứ tự frame đầu tiên của đoạn hiện tại
+        self._seg_wall = None
+        self._seg_unique = 0
+
+        self.frames = 0       # số frame đã ghi (kể cả lặp)
+        self.duplicated = 0   # số frame lặp để giữ đúng nhịp
+        self.resyncs = 0
+
+    # --------------------------------------------------------
+    # Segment
+    # --------------------------------------------------------
+
+    def _open_segment(self, wall_ts: float):
+        self.path = unique_segment_path(self.out_dir, self.cam_id, wall_ts, file_ext(self.mode))
+        self.writer = open_writer(self.mode, part_path(self.path), self.fps)
+        self.writer.start_wall = wall_ts
+        self.index = FrameIndex(index_path(self.path))
+        self._seg_first = self.frames
+        self._seg_wall = wall_ts
+        self._seg_unique = 0
+
+    def _close_segment(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.index.close()
+        final = self.path
+        nframes = self.frames - self._seg_first
+        failed = getattr(self.writer, "failed", False)
+        self.writer = None
+        self.index = None
+        if not finalize_part(final, failed):
+            return
+        self.segments.append(final)
+        if self.on_segment is not None:
+            try:
+                self.on_segment(self.cam_id, final, {
+                    "start_ts": self._seg_wall,
+                    "duration_s": nframes / float(self.fps),
+                    "frames": nframes,
+                    "fps": self.fps,
+                    "mode": self.mode,
+                })
+            except Exception as e:
+                print(f"[RecorderThread] on_segment error {self.cam_id}: {e}")
+
+    def _write(self, pkt, new: bool, slot_wall: float):
+        if self.writer is None or self.frames - self._seg_first >= self.segment_frames:
+            self._close_segment()
+            self._open_segment(slot_wall)
+        try:
+            self._write_frame(pkt, new)
+        except EncoderDied as e:
+            # đóng đoạn hỏng, ghi tiếp vào file mới (tên khác, không ghi đè)
+            print(f"[RecorderThread] {self.cam_id}: {e}")
+            self._close_segment()
+            self._open_segment(slot_wall)
+            self._write_frame(pkt, new)
+
+    def _write_frame(self, pkt, new: bool):
+        if new or self._seg_unique == 0:
+            # frame đầu mỗi đoạn luôn có trong index (kể cả khi là frame lặp)
+            self.index.add(self.frames - self._seg_first,
+                           (self.frames - self._seg_first) / float(self.fps), pkt)
+            self._seg_unique += 1
+        if not new:
+            self.duplicated += 1
+        self.writer.write_packet(pkt)
+        self.frames += 1
+
+    def _sleep_until(self, target: float):
+        while self.running:
+            delay = target - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(min(delay, 0.5))
+
+    def run(self):
+        interval = 1.0 / float(self.fps)
+        start = None      # monotonic ứng với frame 0
+        start_wall = None
+        last_pkt = None
+
+        while self.running:
+            try:
+                # frame mới trong khoảng 1 slot; không có thì lặp frame trước
+                pkt = self.hub.get_latest(self.cam_id, max_age=interval, timeout=min(interval, 0.5))
+            except Exception as e:
+                pkt = None
+                if last_pkt is None:
+                    print(f"[RecorderThread] frame error {self.cam_id}: {e}")
+                    time.sleep(interval)
+                    continue
+
+            now = time.monotonic()
+            if start is None:
+                start = now
+                start_wall = time.time()
+
+            due = int((now - start) / interval) + 1  # số frame lẽ ra đã ghi tới lúc này
+            if due - self.frames > RESYNC_AFTER * self.fps:
+                # bị treo quá lâu: không chèn hàng nghìn frame lặp, nhịp mới tính từ đây
+                print(f"[RecorderThread] {self.cam_id} stalled {((due - self.frames) * interval):.0f}s, resync")
+                start = now - self.frames * interval
+                start_wall = time.time() - self.frames * interval
+                due = self.frames + 1
+                self.resyncs += 1
+
+            try:
+                is_new = pkt is not None and (last_pkt is None or pkt.seq != last_pkt.seq)
+                if is_new:
+                    # slot đã lỡ thuộc về frame trước, frame mới vào slot cuối
+                    while last_pkt is not None and self.frames < due - 1:
+                        self._write(last_pkt, False, start_wall + self.frames * interval)
+                    self._write(pkt, True, start_wall + self.frames * interval)
+                    last_pkt = pkt
+                while self.frames < due:
+                    self._write(last_pkt, False, start_wall + self.frames * interval)
+            except Exception as e:
+                print(f"[RecorderThread] write error {self.cam_id}: {e}")
+                self.running = False
+                break
+
+            self._sleep_until(start + self.frames * interval)
+
+        # cleanup khi dừng: đoạn cuối cũng được đóng + đổi tên như các đoạn khác
+        try:
+            self._close_segment()
+        except Exception as e:
+            print(f"[RecorderThread] close error {self.cam_id}: {e}")
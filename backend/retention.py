@@ -0,0 +1,173 @@
+# backend/retention.py
+#
+# Dọn data/recordings định kỳ để thẻ SD không bao giờ đầy:
+#   1. xoá đoạn ghi cũ hơn max_age_days,
+#   2. mỗi camera giữ tối đa quota_mb (xoá đoạn cũ nhất trước),
+#   3. ổ đĩa còn trống < min_free_mb -> tiếp tục xoá đoạn cũ nhất (mọi camera).
+# File .part.* là đoạn đang ghi -> không bao giờ đụng tới khi đang chạy;
+# lúc khởi động (mất điện giữa chừng) thì cứu .avi, bỏ .mp4 (thiếu moov, không mở được).
+
+import glob
+import os
+import shutil
+import threading
+import time
+
+from .recorder import index_path, is_part, parse_segment_name
+
+VIDEO_EXTS = (".mp4", ".avi")
+
+
+def recording_cam_id(path: str) -> str:
+    return parse_segment_name(path)[0]
+
+
+def _remove(path: str) -> int:
+    """Xoá video + file index đi kèm, trả số byte đã giải phóng."""
+    freed = 0
+    for p in (path, index_path(path)):
+        try:
+            freed += os.path.getsize(p)
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[RecordingJanitor] cannot remove {p}: {e}")
+    return freed
+
+
+class RecordingJanitor(threading.Thread):
+    """
+    record_dir: 1 thư mục hoặc list thư mục (video ghi liên tục + clip sự kiện),
+    quota mỗi camera tính chung cho mọi thư mục.
+    on_delete(path): gọi sau khi xoá 1 file (để catalog / UI cập nhật).
+    Giá trị 0 ở max_age_days / quota_mb / min_free_mb = tắt tiêu chí đó.
+    """
+    def __init__(self, record_dir, max_age_days: float = 7.0, quota_mb: float = 2048.0,
+                 min_free_mb: float = 500.0, interval: float = 60.0, on_delete=None):
+        super().__init__(daemon=True)
+        self.dirs = [record_dir] if isinstance(record_dir, str) else list(record_dir)
+        self.max_age_days = max_age_days
+        self.quota_mb = quota_mb
+        self.min_free_mb = min_free_mb
+        self.interval = interval
+        self.on_delete = on_delete
+        self._stop_evt = threading.Event()
+
+        self.last_run = None
+        self.deleted = 0
+        self.freed_mb = 0.0
+
+    def stop(self):
+        self._stop_evt.set()
+
+    def _segments(self):
+        """[(mtime, size, path)] các đoạn đã hoàn tất, cũ nhất trước."""
+        out = []
+        for d, ext in ((d, ext) for d in self.dirs for ext in VIDEO_EXTS):
+            for f in glob.glob(os.path.join(d, "*" + ext)):
+                if is_part(f):
+                    continue
+                try:
+                    st = os.stat(f)
+                except OSError:
+                    continue
+                out.append((st.st_mtime, st.st_size, f))
+        out.sort()
+        return out
+
+    def _delete_file(self, path: str, why: str):
+        freed = _remove(path)
+        self.deleted += 1
+        self.freed_mb += freed / 1e6
+        print(f"[RecordingJanitor] removed {os.path.basename(path)} ({why})")
+        if self.on_delete is not None:
+            try:
+                self.on_delete(path)
+            except Exception as e:
+                print(f"[RecordingJanitor] on_delete error: {e}")
+
+    def recover_parts(self):
+        """
+        Xử lý đoạn .part.* còn sót lại từ lần chạy trước.
+        Chỉ gọi lúc khởi động, trước khi có recorder nào chạy. Trả list file đã cứu.
+        """
+        recovered = []
+        for f in [f for d in self.dirs for f in glob.glob(os.path.join(d, "*.part.*"))]:
+            base, ext = os.path.splitext(f)
+            final = base[:-len(".part")] + ext
+            if ext == ".avi":
+                # AVI ghi tuần tự, bị cắt ngang vẫn xem được phần đã ghi
+                os.replace(f, final)
+                recovered.append(final)
+                print(f"[RecordingJanitor] recovered {os.path.basename(final)}")
+            else:
+                os.remove(f)
+                _remove(final)  # index đi kèm mang tên cuối cùng
+                print(f"[RecordingJanitor] dropped unfinished {os.path.basename(f)}")
+        return recovered
+
+    def _free_mb(self) -> float:
+        try:
+            return min(shutil.disk_usage(d).free for d in self.dirs) / 1e6
+        except OSError:
+            return float("inf")
+
+    def run_once(self):
+        now = time.time()
+        segments = self._segments()
+
+        if self.max_age_days > 0:
+            cutoff = now - self.max_age_days * 86400.0
+            for mtime, _, f in segments:
+                if mtime < cutoff:
+                    self._delete_file(f, "age")
+            segments = [s for s in segments if s[0] >= cutoff]
+
+        if self.quota_mb > 0:
+            per_cam = {}
+            for s in segments:
+                per_cam.setdefault(recording_cam_id(s[2]), []).append(s)
+            limit = self.quota_mb * 1e6
+            kept = []
+            for cam_segs in per_cam.values():
+                total = sum(size for _, size, _ in cam_segs)
+                for mtime, size, f in cam_segs:
+                    if total > limit:
+                        self._delete_file(f, "quota")
+                        total -= size
+                    else:
+                        kept.append((mtime, size, f))
+            segments = sorted(kept)
+
+        if self.min_free_mb > 0:
+            for _, _, f in segments:
+                if self._free_mb() >= self.min_free_mb:
+                    break
+                self._delete_file(f, "disk low")
+
+        self.last_run = now
+
+    def run(self):
+        while not self._stop_evt.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[RecordingJanitor] error: {e}")
+            self._stop_evt.wait(self.interval)
+
+    def status(self) -> dict:
+        usage = {}
+        for _, size, f in self._segments():
+            cam = recording_cam_id(f)
+            usage[cam] = usage.get(cam, 0.0) + size / 1e6
+        return {
+            "max_age_days": self.max_age_days,
+            "quota_mb_per_camera": self.quota_mb,
+            "min_free_mb": self.min_free_mb,
+            "free_mb": round(self._free_mb(), 1),
+            "usage_mb": {k: round(v, 1) for k, v in usage.items()},
+            "last_run": self.last_run,
+            "deleted": self.deleted,
+            "freed_mb": round(self.freed_mb, 1),
+        }
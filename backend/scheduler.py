@@ -0,0 +1,291 @@
+# backend/scheduler.py
+#
+# Detect người chạy nền phía server (không cần dashboard mở):
+#   - mỗi camera bật "detect_enabled" được detect theo "detect_fps" riêng,
+#   - kết quả dùng chung cho mọi viewer (cùng 1 frame không bao giờ detect 2 lần),
+#   - khi inference quá tải thì ưu tiên camera vừa có chuyển động / vừa có sự kiện,
+#   - mọi kết quả detect (nền / endpoint / live) đi qua tracker: event chỉ phát khi
+#     có người mới xuất hiện (track mới) hoặc đứng lâu, không phát lại mỗi frame,
+#   - có adaptive (backend/adaptive.py): chu kỳ detect tự giãn khi độ trễ vượt ngân sách.
+
+import threading
+import time
+from concurrent.futures import Future
+
+# camera có sự kiện / chuyển động trong khoảng này được ưu tiên khi quá tải
+EVENT_PRIORITY_WINDOW = 30.0
+MOTION_PRIORITY_WINDOW = 10.0
+
+
+class DetectionScheduler(threading.Thread):
+    """
+    results[cam_id] = {"seq", "ts", "boxes", "detected", "max_confidence", "packet",
+                       "events", "event_image"}
+    on_detection(cam_id, packet, boxes, events) -> đường dẫn ảnh event (hoặc None):
+    gọi khi tracker báo track mới / đứng lâu (server.py ghi event + phát còi).
+    Không có tracker thì mọi lần detect thấy người đều gọi on_detection.
+    """
+    def __init__(self, cameras: dict, hub, inference, on_detection=None,
+                 motion_gate=None, tracker=None, adaptive=None,
+                 max_inflight: int = 2, tick: float = 0.05):
+        super().__init__(daemon=True, name="detect-scheduler")
+        self.cameras = cameras
+        self.hub = hub
+        self.inference = inference
+        self.on_detection = on_detection
+        # motion_gate(cam_id, pkt) -> False nếu cảnh tĩnh (bỏ qua, không detect)
+        self.motion_gate = motion_gate
+        # tracker.update(cam_id, seq, ts, boxes) -> list event (backend/tracker.py)
+        self.tracker = tracker
+        # AdaptiveController: nhận độ trễ từng kết quả, trả hệ số giãn chu kỳ
+        self.adaptive = adaptive
+        self.max_inflight = max_inflight
+        self.tick = tick
+        self.running = True
+
+        self.lock = threading.Lock()
+        self.results = {}
+        self._inflight = {}    # cam_id -> (seq, Future)
+        self._next_due = {}
+        self.last_motion = {}  # cam_id -> ts (stage motion gating cập nhật)
+        self.last_event = {}   # cam_id -> ts
+        self.skipped = {}      # số lần bị hoãn vì quá tải
+        self.static_skipped = {}  # số frame bỏ qua vì không có chuyển động
+
+    # --------------------------------------------------------
+    # Detect dùng chung (endpoint / live / chạy nền đều qua đây)
+    # --------------------------------------------------------
+
+    def detect_packet(self, cam_id: str, pkt, timeout: float = 10.0):
+        """
+        Detect 1 FramePacket, trả về list box.
+        - frame này đã có kết quả -> trả luôn,
+        - frame này đang được detect -> chờ chung kết quả đó,
+        - ngược lại gửi INFERENCE.
+        """
+        fut = self._submit(cam_id, pkt)
+        if isinstance(fut, list):
+            return fut
+        return fut.result(timeout=timeout)
+
+    def _cached(self, cam_id: str, pkt):
+        # gọi khi đang giữ self.lock
+        res = self.results.get(cam_id)
+        if res is not None and res["seq"] == pkt.seq:
+            return res["boxes"]
+        inflight = self._inflight.get(cam_id)
+        if inflight is not None and inflight[0] == pkt.seq:
+            return inflight[1]
+        return None
+
+    def _submit(self, cam_id: str, pkt):
+        with self.lock:
+            hit = self._cached(cam_id, pkt)
+        if hit is not None:
+            return hit
+
+        frame = pkt.bgr()  # decode ngoài lock
+        with self.lock:
+            hit = self._cached(cam_id, pkt)
+            if hit is not None:
+                return hit
+            inner = self.inference.submit(cam_id, frame)
+            # Future trả cho caller chỉ xong sau khi đã lưu kết quả + chạy tracker,
+            # nên caller đọc latest_result() thấy ngay event của frame này
+            fut = Future()
+            self._inflight[cam_id] = (pkt.seq, fut)
+
+        inner.add_done_callback(lambda f: self._on_done(cam_id, pkt, f, fut))
+        return fut
+
+    def _on_done(self, cam_id: str, pkt, inner, fut):
+        with self.lock:
+            inflight = self._inflight.get(cam_id)
+            if inflight is not None and inflight[1] is fut:
+                del self._inflight[cam_id]
+        if inner.exception() is not None:
+            fut.set_exception(inner.exception())
+            return
+
+        boxes = inner.result()
+        if self.adaptive is not None:
+            self.adaptive.observe(cam_id, time.time() - pkt.ts)
+        with self.lock:
+            prev = self.results.get(cam_id)
+            newer = prev is None or prev["seq"] < pkt.seq
+            if newer:
+                self.results[cam_id] = {
+                    "seq": pkt.seq,
+                    "ts": pkt.ts,
+                    "boxes": boxes,
+                    "detected": len(boxes) > 0,
+                    "max_confidence": max([b["conf"] for b in boxes], default=0.0),
+                    "packet": pkt,
+                    "events": [],
+                    "event_image": None,
+                }
+
+        events = []
+        if newer:
+            if self.tracker is not None:
+                events = self.tracker.update(cam_id, pkt.seq, pkt.ts, boxes)
+            elif boxes:
+                events = [{"track_id": None, "reason": "detection", "bbox": b["bbox"],
+                           "conf": b["conf"], "dwell_s": 0.0} for b in boxes]
+
+        if events and self.on_detection is not None:
+            image = None
+            try:
+                image = self.on_detection(cam_id, pkt, boxes, events)
+            except Exception as e:
+                print(f"[DetectionScheduler] on_detection error {cam_id}: {e}")
+            with self.lock:
+                res = self.results.get(cam_id)
+                if res is not None and res["seq"] == pkt.seq:
+                    res["events"] = events
+                    res["event_image"] = image
+
+        fut.set_result(boxes)
+
+    def latest_result(self, cam_id: str, max_age: float = None):
+        with self.lock:
+            res = self.results.get(cam_id)
+        if res is None:
+            return None
+        if max_age is not None and time.time() - res["ts"] > max_age:
+            return None
+        return res
+
+    def inflight_count(self) -> int:
+        with self.lock:
+            return len(self._inflight)
+
+    # --------------------------------------------------------
+    # Lập lịch chạy nền
+    # --------------------------------------------------------
+
+    def note_motion(self, cam_id: str):
+        self.last_motion[cam_id] = time.time()
+
+    def note_event(self, cam_id: str):
+        self.last_event[cam_id] = time.time()
+
+    def priority(self, cam_id: str) -> int:
+        now = time.time()
+        p = 0
+        if now - self.last_event.get(cam_id, 0.0) < EVENT_PRIORITY_WINDOW:
+            p += 2
+        if now - self.last_motion.get(cam_id, 0.0) < MOTION_PRIORITY_WINDOW:
+            p += 1
+        return p
+
+    def base_interval(self, cam_id: str) -> float:
+        cam = self.cameras.get(cam_id) or {}
+        fps = float(cam.get("detect_fps", 2.0) or 2.0)
+        return 1.0 / max(0.1, min(fps, 10.0))
+
+    def interval(self, cam_id: str) -> float:
+        base = self.base_interval(cam_id)
+        if self.adaptive is None:
+            return base
+        return base * self.adaptive.interval_factor(self.priority(cam_id))
+
+    def demand_fps(self) -> float:
+        return sum(1.0 / self.interval(cam_id)
+                   for cam_id, cam in list(self.cameras.items())
+                   if cam.get("detect_enabled", False))
+
+    def _due_cameras(self):
+        now = time.time()
+        due = []
+        for cam_id, cam in list(self.cameras.items()):
+            if not cam.get("detect_enabled", False):
+                continue
+            if now < self._next_due.get(cam_id, 0.0):
+                continue
+            with self.lock:
+                if cam_id in self._inflight:
+                    continue
+            due.append(cam_id)
+        return due
+
+    def _run_one(self, cam_id: str):
+        try:
+            pkt = self.hub.get_latest(cam_id, max_age=1.0, timeout=0.5)
+        except Exception:
+            # camera lỗi -> thử lại chậm hơn, không chặn các camera khác
+            self._next_due[cam_id] = time.time() + 2.0
+            return
+
+        with self.lock:
+            res = self.results.get(cam_id)
+        if res is not None and res["seq"] == pkt.seq:
+            # frame này đã detect rồi (ví dụ viewer live AI vừa chạy)
+            return
+
+        if self.motion_gate is not None and not self.motion_gate(cam_id, pkt):
+            # cảnh tĩnh -> không tốn 1 lần YOLO
+            self.static_skipped[cam_id] = self.static_skipped.get(cam_id, 0) + 1
+            return
+
+        fut = self._submit(cam_id, pkt)
+        if isinstance(fut, list):
+            return
+        fut.add_done_callback(lambda f: self._on_background_done(cam_id, f))
+
+    def _on_background_done(self, cam_id: str, fut):
+        # event / còi đã xử lý trong _on_done (qua tracker), ở đây chỉ log lỗi
+        if fut.exception() is not None:
+            print(f"[DetectionScheduler] {cam_id} detect error: {fut.exception()}")
+
+    def run(self):
+        while self.running:
+            if not self.inference.ready():
+                # detector đang load / warm-up -> chưa lập lịch gì
+                time.sleep(0.5)
+                continue
+            if self.adaptive is not None:
+                self.adaptive.step(self.demand_fps())
+            due = self._due_cameras()
+            if due:
+                free = self.max_inflight - self.inflight_count()
+                if free < len(due):
+                    # quá tải: camera ưu tiên cao chạy trước, còn lại hoãn 1 chu kỳ
+                    due.sort(key=self.priority, reverse=True)
+                    for cam_id in due[max(free, 0):]:
+                        self.skipped[cam_id] = self.skipped.get(cam_id, 0) + 1
+                        self._next_due[cam_id] = time.time() + self.interval(cam_id)
+                    due = due[:max(free, 0)]
+
+                for cam_id in due:
+                    self._next_due[cam_id] = time.time() + self.interval(cam_id)
+                    try:
+                        self._run_one(cam_id)
+                    except Exception as e:
+                        print(f"[DetectionScheduler] {cam_id} error: {e}")
+
+            time.sleep(self.tick)
+
+    def stop(self):
+        self.running = False
+
+    def status(self):
+        out = {}
+        for cam_id, cam in list(self.cameras.items()):
+            res = self.latest_result(cam_id)
+            out[cam_id] = {
+                "enabled": bool(cam.get("detect_enabled", False)),
+                "fps": float(cam.get("detect_fps", 2.0) or 2.0),
+                "effective_fps": round(1.0 / self.interval(cam_id), 2),
+                "lag_ms": self.adaptive.lag_ms(cam_id) if self.adaptive is not None else None,
+                "roi": cam.get("roi"),
+                "infer_size": cam.get("infer_size", 640),
+                "priority": self.priority(cam_id),
+                "skipped": self.skipped.get(cam_id, 0),
+                "static_skipped": self.static_skipped.get(cam_id, 0),
+                "last_result_ts": res["ts"] if res else None,
+                "detected": res["detected"] if res else False,
+                "max_confidence": res["max_confidence"] if res else 0.0,
+                "tracks": self.tracker.status(cam_id) if self.tracker is not None else [],
+            }
+        return out
@@ -1,8 +1,9 @@
 # backend/server.py (ở top)
-from .detector import build_detector
-from fastapi import FastAPI, HTTPException
+from .detector import build_detector, BaseDetector
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse, Response
 from fastapi.responses import StreamingResponse, FileResponse
+import asyncio
 import base64
 from fastapi import Query, Request
 import cv2
@@ -12,23 +13,83 @@ import time
 import os
 import threading
 from datetime import datetime
-
-from .state import SYSTEM_STATE, list_recordings, EVENT_DIR, save_cameras
-from .utils import save_event_image, play_alarm_sound
+from urllib.parse import urlsplit, urlunsplit
+
+from .state import SYSTEM_STATE, EVENT_DIR, save_cameras, INFER_WORKERS, DB_PATH
+from .state import DETECTOR_BACKEND, MODEL_PATH, MODEL_PRECISION, DETECT_CONF, DETECT_LAG_BUDGET
+from .state import RECORD_BACKEND, SEGMENT_SECONDS, RETENTION_DAYS, QUOTA_MB_PER_CAMERA, MIN_FREE_MB
+from .state import CLIP_DIR, CLIP_FPS, PREROLL_SECONDS, POSTROLL_SECONDS, CLIP_MAX_SECONDS
+from .state import EVENT_IMAGE_MODE, EVENT_FSYNC
+from .utils import play_alarm_sound, draw_timestamp
+from .frame_hub import FrameHub
+from .inference import BatchInferenceService, ProcessInferenceService, DetectorWarming
+from .mjpeg import iter_mjpeg_frames
+from .camera_client import AsyncCameraClient, sid_headers, LOGIN_TTL, RELOGIN_GRACE
+from .health import CameraHealthMonitor
+from .scheduler import DetectionScheduler
+from .motion import MotionGateRegistry
+from .tracker import TrackerRegistry
+from .adaptive import AdaptiveController
+from .recorder import RecorderThread, resolve_mode, find_offset
+from .retention import RecordingJanitor
+from .event_clips import EventClipManager
+from .db import Database
+from .catalog import RecordingCatalog
+from .event_store import EventStore, EventWriter
+from .image_writer import EventImageWriter, make_thumbnail, thumb_path, write_atomic
+from .preprocess import Preprocessor
+from .media import MediaResponse
+from .media_index import MediaIndex, media_id
 
 app = FastAPI(title="Security Backend Demo")
 
 
-# Khởi tạo bộ dò người (mock YOLO trên Windows)
-detector = build_detector()
+# Cắt ROI + letterbox trước khi detect (cấu hình "roi" / "infer_size" theo camera)
+PREPROCESS = Preprocessor(SYSTEM_STATE["cameras"])
+
+# Backend detector chọn qua SSS_DETECTOR / SSS_MODEL_PATH / SSS_MODEL_PRECISION
+DETECTOR_CFG = {
+    "backend": DETECTOR_BACKEND,
+    "model_path": MODEL_PATH,
+    "precision": MODEL_PRECISION,
+    "conf_thres": DETECT_CONF,
+}
+
+# Chỉ dùng annotate() (vẽ khung) ở process API; model thật được load ở nền
+detector = BaseDetector()
+
+if INFER_WORKERS > 0:
+    # Model chạy trong các worker process
+    INFERENCE = ProcessInferenceService(workers=INFER_WORKERS, max_batch=4, preprocessor=PREPROCESS,
+                                        detector_cfg=DETECTOR_CFG)
+else:
+    # Gom frame từ nhiều camera thành batch trước khi chạy detector
+    # (mock YOLO trên Windows nếu không có ultralytics)
+    INFERENCE = BatchInferenceService(lambda: build_detector(**DETECTOR_CFG), max_batch=4,
+                                      window_ms=20.0, preprocessor=PREPROCESS)
+
+
+@app.on_event("startup")
+def _startup_inference():
+    # Load model + warm-up ở nền: server trả lời request ngay, không chờ import torch
+    INFERENCE.start()
+
+
+@app.get("/api/detector/status")
+def api_detector_status():
+    """
+    Trạng thái detector: state = loading | warming | ready | error,
+    kèm thời gian load model (s) và warm-up (ms).
+    """
+    return INFERENCE.readiness()
 
 # Ghi hình đang chạy (theo camera_id)
 # {
 #   "cam1": {
-#        "thread": <RecorderThread>,
-#        "path": "data/recordings/cam1_20251026_224500.mp4",
+#        "thread": <RecorderThread>,   # thread.path = đoạn đang ghi, thread.segments = đoạn đã xong
 #        "fps": 10,
-#        "start_ts": "20251026_224500"
+#        "start_ts": "20251026_224500",
+#        "mode": "ffmpeg"
 #   },
 #   ...
 # }
@@ -37,16 +98,81 @@ RECORDERS = {}
 RECORD_DIR = os.path.join("data", "recordings")
 os.makedirs(RECORD_DIR, exist_ok=True)
 
+# SQLite dùng chung (WAL) + danh mục video: /api/recordings không còn glob + stat cả thư mục
+DB = Database(DB_PATH)
+CATALOG = RecordingCatalog(DB, {"recording": RECORD_DIR, "clip": CLIP_DIR})
+# Event phát hiện người (200 event mới nhất giữ thêm trong RAM)
+EVENTS = EventStore(DB, hot_size=200)
+# ID -> file cho các endpoint trả ảnh / video (URL không chứa đường dẫn thật)
+MEDIA = MediaIndex()
+
+
+def _rebuild_media_index():
+    MEDIA.rebuild(lambda: (EVENTS.image_paths(), CATALOG.paths()))
+
+
+def _on_video_finalized(kind: str):
+    """Đoạn ghi / clip ghi xong -> vào catalog + MEDIA."""
+    add_to_catalog = CATALOG.on_finalized(kind)
+
+    def _cb(cam_id: str, path: str, meta: dict):
+        add_to_catalog(cam_id, path, meta)
+        MEDIA.add("video", path)
+    return _cb
+
+
+def _on_video_deleted(path: str):
+    CATALOG.remove(path)
+    MEDIA.remove(path)
+
+
+# Dọn video cũ theo tuổi / quota mỗi camera / dung lượng trống (backend/retention.py)
+JANITOR = RecordingJanitor(
+    [RECORD_DIR, CLIP_DIR],
+    max_age_days=RETENTION_DAYS,
+    quota_mb=QUOTA_MB_PER_CAMERA,
+    min_free_mb=MIN_FREE_MB,
+    on_delete=_on_video_deleted,
+)
+
+
+def _sync_catalog():
+    # file chép vào / xoá khỏi thư mục lúc server tắt: cập nhật MEDIA theo từng file, không dựng lại
+    CATALOG.sync(on_add=lambda path: MEDIA.add("video", path), on_remove=MEDIA.remove)
+
+
+@app.on_event("startup")
+def _startup_janitor():
+    # cứu đoạn .part.* của lần chạy trước, rồi đồng bộ catalog với ổ đĩa ở nền
+    # (file chép tay vào / xoá tay khỏi thư mục)
+    try:
+        JANITOR.recover_parts()
+    except Exception as e:
+        print(f"[RecordingJanitor] recover error: {e}")
+    _rebuild_media_index()
+    threading.Thread(target=_sync_catalog, daemon=True, name="catalog-sync").start()
+    JANITOR.start()
+
+
+@app.get("/api/retention/status")
+def api_retention_status():
+    """
+    Chính sách giữ video + dung lượng đang dùng mỗi camera (MB) + số file đã xoá.
+    """
+    return JANITOR.status()
+
 # ============================================================
 # Helper: đăng nhập ESP32-CAM và giữ session SID
 # ============================================================
 
-def camera_login(cam_id: str) -> bool:
+def camera_login(cam_id: str, force: bool = False) -> bool:
     """
     Đảm bảo camera cam_id đã đăng nhập và session có cookie SID hợp lệ.
     - Dùng POST /login với user/pass đã khai báo trong SYSTEM_STATE.
-    - Lưu cookie SID vào requests.Session() của camera.
-    - Không login lại liên tục: nếu mới login <60s trước -> bỏ qua.
+    - Lưu SID vào cam["sid"] (dùng chung với AsyncCameraClient, vì firmware
+      chỉ giữ 1 session tại 1 thời điểm).
+    - Không login lại liên tục: nếu mới login <60s trước -> bỏ qua
+      (trừ khi force=True, ví dụ camera vừa trả 302 vì SID hết hạn).
     """
     cam = SYSTEM_STATE["cameras"].get(cam_id)
     if cam is None:
@@ -55,10 +181,12 @@ def camera_login(cam_id: str) -> bool:
     sess = cam["session"]
 
     # tránh spam login: nếu login <60s trước thì coi như còn hiệu lực
-    if time.time() - cam.get("last_login", 0) < 60:
+    # (force: chỉ bỏ qua nếu bên khác vừa login lại xong -> dùng SID mới đó)
+    since = time.time() - cam.get("last_login", 0)
+    if since < (RELOGIN_GRACE if force else LOGIN_TTL) and cam.get("sid"):
         return True
 
-    login_url = cam["host"] + "/login"
+    login_url = cam["host"].strip() + "/login"
 
     data = {
         "user": cam["username"],
@@ -70,6 +198,9 @@ def camera_login(cam_id: str) -> bool:
         r = sess.post(login_url, data=data, timeout=2.0, allow_redirects=False)
         # Nếu login ok, firmware trả 302 -> /ui hoặc /first-change (hoặc 200)
         if r.status_code in (200, 302):
+            sid = r.cookies.get("SID") or sess.cookies.get("SID")
+            if sid:
+                cam["sid"] = sid
             cam["last_login"] = time.time()
             return True
         else:
@@ -95,115 +226,159 @@ def camera_get(cam_id: str, path: str, params=None, timeout=2.0):
         raise HTTPException(status_code=500, detail="camera login failed")
 
     sess = cam["session"]
-    full_url = cam["host"] + path
+    full_url = cam["host"].strip() + path
 
     try:
-        r = sess.get(full_url, params=params, timeout=timeout, allow_redirects=False)
+        r = sess.get(full_url, params=params, headers=sid_headers(cam),
+                     timeout=timeout, allow_redirects=False)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"camera request failed: {e}")
 
     # Nếu session SID hết hạn -> camera trả 302 về /login
     if r.status_code == 302:
-        if not camera_login(cam_id):
+        if not camera_login(cam_id, force=True):
             raise HTTPException(status_code=500, detail="camera re-login failed")
-        r = cam["session"].get(full_url, params=params, timeout=timeout, allow_redirects=False)
+        r = cam["session"].get(full_url, params=params, headers=sid_headers(cam),
+                               timeout=timeout, allow_redirects=False)
 
     return r
 
 
-def fetch_frame_bgr(cam_id: str):
+def fetch_frame_jpeg(cam_id: str) -> bytes:
     """
-    Lấy 1 frame BGR từ camera (dùng /capture). Raise nếu lỗi.
+    Lấy 1 ảnh JPEG (bytes) trực tiếp từ camera qua /capture. Raise nếu lỗi.
+    CHỈ FRAME_HUB gọi hàm này; các endpoint/recorder đọc frame qua FRAME_HUB.
     """
     # gọi /capture qua camera_get (tự xử lý login/302)
     r = camera_get(cam_id, "/capture", timeout=2.0)
     if r.status_code != 200:
         raise RuntimeError(f"capture failed status={r.status_code}")
+    return r.content
 
-    jpg_bytes = r.content
-    img_arr = np.frombuffer(jpg_bytes, dtype=np.uint8)
-    frame = cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
 
-    if frame is None:
-        raise RuntimeError("decode failed (frame is None)")
+def _stream_url_candidates(cam: dict):
+    """
+    Các URL MJPEG có thể có của camera:
+      - "stream_url" khai báo trong cameras.json (nếu có),
+      - <host>/stream       (fake_cam: stream cùng port với API),
+      - <host>:81/stream    (firmware ESP32: stream server chạy port 81).
+    """
+    if cam.get("stream_url"):
+        return [cam["stream_url"].strip()]
 
-    return frame
+    host = cam["host"].strip().rstrip("/")
+    urls = [host + "/stream"]
+    parts = urlsplit(host)
+    if parts.hostname and parts.port is None:
+        netloc = f"{parts.hostname}:81"
+        urls.append(urlunsplit((parts.scheme, netloc, parts.path, "", "")) + "/stream")
+    return urls
 
 
-# ============================================================
-# RecorderThread: ghi video có timestamp
-# ============================================================
+def open_frame_stream(cam_id: str):
+    """
+    Mở 1 kết nối MJPEG lâu dài tới camera (dùng chung cookie SID với camera_get).
+    Trả về generator JPEG bytes, hoặc None nếu camera cấu hình ingest_mode="capture".
+    Raise nếu không URL nào mở được -> FRAME_HUB fallback sang /capture.
+    """
+    cam = SYSTEM_STATE["cameras"].get(cam_id)
+    if cam is None:
+        raise HTTPException(status_code=404, detail="camera not found")
 
-class RecorderThread(threading.Thread):
-    def __init__(self, cam_id: str, out_path: str, fps: int = 10):
-        super().__init__(daemon=True)
-        self.cam_id = cam_id
-        self.out_path = out_path
-        self.fps = fps
-        self.running = True
-        self.writer = None
-
-    def draw_timestamp(self, frame_bgr):
-        """
-        Vẽ timestamp ở góc dưới trái của frame.
-        """
-        ts_text = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        scale = 0.5
-        thickness = 1
-        color = (0, 255, 0)  # xanh lá cho dễ nhìn
-        # vị trí: x=10, y=đáy-10
-        x = 10
-        y = frame_bgr.shape[0] - 10
-        cv2.putText(
-            frame_bgr,
-            ts_text,
-            (x, y),
-            font,
-            scale,
-            color,
-            thickness,
-            cv2.LINE_AA
-        )
-        return frame_bgr
+    if cam.get("ingest_mode", "auto") == "capture":
+        return None
+
+    if not camera_login(cam_id):
+        raise HTTPException(status_code=500, detail="camera login failed")
 
-    def run(self):
-        interval = 1.0 / float(self.fps)
+    # URL đã chạy được lần trước thì thử trước
+    urls = _stream_url_candidates(cam)
+    if cam.get("_stream_url") in urls:
+        urls.remove(cam["_stream_url"])
+        urls.insert(0, cam["_stream_url"])
 
-        while self.running:
+    last_err = None
+    for url in urls:
+        try:
+            # timeout=(connect, read): read timeout để phát hiện stream bị treo
+            r = cam["session"].get(url, stream=True, headers=sid_headers(cam),
+                                   timeout=(2.0, 5.0), allow_redirects=False)
+        except Exception as e:
+            last_err = e
+            continue
+
+        if r.status_code == 302:
+            # SID hết hạn -> login lại rồi thử URL này thêm 1 lần
+            r.close()
+            if not camera_login(cam_id, force=True):
+                raise HTTPException(status_code=500, detail="camera re-login failed")
             try:
-                frame = fetch_frame_bgr(self.cam_id)
+                r = cam["session"].get(url, stream=True, headers=sid_headers(cam),
+                                       timeout=(2.0, 5.0), allow_redirects=False)
             except Exception as e:
-                print(f"[RecorderThread] frame error {self.cam_id}: {e}")
-                time.sleep(interval)
+                last_err = e
                 continue
 
-            # vẽ timestamp lên frame
-            frame_with_ts = self.draw_timestamp(frame.copy())
+        if r.status_code != 200:
+            r.close()
+            last_err = f"{url} status={r.status_code}"
+            continue
+
+        try:
+            frames = iter_mjpeg_frames(r)
+        except Exception as e:
+            last_err = f"{url}: {e}"
+            continue
+
+        cam["_stream_url"] = url
+        return frames
+
+    raise RuntimeError(f"no MJPEG stream ({last_err})")
+
 
-            # khởi tạo VideoWriter khi biết kích thước frame
-            if self.writer is None:
-                h, w = frame_with_ts.shape[:2]
-                fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-                self.writer = cv2.VideoWriter(
-                    self.out_path,
-                    fourcc,
-                    self.fps,
-                    (w, h)
-                )
-                if not self.writer.isOpened():
-                    print("[RecorderThread] cannot open VideoWriter for", self.out_path)
-                    self.running = False
-                    break
+# Mỗi camera 1 luồng ingest duy nhất, mọi consumer đọc chung frame mới nhất
+FRAME_HUB = FrameHub(fetch_frame_jpeg, open_stream=open_frame_stream)
 
-            # ghi frame
-            self.writer.write(frame_with_ts)
 
-            time.sleep(interval)
+def fetch_frame_bgr(cam_id: str):
+    """
+    Lấy frame BGR mới nhất của camera từ FRAME_HUB. Raise nếu lỗi.
+    Array trả về được chia sẻ giữa các consumer -> không vẽ trực tiếp lên nó.
+    """
+    return FRAME_HUB.get_latest(cam_id).bgr()
+
+
+# RecorderThread (ghi video có timestamp) nằm ở backend/recorder.py
+
+
+# Client async (keep-alive pool) cho các endpoint gọi camera: /status, /servo, ...
+CAMERA_CLIENT = AsyncCameraClient(SYSTEM_STATE["cameras"])
+
+# Probe online/offline ở nền, /api/cameras đọc từ cache
+HEALTH = CameraHealthMonitor(
+    CAMERA_CLIENT,
+    SYSTEM_STATE["cameras"],
+    interval=5.0,
+    recent_frame_age=FRAME_HUB.frame_age,
+)
+
 
-        # cleanup khi dừng
-        if self.writer is not None:
-            self.writer.release()
+@app.on_event("startup")
+async def _startup_camera_io():
+    HEALTH.start()
+
+
+@app.on_event("shutdown")
+async def _shutdown_camera_io():
+    SCHEDULER.stop()
+    EVENT_WRITER.stop()
+    IMAGE_WRITER.stop()
+    CLIPS.stop_all()
+    JANITOR.stop()
+    await HEALTH.stop()
+    FRAME_HUB.stop_all()
+    INFERENCE.stop()
+    await CAMERA_CLIENT.aclose()
 
 
 # ============================================================
@@ -240,25 +415,18 @@ def api_cameras():
     """
     Trả về camera list (không lộ password).
     Giao diện Live & Control dùng cái này.
+    Trạng thái online lấy từ cache của HEALTH (probe nền), không gọi camera ở đây.
     """
     cams_out = []
     for cam_id, cam_info in SYSTEM_STATE["cameras"].items():
-        host = cam_info["host"]
-
-        # kiểm tra online bằng cách thử /status
-        online = False
-        try:
-            r = camera_get(cam_id, "/status", timeout=1.5)
-            if r.status_code == 200:
-                online = True
-        except Exception as e:
-            print(f"[api_cameras] {cam_id} offline: {e}")
-            online = False
-
+        health = HEALTH.get(cam_id)
         cams_out.append({
             "cam_id": cam_id,
-            "host": host,
-            "online": online,
+            "host": cam_info["host"],
+            "online": health["online"],
+            "last_seen": health["last_seen"],
+            "latency_ms": health["latency_ms"],
+            "last_check": health["last_check"],
             "pan": cam_info["pan"],
             "tilt": cam_info["tilt"]
         })
@@ -266,6 +434,14 @@ def api_cameras():
     return {"cameras": cams_out}
 
 
+@app.get("/api/ingest/status")
+def api_ingest_status():
+    """
+    Trạng thái các luồng ingest của FRAME_HUB (debug: seq, tuổi frame, lỗi gần nhất).
+    """
+    return {"ingest": FRAME_HUB.status()}
+
+
 @app.get("/api/cameras_full")
 def api_cameras_full():
     """
@@ -320,11 +496,14 @@ def api_add_camera(payload: dict):
         "tilt_ch": 2,
         "pan": 90,
         "tilt": 90,
-        "last_login": 0.0
+        "last_login": 0.0,
+        "ingest_mode": payload.get("ingest_mode", "auto"),
+        "stream_url": payload.get("stream_url")
     }
 
     # LƯU XUỐNG DISK
     save_cameras(SYSTEM_STATE["cameras"])
+    HEALTH.reset(cam_id)
 
     return {"status": "ok", "msg": f"{cam_id} added"}
 
@@ -349,6 +528,12 @@ def api_remove_camera(payload: dict):
         rec["thread"].join(timeout=1.0)
         del RECORDERS[cam_id]
 
+    # dừng pre-roll trước, nếu không nó lại khởi động ingest của camera
+    CLIPS.forget(cam_id)
+    FRAME_HUB.stop(cam_id)
+    HEALTH.reset(cam_id)
+    MOTION.forget(cam_id)
+    TRACKER.forget(cam_id)
     del SYSTEM_STATE["cameras"][cam_id]
 
     # LƯU XUỐNG DISK
@@ -362,7 +547,7 @@ def api_remove_camera(payload: dict):
 # ============================================================
 
 @app.post("/api/servo/{cam_id}")
-def api_servo(cam_id: str, payload: dict):
+async def api_servo(cam_id: str, payload: dict):
     """
     Điều khiển pan/tilt servo (ESP32-CAM).
     Sau khi chỉnh pan/tilt thành công -> lưu cameras.json
@@ -375,13 +560,13 @@ def api_servo(cam_id: str, payload: dict):
     tilt = int(payload.get("tilt", cam["tilt"]))
 
     try:
-        r1 = camera_get(
+        r1 = await CAMERA_CLIENT.get(
             cam_id,
             "/servo",
             params={"ch": cam.get("pan_ch", 1), "val": pan},
             timeout=1.0
         )
-        r2 = camera_get(
+        r2 = await CAMERA_CLIENT.get(
             cam_id,
             "/servo",
             params={"ch": cam.get("tilt_ch", 2), "val": tilt},
@@ -421,129 +606,160 @@ def api_toggle_alarm(payload: dict):
 # ============================================================
 
 @app.get("/api/events")
-def api_events():
-    return {"events": SYSTEM_STATE["events"]}
+def api_events(cam_id: str | None = None, start: float | None = None, end: float | None = None,
+               min_conf: float | None = None, limit: int = 50, cursor: int | None = None):
+    """
+    Event phát hiện người, mới nhất trước.
+    - cam_id: lọc theo camera; start / end: epoch; min_conf: độ tin cậy tối thiểu
+    - limit: số event mỗi trang (tối đa 500); cursor: next_cursor của trang trước
+    """
+    events, next_cursor = EVENTS.query(
+        cam_id=cam_id, start=start, end=end, min_conf=min_conf,
+        limit=max(1, min(limit, 500)), cursor=cursor,
+    )
+    return {"events": events, "next_cursor": next_cursor}
+
+
+# Ảnh event / thumbnail có tên duy nhất và không bao giờ bị ghi đè
+# -> browser được cache lâu, hỏi lại thì trả 304 theo ETag.
+IMAGE_CACHE_CONTROL = "public, max-age=604800, immutable"
+
+
+def _cached_image_response(path: str):
+    return MediaResponse(path, "image/jpeg", cache_control=IMAGE_CACHE_CONTROL)
+
+
+def _event_image_ready(path: str) -> bool:
+    if not os.path.isfile(path):
+        # ảnh của event vừa xảy ra có thể vẫn đang trong hàng đợi ghi
+        IMAGE_WRITER.wait_written(path, timeout=2.0)
+    return os.path.isfile(path)
+
+
+def _resolve_media(mid: str, kind: str) -> str:
+    path = MEDIA.resolve(mid, kind)
+    if path is None and kind == "image" and EVENT_WRITER.flush(timeout=2.0):
+        # ảnh của event vừa xảy ra: ID có sau khi EVENT_WRITER ghi event vào DB
+        path = MEDIA.resolve(mid, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="not found")
+    return path
 
 
 @app.get("/api/event_image")
-def api_event_image(path: str):
-    if os.path.isfile(path):
-        return FileResponse(path, media_type="image/jpeg")
+def api_event_image(mid: str = Query(..., alias="id")):
+    """Ảnh event theo img_id (xem /api/events)."""
+    path = _resolve_media(mid, "image")
+    if _event_image_ready(path):
+        return _cached_image_response(path)
     raise HTTPException(status_code=404, detail="not found")
 
 
+@app.get("/api/event_thumb")
+def api_event_thumb(mid: str = Query(..., alias="id")):
+    """
+    Thumbnail (rộng 240px) của ảnh event, tạo sẵn lúc ghi ảnh.
+    Event cũ chưa có thumbnail -> tạo 1 lần rồi lưu lại.
+    """
+    path = _resolve_media(mid, "image")
+    tpath = thumb_path(path)
+    if not os.path.isfile(tpath):
+        if not _event_image_ready(path):
+            raise HTTPException(status_code=404, detail="not found")
+        try:
+            with open(path, "rb") as f:
+                write_atomic(tpath, make_thumbnail(jpeg=f.read()))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"thumbnail error: {e}")
+    return _cached_image_response(tpath)
+
+
 # ============================================================
 # RECORDINGS (DANH SÁCH VIDEO)
 # ============================================================
 
+def _query_catalog(kind: str, cam_id, start, end, limit: int, cursor):
+    try:
+        items, next_cursor = CATALOG.query(
+            cam_id=cam_id, kind=kind, start=start, end=end,
+            limit=max(1, min(limit, 500)), cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return items, next_cursor
+
+
 @app.get("/api/recordings")
-def api_recordings():
+def api_recordings(cam_id: str | None = None, start: float | None = None, end: float | None = None,
+                   limit: int = 50, cursor: str | None = None):
     """
-    Liệt kê các file .mp4 đã ghi trong data/recordings
-    (bao gồm cả các file vừa dừng ghi).
+    Liệt kê video đã ghi (các đoạn đã hoàn tất), mới nhất trước, từ catalog SQLite.
+    - cam_id: lọc theo camera; start / end: epoch, lọc theo giờ bắt đầu đoạn
+    - limit: số dòng mỗi trang (tối đa 500); cursor: next_cursor của trang trước
     """
-    return {"recordings": list_recordings()}
+    items, next_cursor = _query_catalog("recording", cam_id, start, end, limit, cursor)
+    return {"recordings": items, "next_cursor": next_cursor, "cameras": CATALOG.cameras()}
 
 
-@app.get("/api/download_video")
-def api_download_video(file: str):
-    if os.path.isfile(file):
-        filename_only = os.path.basename(file)
-        return FileResponse(file, media_type="video/mp4", filename=filename_only)
-    raise HTTPException(status_code=404, detail="not found")
+@app.get("/api/clips")
+def api_clips(cam_id: str | None = None, start: float | None = None, end: float | None = None,
+              limit: int = 50, cursor: str | None = None):
+    """
+    Liệt kê các clip sự kiện (pre-roll + post-roll), tham số như /api/recordings.
+    """
+    items, next_cursor = _query_catalog("clip", cam_id, start, end, limit, cursor)
+    return {"clips": items, "next_cursor": next_cursor, "cameras": CATALOG.cameras()}
 
-from fastapi.responses import StreamingResponse
 
-@app.get("/api/preview_video")
-def api_preview_video(request: Request, file: str = Query(...)):
+@app.get("/api/recordings/seek")
+def api_recordings_seek(ts: float, mid: str = Query(..., alias="id")):
+    """
+    Tua theo giờ thực: trả vị trí (giây) trong video `id` (media_id trong /api/recordings)
+    của frame chụp lúc `ts` (epoch), dựa trên file index <video>.idx.csv ghi kèm lúc record.
     """
-    Stream video/mp4 với hỗ trợ HTTP Range (206 Partial Content)
-    để trình duyệt trong Streamlit có thể play/tua bình thường.
+    path = _resolve_media(mid, "video")
+    offset = find_offset(path, ts)
+    if offset is None:
+        raise HTTPException(status_code=404, detail="timestamp not in recording")
+    return {"id": mid, "ts": ts, "offset_s": offset}
 
-    - Nếu browser gửi header Range: bytes=start-end
-      -> trả 206 + Content-Range + Content-Length, chỉ gửi đoạn đó.
-    - Nếu không có Range
-      -> trả full file (200).
 
-    Thêm Access-Control-Allow-Origin: * để cho phép phát chéo cổng
-    (UI chạy port 8501, backend port 8000).
-    """
+def _video_media_type(path: str) -> str:
+    # mode "copy" ghi MJPEG trong .avi
+    return "video/x-msvideo" if path.lower().endswith(".avi") else "video/mp4"
 
-    if not os.path.isfile(file):
-        raise HTTPException(status_code=404, detail="not found")
 
-    file_size = os.path.getsize(file)
-    range_header = request.headers.get("range")
-
-    def iter_file_range(start: int, end: int):
-        """đọc file từ byte start..end (inclusive) và yield ra chunk"""
-        with open(file, "rb") as f:
-            f.seek(start)
-            bytes_to_read = end - start + 1
-            chunk_size = 1024 * 1024  # 1MB
-            while bytes_to_read > 0:
-                read_chunk = f.read(min(chunk_size, bytes_to_read))
-                if not read_chunk:
-                    break
-                bytes_to_read -= len(read_chunk)
-                yield read_chunk
-
-    # Nếu client yêu cầu Range (ví dụ "bytes=0-")
-    if range_header:
-        # ví dụ "bytes=1000-2000" hoặc "bytes=1000-"
-        # Ta parse thô cho đơn giản
-        try:
-            units, rng = range_header.split("=")
-            if units.strip().lower() != "bytes":
-                raise ValueError("Not bytes range")
-            start_str, end_str = rng.split("-")
-            start = int(start_str) if start_str else 0
-            end = int(end_str) if end_str else file_size - 1
-        except Exception:
-            # Range header lỗi -> fallback full file
-            start = 0
-            end = file_size - 1
-
-        if end >= file_size:
-            end = file_size - 1
-        if start < 0:
-            start = 0
-
-        content_length = end - start + 1
-
-        resp = StreamingResponse(
-            iter_file_range(start, end),
-            media_type="video/mp4",
-            status_code=206,  # quan trọng! báo partial content
-        )
+# Đoạn video đã ghi xong không bao giờ bị sửa (chỉ bị xoá) -> cache 1 ngày, ETag để hỏi lại rẻ
+VIDEO_CACHE_CONTROL = "public, max-age=86400"
 
-        resp.headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-        resp.headers["Accept-Ranges"] = "bytes"
-        resp.headers["Content-Length"] = str(content_length)
-        resp.headers["Access-Control-Allow-Origin"] = "*"
-        resp.headers["Cache-Control"] = "no-cache"
-        return resp
 
-    # Không có Range header -> trả full file
-    def iter_file_full():
-        with open(file, "rb") as f:
-            while True:
-                data = f.read(1024 * 1024)
-                if not data:
-                    break
-                yield data
-
-    resp = StreamingResponse(
-        iter_file_full(),
-        media_type="video/mp4",
-        status_code=200,
-    )
-    resp.headers["Content-Length"] = str(file_size)
-    resp.headers["Accept-Ranges"] = "bytes"
-    resp.headers["Access-Control-Allow-Origin"] = "*"
-    resp.headers["Cache-Control"] = "no-cache"
-    return resp
+@app.api_route("/api/download_video", methods=["GET", "HEAD"])
+def api_download_video(mid: str = Query(..., alias="id")):
+    path = _resolve_media(mid, "video")
+    return MediaResponse(path, _video_media_type(path), filename=os.path.basename(path),
+                         cache_control=VIDEO_CACHE_CONTROL)
+
+
+@app.api_route("/api/preview_video", methods=["GET", "HEAD"])
+def api_preview_video(mid: str = Query(..., alias="id")):
+    """
+    Phát video/mp4 `id` (media_id trong /api/recordings, clip_id trong /api/events)
+    trong browser (Streamlit), hỗ trợ tua:
+    - Range: bytes=start-end -> 206 + Content-Range (nhiều đoạn -> multipart/byteranges),
+      đoạn nằm ngoài file -> 416,
+    - If-None-Match / If-Modified-Since -> 304 khi browser đã có bản cache,
+    - đọc file theo khối 1MB (xem backend/media.py về ASGI server hỗ trợ gửi zero-copy).
 
+    Thêm Access-Control-Allow-Origin: * để cho phép phát chéo cổng
+    (UI chạy port 8501, backend port 8000).
+    """
+    path = _resolve_media(mid, "video")
+    return MediaResponse(
+        path,
+        _video_media_type(path),
+        cache_control=VIDEO_CACHE_CONTROL,
+        headers={"Access-Control-Allow-Origin": "*"},
+    )
 
 
 # ============================================================
@@ -554,8 +770,13 @@ def api_preview_video(request: Request, file: str = Query(...)):
 def api_record_start(cam_id: str, payload: dict | None = None):
     """
     Bắt đầu ghi hình từ camera cam_id.
-    Tự động chèn timestamp vào mỗi frame (góc dưới).
-    payload (optional): { "fps": 8 }  # mặc định 10fps, giới hạn 1..10
+    Tự động chèn timestamp vào mỗi frame (góc dưới), trừ mode "copy".
+    Video được chia đoạn SSS_SEGMENT_SECONDS giây: {cam_id}_{YYYYmmdd_HHMMSS}.mp4 mỗi đoạn,
+    đoạn chỉ xuất hiện trong /api/recordings khi đã ghi xong.
+    payload (optional): {
+      "fps": 8,          # mặc định 10fps, giới hạn 1..10
+      "mode": "ffmpeg"   # auto | ffmpeg | copy | opencv (mặc định SSS_RECORD_BACKEND)
+    }
     """
     cam = SYSTEM_STATE["cameras"].get(cam_id)
     if not cam:
@@ -573,35 +794,40 @@ def api_record_start(cam_id: str, payload: dict | None = None):
     if fps > 10:
         fps = 10
 
+    mode = resolve_mode((payload or {}).get("mode") or RECORD_BACKEND)
+
     # nếu đã ghi rồi thì báo luôn
     if cam_id in RECORDERS:
         return {
             "status": "already_recording",
-            "file": RECORDERS[cam_id]["path"],
+            "file": RECORDERS[cam_id]["thread"].path,
             "fps": RECORDERS[cam_id]["fps"],
-            "start_ts": RECORDERS[cam_id]["start_ts"]
+            "start_ts": RECORDERS[cam_id]["start_ts"],
+            "mode": RECORDERS[cam_id]["mode"]
         }
 
     ts = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"{cam_id}_{ts}.mp4"
-    out_path = os.path.join(RECORD_DIR, filename)
     os.makedirs(RECORD_DIR, exist_ok=True)
 
-    rec_thread = RecorderThread(cam_id, out_path, fps=fps)
+    rec_thread = RecorderThread(cam_id, RECORD_DIR, FRAME_HUB, fps=fps, mode=mode,
+                                segment_s=SEGMENT_SECONDS,
+                                on_segment=_on_video_finalized("recording"))
     rec_thread.start()
 
     RECORDERS[cam_id] = {
         "thread": rec_thread,
-        "path": out_path,
         "fps": fps,
-        "start_ts": ts
+        "start_ts": ts,
+        "mode": mode
     }
 
     return {
         "status": "recording_started",
-        "file": out_path,
+        "dir": RECORD_DIR,
+        "segment_s": SEGMENT_SECONDS,
         "fps": fps,
-        "start_ts": ts
+        "start_ts": ts,
+        "mode": mode
     }
 
 
@@ -615,14 +841,16 @@ def api_record_stop(cam_id: str):
 
     rec = RECORDERS[cam_id]
     rec["thread"].running = False
-    rec["thread"].join(timeout=1.0)
-    final_file = rec["path"]
+    # ffmpeg cần vài giây để đóng file (ghi moov / faststart)
+    rec["thread"].join(timeout=10.0)
+    segments = list(rec["thread"].segments)
 
     del RECORDERS[cam_id]
 
     return {
         "status": "recording_stopped",
-        "file": final_file
+        "file": segments[-1] if segments else None,
+        "segments": segments
     }
 
 
@@ -635,9 +863,15 @@ def api_record_status():
     for cid, rec in RECORDERS.items():
         out.append({
             "cam_id": cid,
-            "file": rec["path"],
+            "file": rec["thread"].path,
             "fps": rec["fps"],
-            "start_ts": rec["start_ts"]
+            "start_ts": rec["start_ts"],
+            "mode": rec["mode"],
+            "encoder": getattr(rec["thread"].writer, "encoder", None),
+            "segments": len(rec["thread"].segments),
+            "alive": rec["thread"].is_alive(),
+            "frames": rec["thread"].frames,
+            "duplicated": rec["thread"].duplicated
         })
     return {"active_recordings": out}
 
@@ -652,7 +886,8 @@ def api_detect_frame(cam_id: str):
     - Chụp 1 frame từ camera.
     - Chạy detect người bằng detector (YOLO mock hoặc YOLO thật sau này).
     - Luôn trả JSON, kể cả khi lỗi.
-    - Nếu phát hiện người -> lưu event + còi.
+    - Người mới xuất hiện (track mới) / đứng lâu -> lưu ảnh + event + còi
+      (qua tracker của SCHEDULER; người đứng yên không sinh event mỗi lần gọi).
     """
     try:
         cam = SYSTEM_STATE["cameras"].get(cam_id)
@@ -668,7 +903,8 @@ def api_detect_frame(cam_id: str):
 
         # LẤY FRAME
         try:
-            frame = fetch_frame_bgr(cam_id)
+            pkt = FRAME_HUB.get_latest(cam_id)
+            frame = pkt.bgr()
         except HTTPException as e:
             return {
                 "detected": False,
@@ -686,32 +922,36 @@ def api_detect_frame(cam_id: str):
                 "note": f"camera error: {e}"
             }
 
-        # DETECT
-        boxes = detector.detect_person(frame)
+        # DETECT (dùng chung kết quả nếu frame này vừa được detect).
+        # Event + ảnh + còi do tracker quyết định (on_detection_event), chỉ khi có track mới.
+        try:
+            boxes = SCHEDULER.detect_packet(cam_id, pkt)
+        except DetectorWarming as e:
+            return {
+                "detected": False,
+                "boxes": [],
+                "max_confidence": 0.0,
+                "saved_image": None,
+                "note": f"detector warming ({e})"
+            }
         detected = len(boxes) > 0
         max_conf = max([b["conf"] for b in boxes], default=0.0)
 
-        # LƯU ẢNH SỰ KIỆN
-        annotated_frame = detector.annotate(frame, boxes)
-        saved_path = save_event_image(cam_id, annotated_frame)
-        
-        # Nếu phát hiện người -> ghi event + phát còi
-        if detected:
-            SYSTEM_STATE["events"].insert(0, {
-                "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "cam_id": cam_id,
-                "img_path": saved_path,
-                "confidence": max_conf
-            })
-            if SYSTEM_STATE["alarm_enabled"]:
-                play_alarm_sound()
+        res = SCHEDULER.latest_result(cam_id)
+        events = []
+        saved_path = None
+        if res is not None and res["seq"] == pkt.seq:
+            events = res["events"]
+            saved_path = res["event_image"]
 
         # JSON trả về
         return {
             "detected": detected,
             "boxes": boxes,
             "max_confidence": max_conf,
-            "saved_image": saved_path,
+            "saved_image": saved_path,   # chỉ có khi frame này sinh event mới
+            "saved_image_id": media_id(saved_path),   # dùng cho /api/event_image?id=
+            "events": events,
             "note": ""  # chuỗi rỗng = không lỗi
         }
 
@@ -725,6 +965,261 @@ def api_detect_frame(cam_id: str):
             "note": f"internal error: {e}"
         }
 
+def _prepare_event(job: dict) -> dict:
+    """
+    Chạy ở EVENT_WRITER trước khi ghi event: bắt đầu / nối dài clip sự kiện
+    (mở encoder + ghi pre-roll) nếu camera bật event_record.
+    clip_path: file chỉ có sau khi clip ghi xong.
+    """
+    job["clip_path"] = CLIPS.trigger(job["cam_id"], job["ts"])
+    return job
+
+
+def _on_event_added(ev: dict):
+    # chỉ đưa ảnh vào MEDIA sau khi event đã nằm trong DB: index dựng lại lúc startup khớp với DB
+    MEDIA.add("image", ev["img_path"])
+    SCHEDULER.note_event(ev["cam_id"])
+    play_alarm_with_cooldown()
+
+
+# Ghi event (SQLite) + clip + còi ở luồng nền
+EVENT_WRITER = EventWriter(EVENTS, prepare=_prepare_event, on_added=_on_event_added)
+
+
+@app.on_event("startup")
+def _startup_event_writer():
+    EVENT_WRITER.start()
+
+
+def on_detection_event(cam_id: str, pkt, boxes, events):
+    """
+    DetectionScheduler gọi khi tracker báo người mới xuất hiện / đứng lâu
+    (bất kể detect từ nền, endpoint hay live; frame không có người thì không tới đây).
+    Chạy trên luồng nhận kết quả inference nên chỉ xếp hàng rồi trả ngay:
+    ảnh -> IMAGE_WRITER, event + clip sự kiện + còi -> EVENT_WRITER.
+    reason: "new" (người mới xuất hiện) | "dwell" (đứng lâu).
+    Trả đường dẫn ảnh (file có sau vài trăm ms).
+    """
+    max_conf = max([e["conf"] for e in events], default=0.0)
+    reason = "new" if any(e["reason"] == "new" for e in events) else events[0]["reason"]
+    saved_path = IMAGE_WRITER.submit(cam_id, pkt, [dict(b) for b in boxes])
+    EVENT_WRITER.submit(cam_id, max_conf, reason=reason,
+                        track_ids=[e["track_id"] for e in events],
+                        img_path=saved_path, ts=pkt.ts)
+    return saved_path
+
+
+# Ghi ảnh event ở luồng nền (SSS_EVENT_IMAGE = annotated | raw, SSS_EVENT_FSYNC = batch | always | never)
+IMAGE_WRITER = EventImageWriter(EVENT_DIR, mode=EVENT_IMAGE_MODE, fsync=EVENT_FSYNC,
+                                annotate=detector.annotate)
+
+
+@app.on_event("startup")
+def _startup_image_writer():
+    IMAGE_WRITER.start()
+
+
+# Clip sự kiện: ring JPEG pre-roll trong RAM cho camera bật event_record
+CLIPS = EventClipManager(
+    SYSTEM_STATE["cameras"],
+    FRAME_HUB,
+    CLIP_DIR,
+    fps=CLIP_FPS,
+    preroll_s=PREROLL_SECONDS,
+    postroll_s=POSTROLL_SECONDS,
+    max_clip_s=CLIP_MAX_SECONDS,
+    mode=resolve_mode(RECORD_BACKEND),
+    on_clip=_on_video_finalized("clip"),
+)
+
+
+@app.on_event("startup")
+def _startup_clips():
+    CLIPS.sync()
+
+
+@app.get("/api/event_record/status/{cam_id}")
+def api_event_record_status(cam_id: str):
+    """
+    Trạng thái ghi clip sự kiện: số giây / KB pre-roll đang giữ, clip đang ghi, số clip đã ghi.
+    """
+    if cam_id not in SYSTEM_STATE["cameras"]:
+        raise HTTPException(status_code=404, detail="camera not found")
+    return CLIPS.status(cam_id)
+
+
+@app.post("/api/event_record/config/{cam_id}")
+def api_event_record_config(cam_id: str, payload: dict):
+    """
+    Bật/tắt ghi clip sự kiện cho camera.
+    payload: { "enabled": true }
+    Bật -> camera được ingest liên tục để giữ pre-roll (tốn băng thông Wi-Fi, không tốn CPU encode).
+    """
+    cam = SYSTEM_STATE["cameras"].get(cam_id)
+    if not cam:
+        raise HTTPException(status_code=404, detail="camera not found")
+    cam["event_record"] = bool(payload.get("enabled", False))
+    save_cameras(SYSTEM_STATE["cameras"])
+    CLIPS.sync()
+    return {"status": "ok", "cam_id": cam_id, **CLIPS.status(cam_id)}
+
+
+# Lọc chuyển động trước YOLO (cấu hình "motion" theo từng camera)
+MOTION = MotionGateRegistry(SYSTEM_STATE["cameras"])
+
+# Gán track_id cho người qua các frame: 1 người = 1 event (+1 nếu đứng quá 60s)
+TRACKER = TrackerRegistry(SYSTEM_STATE["cameras"], dwell_s=60.0)
+
+# Giữ độ trễ detect dưới SSS_DETECT_LAG_BUDGET: giãn chu kỳ / giảm kích thước ảnh khi quá tải
+ADAPTIVE = AdaptiveController(INFERENCE, lag_budget=DETECT_LAG_BUDGET)
+
+# Detect người chạy nền theo detect_enabled / detect_fps của từng camera
+SCHEDULER = DetectionScheduler(
+    SYSTEM_STATE["cameras"],
+    FRAME_HUB,
+    INFERENCE,
+    on_detection=on_detection_event,
+    motion_gate=MOTION.check,
+    tracker=TRACKER,
+    adaptive=ADAPTIVE,
+)
+MOTION.on_motion = SCHEDULER.note_motion
+# track sống theo chu kỳ detect thực tế (quá tải -> giãn tới 8x) chứ không theo detect_fps cấu hình
+TRACKER.interval = SCHEDULER.interval
+PREPROCESS.size_limit = lambda cam_id: ADAPTIVE.infer_size(SCHEDULER.priority(cam_id))
+
+
+@app.on_event("startup")
+def _startup_scheduler():
+    SCHEDULER.start()
+
+
+@app.get("/api/detect/status")
+def api_detect_status():
+    """
+    Trạng thái detect nền từng camera (bật/tắt, fps, ưu tiên, kết quả gần nhất)
+    + trạng thái detector (loading / warming / ready / error)
+    + bộ điều chỉnh tải (độ trễ, hệ số giãn chu kỳ, kích thước ảnh hiện tại)
+    + hàng đợi ghi ảnh event.
+    """
+    return {
+        "cameras": SCHEDULER.status(),
+        "detector": INFERENCE.readiness()["state"],
+        "adaptive": ADAPTIVE.status(),
+        "image_writer": IMAGE_WRITER.status(),
+        "event_writer": EVENT_WRITER.status(),
+    }
+
+
+@app.get("/api/motion/status/{cam_id}")
+def api_motion_status(cam_id: str):
+    """
+    Cấu hình + trạng thái bộ lọc chuyển động của camera (score = tỉ lệ pixel thay đổi).
+    """
+    if cam_id not in SYSTEM_STATE["cameras"]:
+        raise HTTPException(status_code=404, detail="camera not found")
+    return MOTION.status(cam_id)
+
+
+@app.post("/api/motion/config/{cam_id}")
+def api_motion_config(cam_id: str, payload: dict):
+    """
+    Cấu hình lọc chuyển động trước YOLO.
+    payload: {
+      "enabled": true,
+      "sensitivity": 0.5,   # 0..1, càng cao càng nhạy
+      "mask": [ [[x,y], [x,y], [x,y], ...], ... ]   # polygon bỏ qua, toạ độ 0..1
+    }
+    """
+    cam = SYSTEM_STATE["cameras"].get(cam_id)
+    if not cam:
+        raise HTTPException(status_code=404, detail="camera not found")
+
+    cfg = MOTION.config(cam_id)
+    if "enabled" in payload:
+        cfg["enabled"] = bool(payload["enabled"])
+    try:
+        if "sensitivity" in payload:
+            cfg["sensitivity"] = max(0.0, min(float(payload["sensitivity"]), 1.0))
+        if "mask" in payload:
+            cfg["mask"] = [
+                [[float(x), float(y)] for x, y in poly]
+                for poly in (payload["mask"] or [])
+            ]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="bad motion config")
+
+    cam["motion"] = cfg
+    save_cameras(SYSTEM_STATE["cameras"])
+    return {"status": "ok", "cam_id": cam_id, "motion": cfg}
+
+
+@app.post("/api/detect/config/{cam_id}")
+def api_detect_config(cam_id: str, payload: dict):
+    """
+    Bật/tắt detect nền cho camera, chỉnh tần suất và vùng detect.
+    payload: {
+      "enabled": true,
+      "fps": 2,                              # giới hạn 0.1..10
+      "roi": [[x,y], [x,y], [x,y], ...],     # polygon toạ độ 0..1, null = cả khung hình
+      "infer_size": 640                      # cạnh dài ảnh đưa vào model, 160..1280
+    }
+    """
+    cam = SYSTEM_STATE["cameras"].get(cam_id)
+    if not cam:
+        raise HTTPException(status_code=404, detail="camera not found")
+
+    if "enabled" in payload:
+        cam["detect_enabled"] = bool(payload["enabled"])
+    if "fps" in payload:
+        try:
+            cam["detect_fps"] = max(0.1, min(float(payload["fps"]), 10.0))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="bad fps")
+    if "roi" in payload:
+        try:
+            roi = [[max(0.0, min(float(x), 1.0)), max(0.0, min(float(y), 1.0))]
+                   for x, y in (payload["roi"] or [])]
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="bad roi")
+        if roi and len(roi) < 3:
+            raise HTTPException(status_code=400, detail="roi needs at least 3 points")
+        cam["roi"] = roi or None
+    if "infer_size" in payload:
+        try:
+            size = int(payload["infer_size"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="bad infer_size")
+        cam["infer_size"] = max(160, min(size, 1280)) // 32 * 32
+
+    save_cameras(SYSTEM_STATE["cameras"])
+    return {
+        "status": "ok",
+        "cam_id": cam_id,
+        "enabled": cam.get("detect_enabled", False),
+        "fps": cam.get("detect_fps", 2.0),
+        "roi": cam.get("roi"),
+        "infer_size": cam.get("infer_size", 640),
+    }
+
+
+def play_alarm_with_cooldown(cooldown: float = 1.0):
+    """
+    Phát còi nếu báo động đang bật, tối đa 1 lần mỗi `cooldown` giây
+    (nhiều camera cùng có người mới thì không beep dồn dập).
+    """
+    if not SYSTEM_STATE.get("alarm_enabled", True):
+        return
+    now = time.time()
+    last = SYSTEM_STATE.get("last_alarm_ts", 0.0)
+    if now - last > cooldown:
+        try:
+            play_alarm_sound()
+        except Exception as e:
+            print(f"[alarm] play_alarm_sound error: {e}")
+        SYSTEM_STATE["last_alarm_ts"] = now
+
+
 #-------------------------------------------
 # DETECT VÀ TRẢ VỀ ẢNH ANNOTATE DẠNG BASE64
 #-------------------------------------------
@@ -732,8 +1227,8 @@ def api_detect_frame(cam_id: str):
 def api_detect_only_frame(cam_id: str):
     """
     - Lấy 1 frame từ camera.
-    - Chạy detector.detect_person + detector.annotate.
-    - KHÔNG lưu event, KHÔNG thêm vào SYSTEM_STATE["events"].
+    - Chạy detect người (qua SCHEDULER, dùng chung kết quả) + detector.annotate.
+    - KHÔNG lưu ảnh, KHÔNG tự ghi event (event do tracker / SCHEDULER quyết định).
     - Có phát còi báo động nếu phát hiện người (kèm cooldown để đỡ kêu điên cuồng).
     - Trả JSON: {detected, max_confidence, annotated_jpeg_b64, note}
     """
@@ -747,9 +1242,10 @@ def api_detect_only_frame(cam_id: str):
             "note": f"camera {cam_id} not found"
         }
 
-    # 1) Lấy frame JPEG từ camera (/capture)
+    # 1) Lấy frame mới nhất từ FRAME_HUB (không gọi /capture riêng)
     try:
-        r = camera_get(cam_id, "/capture", timeout=2.0)
+        pkt = FRAME_HUB.get_latest(cam_id)
+        frame = pkt.bgr()
     except HTTPException as e:
         return {
             "detected": False,
@@ -767,30 +1263,18 @@ def api_detect_only_frame(cam_id: str):
             "note": f"camera error: {e}"
         }
 
-    if r.status_code != 200:
-        return {
-            "detected": False,
-            "boxes": [],
-            "max_confidence": 0.0,
-            "annotated_jpeg_b64": None,
-            "note": f"capture failed status={r.status_code}"
-        }
-
-    jpg_bytes = r.content
-    img_arr = np.frombuffer(jpg_bytes, dtype=np.uint8)
-    frame = cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
-
-    if frame is None:
+    # 2) Chạy AI detect người (dùng chung kết quả với detect nền / viewer khác)
+    try:
+        boxes = SCHEDULER.detect_packet(cam_id, pkt)
+    except DetectorWarming as e:
+        # model chưa sẵn sàng: trả ảnh gốc, UI vẫn hiển thị được
         return {
             "detected": False,
             "boxes": [],
             "max_confidence": 0.0,
-            "annotated_jpeg_b64": None,
-            "note": "decode failed (frame is None)"
+            "annotated_jpeg_b64": base64.b64encode(pkt.jpeg).decode("utf-8"),
+            "note": f"detector warming ({e})"
         }
-
-    # 2) Chạy AI detect người
-    boxes = detector.detect_person(frame)
     detected = len(boxes) > 0
     max_conf = max([b["conf"] for b in boxes], default=0.0)
 
@@ -804,17 +1288,8 @@ def api_detect_only_frame(cam_id: str):
     else:
         b64 = base64.b64encode(enc_jpg.tobytes()).decode("utf-8")
 
-    # 5) Phát còi báo động nếu có người và báo động đang bật,
-    #    dùng cooldown để không beep mỗi frame
-    if detected and SYSTEM_STATE.get("alarm_enabled", True):
-        now = time.time()
-        last = SYSTEM_STATE.get("last_alarm_ts", 0.0)
-        if now - last > 1.0:  # cooldown 1 giây
-            try:
-                play_alarm_sound()
-            except Exception as e:
-                print(f"[alarm] play_alarm_sound error: {e}")
-            SYSTEM_STATE["last_alarm_ts"] = now
+    # 5) Còi báo động: tracker tự phát khi có người mới (on_detection_event),
+    #    không beep lại mỗi frame cho cùng 1 người
 
     # 6) Trả kết quả cho UI
     return {
@@ -830,23 +1305,196 @@ def api_detect_only_frame(cam_id: str):
 # -----------------------------------------------------------
 
 @app.get("/api/stream_frame/{cam_id}")
-def api_stream_frame(cam_id: str):
+def api_stream_frame(cam_id: str, width: int | None = None, overlay: bool = False):
     """
     Lấy 1 frame "live" từ camera, không lưu, không detect.
     Trả về image/jpeg bytes để UI hiển thị gần realtime.
+
+    - Mặc định: trả NGUYÊN bytes JPEG camera gửi (không decode / encode lại).
+    - width=<px>: thu nhỏ về chiều rộng này (chỉ khi nhỏ hơn ảnh gốc).
+    - overlay=true: vẽ timestamp lên ảnh.
+    Chỉ khi có width/overlay mới phải decode + encode.
     """
     cam = SYSTEM_STATE["cameras"].get(cam_id)
     if not cam:
         raise HTTPException(status_code=404, detail="camera not found")
 
     try:
-        frame = fetch_frame_bgr(cam_id)
+        pkt = FRAME_HUB.get_latest(cam_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"camera error: {e}")
 
+    headers = {
+        "Cache-Control": "no-store",
+        "X-Frame-Seq": str(pkt.seq),
+        "X-Frame-Ts": f"{pkt.ts:.3f}",
+    }
+
+    if not width and not overlay:
+        return Response(content=pkt.jpeg, media_type="image/jpeg", headers=headers)
+
+    try:
+        frame = pkt.bgr()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"camera error: {e}")
+
+    h, w = frame.shape[:2]
+    if width and 0 < width < w:
+        new_h = max(1, int(round(h * width / float(w))))
+        frame = cv2.resize(frame, (width, new_h), interpolation=cv2.INTER_AREA)
+    elif overlay:
+        frame = frame.copy()  # không vẽ lên frame dùng chung của FRAME_HUB
+
+    if overlay:
+        draw_timestamp(frame, pkt.ts)
+
     # mã hóa BGR -> JPEG
     ok, jpg_buf = cv2.imencode(".jpg", frame)
     if not ok:
         raise HTTPException(status_code=500, detail="jpeg encode failed")
 
-    return Response(content=jpg_buf.tobytes(), media_type="image/jpeg")
+    return Response(content=jpg_buf.tobytes(), media_type="image/jpeg", headers=headers)
+
+
+# -----------------------------------------------------------
+# LIVE STREAM ĐẨY TỪ SERVER (MJPEG / WEBSOCKET)
+# -----------------------------------------------------------
+
+MJPEG_BOUNDARY = "sssliveframe"
+
+
+def _annotate_live_frame(cam_id: str, pkt):
+    """
+    Chạy detect + vẽ khung trên 1 frame live (chạy trong thread).
+    Trả về (jpeg_bytes, meta_dict). Lỗi detect -> trả ảnh gốc + note.
+    """
+    meta = {"cam_id": cam_id, "seq": pkt.seq, "detected": False, "max_confidence": 0.0, "note": ""}
+    try:
+        frame = pkt.bgr()
+        if MOTION.check(cam_id, pkt):
+            boxes = SCHEDULER.detect_packet(cam_id, pkt)
+        else:
+            # cảnh tĩnh: khung của lần detect gần nhất vẫn đúng, khỏi chạy YOLO
+            last = SCHEDULER.latest_result(cam_id)
+            boxes = last["boxes"] if last else []
+        annotated = detector.annotate(frame, boxes)
+        ok, enc_jpg = cv2.imencode(".jpg", annotated)
+        if not ok:
+            raise RuntimeError("jpeg encode failed")
+    except DetectorWarming as e:
+        meta["note"] = f"detector warming ({e})"
+        return pkt.jpeg, meta
+    except Exception as e:
+        meta["note"] = f"detect error: {e}"
+        return pkt.jpeg, meta
+
+    meta["detected"] = len(boxes) > 0
+    meta["max_confidence"] = max([b["conf"] for b in boxes], default=0.0)
+    meta["track_ids"] = [b["track_id"] for b in boxes if "track_id" in b]
+    return enc_jpg.tobytes(), meta
+
+
+async def _iter_live_packets(cam_id: str, fps: float):
+    """
+    Async generator: yield frame mới nhất của camera, tối đa `fps` frame/giây.
+    Frame đến nhanh hơn fps thì bỏ qua (luôn gửi frame mới nhất, không dồn hàng đợi).
+    """
+    interval = 1.0 / max(0.5, min(float(fps), 30.0))
+    last_seq = 0
+    next_send = time.monotonic()
+    while cam_id in SYSTEM_STATE["cameras"]:
+        pkt = await FRAME_HUB.wait_next_async(cam_id, last_seq, timeout=2.0)
+        if pkt is None:
+            continue
+        last_seq = pkt.seq
+        yield pkt
+
+        next_send += interval
+        delay = next_send - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            next_send = time.monotonic()
+
+
+@app.get("/api/live/{cam_id}")
+async def api_live(cam_id: str, request: Request, fps: float = 10.0, ai: bool = False):
+    """
+    Live MJPEG (multipart/x-mixed-replace) của 1 camera trên 1 kết nối HTTP.
+    Dùng trực tiếp được trong <img src="..."> hoặc VLC.
+    ai=true: vẽ khung người lên từng frame (kèm còi có cooldown).
+    """
+    if cam_id not in SYSTEM_STATE["cameras"]:
+        raise HTTPException(status_code=404, detail="camera not found")
+
+    async def gen():
+        async for pkt in _iter_live_packets(cam_id, fps):
+            if await request.is_disconnected():
+                break
+            jpeg = pkt.jpeg
+            if ai:
+                jpeg, _ = await asyncio.to_thread(_annotate_live_frame, cam_id, pkt)
+            yield (
+                f"--{MJPEG_BOUNDARY}\r\n"
+                f"Content-Type: image/jpeg\r\n"
+                f"Content-Length: {len(jpeg)}\r\n"
+                f"X-Cam-Id: {cam_id}\r\n\r\n"
+            ).encode("utf-8") + jpeg + b"\r\n"
+
+    headers = {
+        "Cache-Control": "no-cache, private",
+        "Pragma": "no-cache",
+        "Access-Control-Allow-Origin": "*",
+    }
+    return StreamingResponse(
+        gen(),
+        media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+        headers=headers,
+    )
+
+
+@app.websocket("/ws/live")
+async def ws_live(websocket: WebSocket, cams: str = "", fps: float = 10.0, ai: bool = False):
+    """
+    Live nhiều camera trên 1 kết nối WebSocket: /ws/live?cams=cam1,cam2&fps=10&ai=1
+    - Message binary: b"<cam_id>\\n" + bytes JPEG.
+    - ai=1: trước mỗi frame có thêm 1 message text JSON
+      {cam_id, seq, detected, max_confidence, note}.
+    """
+    await websocket.accept()
+    cam_ids = [c for c in cams.split(",") if c in SYSTEM_STATE["cameras"]]
+    if not cam_ids:
+        await websocket.close(code=1008, reason="no valid camera")
+        return
+
+    send_lock = asyncio.Lock()
+
+    async def pump(cam_id: str):
+        prefix = cam_id.encode("utf-8") + b"\n"
+        try:
+            async for pkt in _iter_live_packets(cam_id, fps):
+                jpeg, meta = pkt.jpeg, None
+                if ai:
+                    jpeg, meta = await asyncio.to_thread(_annotate_live_frame, cam_id, pkt)
+                async with send_lock:
+                    if meta is not None:
+                        await websocket.send_json(meta)
+                    await websocket.send_bytes(prefix + jpeg)
+        except (WebSocketDisconnect, RuntimeError):
+            # client đóng kết nối giữa chừng
+            pass
+
+    async def wait_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = [asyncio.create_task(pump(c)) for c in cam_ids]
+    tasks.append(asyncio.create_task(wait_disconnect()))
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in tasks:
+            t.cancel()
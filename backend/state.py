@@ -1,12 +1,51 @@
-import os, time, glob, json, requests
+import os, json, requests
 
 DATA_DIR = "data"
 EVENT_DIR = os.path.join(DATA_DIR, "events")
 RECORD_DIR = os.path.join(DATA_DIR, "recordings")
+CLIP_DIR = os.path.join(DATA_DIR, "clips")
 CAMERA_CONFIG_PATH = os.path.join(DATA_DIR, "cameras.json")
+# SQLite dùng chung (catalog video, ...) -- xem backend/db.py
+DB_PATH = os.environ.get("SSS_DB_PATH") or os.path.join(DATA_DIR, "sss.db")
+
+# Số process chạy AI detect riêng (0 = chạy ngay trong process backend).
+# Ví dụ trên Pi 4: SSS_INFER_WORKERS=2
+INFER_WORKERS = int(os.environ.get("SSS_INFER_WORKERS", "0"))
+
+# Chọn detector: auto | ultralytics | onnx | opencv | mock
+# Ví dụ trên Pi (không cài torch): SSS_DETECTOR=onnx SSS_MODEL_PRECISION=int8
+DETECTOR_BACKEND = os.environ.get("SSS_DETECTOR", "auto").lower()
+# Đường dẫn model (trống -> yolov8n.onnx / yolov8n_fp16.onnx / yolov8n_int8.onnx theo precision)
+MODEL_PATH = os.environ.get("SSS_MODEL_PATH") or None
+MODEL_PRECISION = os.environ.get("SSS_MODEL_PRECISION", "fp32").lower()  # fp32 | fp16 | int8
+DETECT_CONF = float(os.environ.get("SSS_DETECT_CONF", "0.6"))
+# Độ trễ detect tối đa mong muốn (giây, từ lúc chụp frame tới lúc có kết quả);
+# vượt ngưỡng thì tự giãn chu kỳ detect / giảm kích thước ảnh
+DETECT_LAG_BUDGET = float(os.environ.get("SSS_DETECT_LAG_BUDGET", "1.0"))
+
+# Cách ghi hình: auto | ffmpeg | copy | opencv (xem backend/recorder.py)
+RECORD_BACKEND = os.environ.get("SSS_RECORD_BACKEND", "auto").lower()
+# Ghi hình theo đoạn dài SSS_SEGMENT_SECONDS giây (mặc định 5 phút)
+SEGMENT_SECONDS = float(os.environ.get("SSS_SEGMENT_SECONDS", "300"))
+# Dọn video cũ: quá SSS_RETENTION_DAYS ngày, vượt SSS_QUOTA_MB_PER_CAMERA mỗi camera,
+# hoặc ổ đĩa còn trống < SSS_MIN_FREE_MB (0 = tắt tiêu chí đó)
+RETENTION_DAYS = float(os.environ.get("SSS_RETENTION_DAYS", "7"))
+QUOTA_MB_PER_CAMERA = float(os.environ.get("SSS_QUOTA_MB_PER_CAMERA", "2048"))
+MIN_FREE_MB = float(os.environ.get("SSS_MIN_FREE_MB", "500"))
+# Clip theo sự kiện (camera bật "event_record"): giữ SSS_PREROLL_SECONDS giây trước sự kiện,
+# ghi thêm SSS_POSTROLL_SECONDS giây sau sự kiện cuối, 1 clip dài tối đa SSS_CLIP_MAX_SECONDS
+PREROLL_SECONDS = float(os.environ.get("SSS_PREROLL_SECONDS", "10"))
+POSTROLL_SECONDS = float(os.environ.get("SSS_POSTROLL_SECONDS", "10"))
+CLIP_MAX_SECONDS = float(os.environ.get("SSS_CLIP_MAX_SECONDS", "120"))
+CLIP_FPS = float(os.environ.get("SSS_CLIP_FPS", "5"))
+# Ảnh event: "annotated" (vẽ box, encode lại) | "raw" (ghi nguyên JPEG camera, không tốn CPU)
+EVENT_IMAGE_MODE = os.environ.get("SSS_EVENT_IMAGE", "annotated").lower()
+# fsync ảnh event: "batch" (1 lần mỗi lô) | "always" | "never"
+EVENT_FSYNC = os.environ.get("SSS_EVENT_FSYNC", "batch").lower()
 
 os.makedirs(EVENT_DIR, exist_ok=True)
 os.makedirs(RECORD_DIR, exist_ok=True)
+os.makedirs(CLIP_DIR, exist_ok=True)
 
 def _default_cameras():
     """
@@ -62,6 +101,19 @@ def _cameras_to_serializable(cameras_dict: dict):
             # Nếu camera là loại đặc biệt (ví dụ local webcam),
             # bạn có thể lưu thêm "device_index"
             "device_index": cam.get("device_index", None),
+            # "auto": ưu tiên MJPEG stream, lỗi thì /capture | "capture": chỉ /capture
+            "ingest_mode":  cam.get("ingest_mode", "auto"),
+            # URL MJPEG riêng (để trống -> tự thử <host>/stream và <host>:81/stream)
+            "stream_url":   cam.get("stream_url", None),
+            # detect người chạy nền phía server
+            "detect_enabled": cam.get("detect_enabled", False),
+            "detect_fps":   cam.get("detect_fps", 2.0),
+            "motion":       cam.get("motion", None),
+            # vùng quan tâm (polygon toạ độ 0..1) + cạnh dài ảnh đưa vào model
+            "roi":          cam.get("roi", None),
+            "infer_size":   cam.get("infer_size", 640),
+            # ghi clip pre-roll + post-roll khi có người (backend/event_clips.py)
+            "event_record": cam.get("event_record", False),
         }
     return cams_out
 
@@ -84,6 +136,15 @@ def _cameras_from_serializable(cams_from_file: dict):
             "tilt":         cam.get("tilt", 90),
             "last_login":   cam.get("last_login", 0.0),
             "device_index": cam.get("device_index", None),
+            "ingest_mode":  cam.get("ingest_mode", "auto"),
+            "stream_url":   cam.get("stream_url", None),
+            "detect_enabled": cam.get("detect_enabled", False),
+            "detect_fps":   cam.get("detect_fps", 2.0),
+            "motion":       cam.get("motion", None),
+            "roi":          cam.get("roi", None),
+            "infer_size":   cam.get("infer_size", 640),
+            # ghi clip pre-roll + post-roll khi có người (backend/event_clips.py)
+            "event_record": cam.get("event_record", False),
         }
     return restored
 
@@ -113,21 +174,9 @@ def save_cameras(cameras_dict: dict):
     except Exception as e:
         print("[state] Lỗi ghi cameras.json:", e)
 
-def list_recordings():
-    out = []
-    for f in glob.glob(os.path.join(RECORD_DIR, "*.mp4")):
-        stat = os.stat(f)
-        out.append({
-            "file": f,
-            "size_kb": int(stat.st_size / 1024),
-            "ts": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stat.st_mtime))
-        })
-    out.sort(key=lambda x: x["ts"], reverse=True)
-    return out
-
 # ---------------------------------------------------------
-# SYSTEM_STATE: auth, alarm, events, cameras
-# cameras sẽ load từ file
+# SYSTEM_STATE: auth, alarm, cameras
+# cameras sẽ load từ file; event nằm trong SQLite (backend/event_store.py)
 # ---------------------------------------------------------
 SYSTEM_STATE = {
     "auth": {
@@ -136,6 +185,5 @@ SYSTEM_STATE = {
         "logged_in": False,
     },
     "alarm_enabled": True,
-    "events": [],
     "cameras": load_cameras(),  # <--- QUAN TRỌNG
 }
@@ -0,0 +1,195 @@
+# backend/tracker.py
+#
+# Tracker nhẹ (IoU + khoảng cách tâm) theo từng camera: gán track_id cho box
+# người qua các lần detect, để 1 người đứng trong khung hình chỉ sinh 1 event
+# (khi xuất hiện) thay vì 1 event mỗi frame, thêm 1 event nếu đứng lâu quá dwell_s.
+
+import itertools
+import threading
+
+
+def iou(a, b) -> float:
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    iw = min(ax2, bx2) - max(ax1, bx1)
+    ih = min(ay2, by2) - max(ay1, by1)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+    return inter / float(union) if union > 0 else 0.0
+
+
+def _center(b):
+    return ((b[0] + b[2]) / 2.0, (b[1] + b[3]) / 2.0)
+
+
+class Track:
+    __slots__ = ("id", "bbox", "conf", "first_seen", "last_seen", "hits", "missed",
+                 "reported", "dwell_reported")
+
+    def __init__(self, track_id: int, bbox, conf: float, ts: float):
+        self.id = track_id
+        self.bbox = bbox
+        self.conf = conf
+        self.first_seen = ts
+        self.last_seen = ts
+        self.hits = 1
+        self.missed = 0              # số lần detect liên tiếp không thấy track này
+        self.reported = False        # đã phát event "new" chưa
+        self.dwell_reported = False  # đã phát event "dwell" chưa
+
+
+class IouTracker:
+    """
+    Tracker cho 1 camera.
+    update(seq, ts, boxes) -> list event cần phát:
+        {"track_id", "reason": "new" | "dwell", "bbox", "conf", "dwell_s"}
+    và gắn "track_id" vào từng box.
+    - Ghép box với track theo IoU (tham lam, IoU cao trước), box chưa ghép được thì
+      thử theo khoảng cách tâm (người đi nhanh / detect thưa nên IoU thấp).
+    - Track bị bỏ khi đã hụt max_misses lần detect liên tiếp VÀ không thấy lại sau
+      max_age giây. Tuổi tính theo số lần detect chứ không chỉ theo đồng hồ: lúc
+      motion gating ngừng detect (người đứng yên) track vẫn giữ, có chuyển động lại
+      không sinh event "new" lần nữa. max_idle: giới hạn cứng (giây) cho track không
+      được detect lại (vd tắt detect rồi bật lại sau nhiều giờ).
+    """
+    def __init__(self, iou_thresh: float = 0.3, max_age: float = 3.0,
+                 dwell_s: float = 60.0, min_hits: int = 1, centroid_ratio: float = 0.5,
+                 max_misses: int = 3, max_idle: float = 600.0):
+        self.iou_thresh = iou_thresh
+        self.max_age = max_age
+        self.max_misses = max_misses
+        self.max_idle = max_idle
+        self.dwell_s = dwell_s
+        self.min_hits = min_hits
+        self.centroid_ratio = centroid_ratio
+        self.tracks = {}
+        self.last_seq = 0
+        self._ids = itertools.count(1)
+
+    def _match(self, boxes):
+        pairs = sorted(
+            ((iou(t.bbox, b["bbox"]), tid, i)
+             for tid, t in self.tracks.items()
+             for i, b in enumerate(boxes)),
+            reverse=True,
+        )
+        matches = {}
+        used = set()
+        for score, tid, i in pairs:
+            if score < self.iou_thresh:
+                break
+            if tid in used or i in matches:
+                continue
+            matches[i] = tid
+            used.add(tid)
+
+        # box còn lại: ghép với track gần nhất nếu tâm lệch ít hơn centroid_ratio * cỡ box
+        for i, b in enumerate(boxes):
+            if i in matches:
+                continue
+            bx, by = _center(b["bbox"])
+            best, best_d = None, None
+            for tid, t in self.tracks.items():
+                if tid in used:
+                    continue
+                tx, ty = _center(t.bbox)
+                size = max(t.bbox[2] - t.bbox[0], t.bbox[3] - t.bbox[1], 1)
+                d = ((bx - tx) ** 2 + (by - ty) ** 2) ** 0.5
+                if d <= self.centroid_ratio * size and (best_d is None or d < best_d):
+                    best, best_d = tid, d
+            if best is not None:
+                matches[i] = best
+                used.add(best)
+        return matches
+
+    def update(self, seq: int, ts: float, boxes, max_age: float = None):
+        if seq <= self.last_seq:
+            # kết quả cũ về muộn -> bỏ, tránh làm lệch track
+            return []
+        self.last_seq = seq
+
+        max_age = max_age or self.max_age
+        for tid, t in list(self.tracks.items()):
+            idle = ts - t.last_seen
+            if (t.missed >= self.max_misses and idle > max_age) or idle > max(self.max_idle, max_age):
+                del self.tracks[tid]
+
+        matches = self._match(boxes)
+        matched = set(matches.values())
+        for tid, t in self.tracks.items():
+            if tid not in matched:
+                t.missed += 1
+        events = []
+        for i, b in enumerate(boxes):
+            tid = matches.get(i)
+            if tid is None:
+                t = Track(next(self._ids), b["bbox"], b["conf"], ts)
+                self.tracks[t.id] = t
+            else:
+                t = self.tracks[tid]
+                t.bbox, t.conf, t.last_seen = b["bbox"], b["conf"], ts
+                t.hits += 1
+                t.missed = 0
+            b["track_id"] = t.id
+
+            if not t.reported and t.hits >= self.min_hits:
+                t.reported = True
+                events.append({"track_id": t.id, "reason": "new", "bbox": t.bbox,
+                               "conf": t.conf, "dwell_s": round(ts - t.first_seen, 1)})
+            elif t.reported and not t.dwell_reported and ts - t.first_seen >= self.dwell_s:
+                t.dwell_reported = True
+                events.append({"track_id": t.id, "reason": "dwell", "bbox": t.bbox,
+                               "conf": t.conf, "dwell_s": round(ts - t.first_seen, 1)})
+        return events
+
+
+class TrackerRegistry:
+    """
+    Giữ IouTracker cho từng camera.
+    max_age tự giãn theo chu kỳ detect của camera (detect thưa thì giữ track lâu hơn).
+    interval(cam_id) -> chu kỳ detect thực tế (giây), vd DetectionScheduler.interval
+    (đã nhân hệ số giãn của AdaptiveController); None -> tính từ detect_fps cấu hình.
+    """
+    def __init__(self, cameras: dict, iou_thresh: float = 0.3, max_age: float = 3.0,
+                 dwell_s: float = 60.0):
+        self.cameras = cameras
+        self.iou_thresh = iou_thresh
+        self.max_age = max_age
+        self.dwell_s = dwell_s
+        self.interval = None
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    def _max_age(self, cam_id: str) -> float:
+        if self.interval is not None:
+            interval = self.interval(cam_id)
+        else:
+            cam = self.cameras.get(cam_id) or {}
+            interval = 1.0 / max(float(cam.get("detect_fps", 2.0) or 2.0), 0.1)
+        return max(self.max_age, 3.0 * interval)
+
+    def update(self, cam_id: str, seq: int, ts: float, boxes):
+        with self._lock:
+            tr = self._trackers.get(cam_id)
+            if tr is None:
+                tr = self._trackers[cam_id] = IouTracker(
+                    iou_thresh=self.iou_thresh, max_age=self.max_age, dwell_s=self.dwell_s)
+            return tr.update(seq, ts, boxes, max_age=self._max_age(cam_id))
+
+    def status(self, cam_id: str):
+        with self._lock:
+            tr = self._trackers.get(cam_id)
+            if tr is None:
+                return []
+            return [
+                {"track_id": t.id, "bbox": t.bbox, "conf": round(t.conf, 3),
+                 "first_seen": t.first_seen, "last_seen": t.last_seen, "hits": t.hits,
+                 "missed": t.missed}
+                for t in tr.tracks.values()
+            ]
+
+    def forget(self, cam_id: str):
+        with self._lock:
+            self._trackers.pop(cam_id, None)
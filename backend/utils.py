@@ -4,30 +4,36 @@ import time
 import platform
 import cv2
 import subprocess
+from datetime import datetime
 from pathlib import Path
 
-from .state import EVENT_DIR  # EVENT_DIR là string path từ state.py
 
-
-def save_event_image(cam_id: str, frame) -> str:
+def draw_timestamp(frame_bgr, ts: float = None):
     """
-    Lưu 1 frame BGR (numpy array) xuống thư mục EVENT_DIR
-    với tên dạng camID_timestamp.jpg
-    Trả về đường dẫn (string) tới file vừa lưu.
+    Vẽ timestamp (mặc định: thời điểm hiện tại) ở góc dưới trái của frame.
+    Vẽ trực tiếp lên frame_bgr (in-place) và trả lại chính frame đó.
     """
-    os.makedirs(EVENT_DIR, exist_ok=True)
-
-    ts = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"{cam_id}_{ts}.jpg"
-    filepath = os.path.join(EVENT_DIR, filename)
-
-    try:
-        cv2.imwrite(filepath, frame)
-    except Exception as e:
-        print(f"[save_event_image] Lỗi ghi ảnh: {e}")
-        return ""
-
-    return filepath
+    if ts is None:
+        ts = time.time()
+    ts_text = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    scale = 0.5
+    thickness = 1
+    color = (0, 255, 0)  # xanh lá cho dễ nhìn
+    # vị trí: x=10, y=đáy-10
+    x = 10
+    y = frame_bgr.shape[0] - 10
+    cv2.putText(
+        frame_bgr,
+        ts_text,
+        (x, y),
+        font,
+        scale,
+        color,
+        thickness,
+        cv2.LINE_AA
+    )
+    return frame_bgr
 
 
 def _try_spawn(command_list):
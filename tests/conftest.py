@@ -0,0 +1,5 @@
+# Cho phép `pytest` chạy từ thư mục gốc project: import backend.* như khi chạy uvicorn
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,35 @@
+from backend.adaptive import SIZE_LEVELS, AdaptiveController
+
+
+class _Overloaded:
+    num_workers = 1
+    last_batch_size = 1
+    last_batch_ms = 500.0
+
+    def __init__(self, input_hw):
+        self.input_hw = input_hw
+
+    def queue_depth(self):
+        return 10
+
+    def readiness(self):
+        return {"state": "ready", "input_hw": self.input_hw}
+
+
+def _overload(ctrl, steps=10):
+    for _ in range(steps):
+        ctrl._last_step = 0.0
+        ctrl.step(demand_fps=10.0)
+
+
+def test_dynamic_input_shrinks_size():
+    ctrl = AdaptiveController(_Overloaded(None))
+    _overload(ctrl)
+    assert ctrl.infer_size() < SIZE_LEVELS[0]
+
+
+def test_fixed_input_only_stretches_interval():
+    ctrl = AdaptiveController(_Overloaded((640, 640)))
+    _overload(ctrl)
+    assert ctrl.level == 0 and ctrl.infer_size() == 640
+    assert ctrl.factor == ctrl.max_factor
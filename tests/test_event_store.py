@@ -0,0 +1,35 @@
+import threading
+
+from backend.db import Database
+from backend.event_store import EventStore, EventWriter
+
+
+def test_event_writer_records_in_background(tmp_path):
+    store = EventStore(Database(str(tmp_path / "sss.db")), hot_size=10)
+    added, threads = [], []
+
+    def prepare(job):
+        threads.append(threading.current_thread().name)
+        job["clip_path"] = "clips/cam1.mp4"
+        return job
+
+    writer = EventWriter(store, prepare=prepare, on_added=added.append)
+    writer.start()
+    assert writer.submit("cam1", 0.8, track_ids=[3], img_path="events/a.jpg", ts=100.0)
+    assert writer.flush(timeout=2.0)
+    writer.stop()
+
+    events, _ = store.query(cam_id="cam1")
+    assert [(e["img_path"], e["clip_path"], e["track_ids"]) for e in events] == \
+        [("events/a.jpg", "clips/cam1.mp4", [3])]
+    assert [e["id"] for e in added] == [events[0]["id"]]
+    assert threads == ["event-writer"]
+
+
+def test_event_writer_drops_when_queue_full(tmp_path):
+    store = EventStore(Database(str(tmp_path / "sss.db")))
+    writer = EventWriter(store, max_queue=1)  # chưa start: không ai lấy ra
+    assert writer.submit("cam1", 0.5)
+    assert not writer.submit("cam1", 0.5)
+    assert writer.dropped == 1
+    assert not writer.flush(timeout=0.05)
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+import time
+
+from backend.frame_hub import CameraIngest
+
+
+def _ingest():
+    # không start(): test tự publish frame thay cho luồng đọc camera
+    return CameraIngest("cam1", fetch_jpeg=lambda cam_id: None)
+
+
+def test_wait_next_async_woken_by_publish():
+    w = _ingest()
+
+    async def main():
+        threading.Timer(0.1, w.publish, args=(b"jpeg",)).start()
+        t0 = time.time()
+        pkt = await w.wait_next_async(0, timeout=2.0)
+        return pkt, time.time() - t0
+
+    pkt, waited = asyncio.run(main())
+    assert pkt is not None and pkt.jpeg == b"jpeg"
+    assert waited < 1.0
+    assert not w._async_waiters
+
+
+def test_wait_next_async_timeout_and_stop():
+    w = _ingest()
+    first = w.publish(b"a")
+
+    async def main():
+        assert await w.wait_next_async(first.seq, timeout=0.05) is None
+        threading.Timer(0.05, w.stop).start()
+        return await w.wait_next_async(first.seq, timeout=2.0)
+
+    t0 = time.time()
+    assert asyncio.run(main()) is None
+    assert time.time() - t0 < 1.0
+    assert not w._async_waiters
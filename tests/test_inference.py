@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+import pytest
+
+from backend.inference import ProcessInferenceService
+
+
+def _wait(cond, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class _BrokenPreprocessor:
+    def plan(self, cam_id, shape):
+        raise RuntimeError("plan failed")
+
+
+@pytest.fixture
+def service():
+    svc = ProcessInferenceService(workers=1, detector_cfg={"backend": "mock"})
+    svc.start()
+    assert _wait(svc.ready)
+    yield svc
+    svc.stop()
+
+
+def _frame():
+    return np.zeros((48, 64, 3), dtype=np.uint8)
+
+
+def test_dispatch_error_fails_future(service):
+    service.preprocessor = _BrokenPreprocessor()
+    fut = service.submit("cam1", _frame())
+    with pytest.raises(RuntimeError, match="plan failed"):
+        fut.result(timeout=5)
+    service.preprocessor = None
+    assert service.detect("cam1", _frame(), timeout=5) == []
+
+
+def test_dead_worker_is_respawned(service):
+    service.workers[0].proc.kill()
+    service.workers[0].proc.join(timeout=5)
+    # frame gửi lúc worker chết không được treo mãi
+    try:
+        fut = service.submit("cam1", _frame())
+        with pytest.raises(RuntimeError):
+            fut.result(timeout=5)
+    except RuntimeError:
+        pass  # submit đã thấy không còn worker sẵn sàng (DetectorWarming)
+
+    assert _wait(lambda: service.restarts == 1 and service.ready())
+    assert service.detect("cam1", _frame(), timeout=5) == []
@@ -0,0 +1,144 @@
+import os
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from backend import media
+from backend.media import MediaResponse
+
+DATA = bytes(range(256)) * 40  # 10240 byte
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = str(tmp_path / "cam1_20260102_030405.mp4")
+    with open(path, "wb") as f:
+        f.write(DATA)
+
+    async def video(request):
+        return MediaResponse(path, "video/mp4")
+
+    app = Starlette(routes=[Route("/video", video, methods=["GET", "HEAD"])])
+    with TestClient(app) as c:
+        yield c
+
+
+def test_full_file(client):
+    r = client.get("/video")
+    assert r.status_code == 200
+    assert r.content == DATA
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["content-length"] == str(len(DATA))
+    assert r.headers["etag"] and r.headers["last-modified"]
+
+
+def test_full_file_in_chunks(client, monkeypatch):
+    monkeypatch.setattr(media, "CHUNK_SIZE", 1000)
+    assert client.get("/video").content == DATA
+
+
+def test_missing_file(tmp_path):
+    async def video(request):
+        return MediaResponse(str(tmp_path / "gone.mp4"), "video/mp4")
+
+    app = Starlette(routes=[Route("/video", video)])
+    assert TestClient(app).get("/video").status_code == 404
+
+
+def test_if_none_match(client):
+    etag = client.get("/video").headers["etag"]
+    for value in (etag, f'"other", W/{etag}', "*"):
+        r = client.get("/video", headers={"If-None-Match": value})
+        assert r.status_code == 304 and r.content == b""
+        assert r.headers["etag"] == etag
+    assert client.get("/video", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since(client):
+    lm = client.get("/video").headers["last-modified"]
+    assert client.get("/video", headers={"If-Modified-Since": lm}).status_code == 304
+    old = "Mon, 01 Jan 2001 00:00:00 GMT"
+    assert client.get("/video", headers={"If-Modified-Since": old}).status_code == 200
+
+
+def test_single_range(client):
+    r = client.get("/video", headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"bytes 10-19/{len(DATA)}"
+    assert r.content == DATA[10:20]
+
+
+def test_suffix_range(client):
+    r = client.get("/video", headers={"Range": "bytes=-5"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"bytes {len(DATA) - 5}-{len(DATA) - 1}/{len(DATA)}"
+    assert r.content == DATA[-5:]
+
+
+def test_open_ended_range(client):
+    r = client.get("/video", headers={"Range": "bytes=10000-"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"bytes 10000-{len(DATA) - 1}/{len(DATA)}"
+    assert r.content == DATA[10000:]
+
+
+def test_if_range(client):
+    etag = client.get("/video").headers["etag"]
+    r = client.get("/video", headers={"Range": "bytes=0-3", "If-Range": etag})
+    assert r.status_code == 206 and r.content == DATA[:4]
+    # file đã đổi (ETag lệch) -> bỏ Range, trả cả file
+    r = client.get("/video", headers={"Range": "bytes=0-3", "If-Range": '"old"'})
+    assert r.status_code == 200 and r.content == DATA
+
+
+def test_multi_range(client):
+    r = client.get("/video", headers={"Range": "bytes=0-3,100-103,2-5"})
+    assert r.status_code == 206
+    ctype = r.headers["content-type"]
+    assert ctype.startswith("multipart/byteranges; boundary=")
+    boundary = ctype.split("boundary=")[1].encode()
+    assert r.headers["content-length"] == str(len(r.content))
+
+    parts = r.content.split(b"--" + boundary)
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    got = []
+    for part in parts[1:-1]:
+        head, body = part.split(b"\r\n\r\n", 1)
+        assert b"Content-Type: video/mp4" in head
+        got.append((head.split(b"Content-Range: ")[1].decode(), body[:-2]))
+    # 0-3 và 2-5 chồng nhau -> gộp thành 0-5
+    assert got == [(f"bytes 0-5/{len(DATA)}", DATA[0:6]),
+                   (f"bytes 100-103/{len(DATA)}", DATA[100:104])]
+
+
+def test_range_not_satisfiable(client):
+    r = client.get("/video", headers={"Range": "bytes=99999-"})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"bytes */{len(DATA)}"
+    assert r.content == b""
+
+
+def test_invalid_range_ignored(client):
+    r = client.get("/video", headers={"Range": "bytes=5-1"})
+    assert r.status_code == 200 and r.content == DATA
+
+
+def test_head(client):
+    r = client.head("/video")
+    assert r.status_code == 200
+    assert r.headers["content-length"] == str(len(DATA))
+    assert r.content == b""
+    r = client.head("/video", headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.headers["content-length"] == "10" and r.content == b""
+
+
+def test_stat_reflects_file_change(client, tmp_path):
+    etag = client.get("/video").headers["etag"]
+    path = next(p for p in tmp_path.iterdir() if p.suffix == ".mp4")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    r = client.get("/video", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
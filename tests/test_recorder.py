@@ -0,0 +1,82 @@
+import time
+
+from backend.recorder import parse_segment_name, part_path, unique_segment_path
+
+
+def test_unique_segment_path_same_second(tmp_path):
+    ts = time.mktime((2026, 1, 2, 3, 4, 5, 0, 0, -1))
+    first = unique_segment_path(str(tmp_path), "front-door", ts, ".mp4")
+    open(part_path(first), "wb").close()       # đoạn đầu đang ghi
+    second = unique_segment_path(str(tmp_path), "front-door", ts, ".mp4")
+    open(second, "wb").close()                 # đoạn thứ hai đã xong
+    third = unique_segment_path(str(tmp_path), "front-door", ts + 0.5, ".mp4")
+
+    assert first.endswith("front-door_20260102_030405.mp4")
+    assert second.endswith("front-door_20260102_030405-1.mp4")
+    assert third.endswith("front-door_20260102_030405-2.mp4")
+    for p in (first, second, third):
+        assert parse_segment_name(p) == ("front-door", ts)
+
+
+# ---- FfmpegWriter với "ffmpeg" giả (python -c ...) ----
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from backend.recorder import EncoderDied, FfmpegWriter, finalize_part
+
+PKT = SimpleNamespace(jpeg=b"\xff" * 65536)  # lớn hơn buffer stdin -> ghi thẳng vào pipe
+
+
+def _fake_ffmpeg(monkeypatch, script):
+    monkeypatch.setattr(FfmpegWriter, "_cmd",
+                        lambda self, encoder, overlay: [sys.executable, "-c", script, self.out_path])
+
+
+def _write_until_error(writer, n=200):
+    for _ in range(n):
+        writer.write_packet(PKT)
+        time.sleep(0.01)
+
+
+def test_ffmpeg_stderr_spam_does_not_block(tmp_path, monkeypatch):
+    # ffmpeg in lỗi decode liên tục (nhiều hơn pipe ~64KB) mà vẫn nhận frame
+    _fake_ffmpeg(monkeypatch, "import sys\n"
+                              "for _ in range(20000): sys.stderr.write('corrupt jpeg data\\n')\n"
+                              "sys.stderr.flush()\n"
+                              "while sys.stdin.buffer.read(65536): pass\n")
+    w = FfmpegWriter(str(tmp_path / "a.part.mp4"), fps=5)
+    for _ in range(50):
+        w.write_packet(PKT)
+    w.close()
+    assert not w.failed
+    assert list(w._stderr)[-1] == "corrupt jpeg data"
+
+
+def test_ffmpeg_early_failure_tries_next_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(FfmpegWriter, "_hw_broken", False)
+    _fake_ffmpeg(monkeypatch, "import sys; sys.stderr.write('Unknown encoder\\n'); sys.exit(1)")
+    w = FfmpegWriter(str(tmp_path / "a.part.mp4"), fps=5)
+    w.configs = [(FfmpegWriter.HW_ENCODER, False), ("libx264", False)]
+    with pytest.raises(RuntimeError, match="no working ffmpeg"):
+        _write_until_error(w)
+    assert not w.configs and not w.failed and FfmpegWriter._hw_broken
+
+
+def test_ffmpeg_mid_stream_death_keeps_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(FfmpegWriter, "_hw_broken", False)
+    _fake_ffmpeg(monkeypatch, "import sys\n"
+                              "sys.stdin.buffer.read(65536)\n"
+                              "open(sys.argv[1], 'wb').write(b'ftyp' * 100)\n"
+                              "sys.exit(1)\n")
+    out = tmp_path / "cam1_20260102_030405.mp4"
+    w = FfmpegWriter(str(out.with_name("cam1_20260102_030405.part.mp4")), fps=5)
+    configs = [(FfmpegWriter.HW_ENCODER, False), ("libx264", False)]
+    w.configs = list(configs)
+    with pytest.raises(EncoderDied):
+        _write_until_error(w)
+    assert w.failed and w.configs == configs and not FfmpegWriter._hw_broken
+    # mp4 dở (thiếu moov) không được đổi tên thành file "đã xong"
+    assert finalize_part(str(out), w.failed) is False
+    assert not list(tmp_path.iterdir())
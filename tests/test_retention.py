@@ -0,0 +1,44 @@
+import os
+import threading
+import time
+
+from backend.retention import RecordingJanitor
+
+
+def _touch(path, size=1000, age_s=0.0):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    t = time.time() - age_s
+    os.utime(path, (t, t))
+
+
+def test_janitor_thread_start_stop(tmp_path):
+    old = tmp_path / "cam1_20200101_000000.mp4"
+    new = tmp_path / "cam1_20990101_000000.mp4"
+    _touch(old, age_s=10 * 86400)
+    _touch(new)
+    deleted = []
+    janitor = RecordingJanitor(str(tmp_path), max_age_days=7, quota_mb=0, min_free_mb=0,
+                               interval=0.05, on_delete=deleted.append)
+
+    janitor.start()
+    deadline = time.time() + 2.0
+    while not deleted and time.time() < deadline:
+        time.sleep(0.01)
+    janitor.stop()
+    janitor.join(timeout=2.0)
+
+    assert not janitor.is_alive()
+    # Thread._bootstrap_inner dọn thread khỏi threading._active khi thoát
+    assert janitor not in threading.enumerate()
+    assert deleted == [str(old)]
+    assert not old.exists() and new.exists()
+
+
+def test_janitor_quota_removes_oldest_first(tmp_path):
+    for i in range(3):
+        _touch(tmp_path / f"cam1_2099010{i + 1}_000000.mp4", size=600_000, age_s=3 - i)
+    janitor = RecordingJanitor(str(tmp_path), max_age_days=0, quota_mb=1, min_free_mb=0)
+    janitor.run_once()
+    assert sorted(os.listdir(tmp_path)) == ["cam1_20990103_000000.mp4"]
+    assert janitor.deleted == 2
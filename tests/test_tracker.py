@@ -0,0 +1,46 @@
+from backend.tracker import IouTracker, TrackerRegistry
+
+
+def _box(x=100, conf=0.9):
+    return {"bbox": (x, 100, x + 50, 200), "conf": conf}
+
+
+def test_detection_gap_does_not_repeat_new_event():
+    tr = IouTracker(max_age=3.0)
+    assert [e["reason"] for e in tr.update(1, 0.0, [_box()])] == ["new"]
+    # motion gating: người đứng yên, 30 giây không có lần detect nào
+    assert tr.update(2, 30.0, [_box(x=102)]) == []
+    assert len(tr.tracks) == 1
+
+
+def test_track_expires_after_missed_runs():
+    tr = IouTracker(max_age=3.0, max_misses=3)
+    tr.update(1, 0.0, [_box()])
+    for seq, ts in ((2, 1.0), (3, 2.0), (4, 4.0)):
+        tr.update(seq, ts, [])
+    # hụt 3 lần và quá max_age -> người quay lại là track mới
+    assert [e["reason"] for e in tr.update(5, 5.0, [_box()])] == ["new"]
+
+
+def test_few_misses_keep_track_even_after_max_age():
+    tr = IouTracker(max_age=3.0, max_misses=3)
+    tr.update(1, 0.0, [_box()])
+    tr.update(2, 8.0, [])          # detect thưa (quá tải): hụt 1 lần
+    assert tr.update(3, 16.0, [_box()]) == []
+
+
+def test_idle_limit_drops_stale_track():
+    tr = IouTracker(max_age=3.0, max_idle=600.0)
+    tr.update(1, 0.0, [_box()])
+    assert [e["reason"] for e in tr.update(2, 601.0, [_box()])] == ["new"]
+
+
+def test_registry_max_age_follows_effective_interval():
+    cameras = {"cam1": {"detect_fps": 2.0}}
+    reg = TrackerRegistry(cameras, max_age=3.0)
+    assert reg._max_age("cam1") == 3.0
+    # AdaptiveController giãn chu kỳ 8x: 0.5s -> 4s
+    reg.interval = lambda cam_id: 4.0
+    assert reg._max_age("cam1") == 12.0
+    reg.update("cam1", 1, 0.0, [_box()])
+    assert reg.update("cam1", 2, 8.0, [_box()]) == []
@@ -5,7 +5,9 @@ import requests
 import io
 import time
 import base64
+import json
 import urllib.parse
+import streamlit.components.v1 as components
 
 
 BACKEND = "http://localhost:8000"  # backend FastAPI
@@ -74,6 +76,76 @@ def render_ai_frame_from_b64(b64_str):
     except Exception:
         return None
 
+def render_live_stream(cam_ids, fps, ai=False, columns=1, height=520):
+    """
+    Xem live bằng 1 kết nối WebSocket tới backend (/ws/live?cams=...).
+    Trình duyệt nhận frame JPEG do backend đẩy về và tự vẽ theo tốc độ camera,
+    không còn vòng lặp requests.get trong Streamlit (và không dừng sau 100 frame).
+    """
+    ws_base = BACKEND.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+    query = urllib.parse.urlencode({
+        "cams": ",".join(cam_ids),
+        "fps": fps,
+        "ai": 1 if ai else 0,
+    })
+    ws_url = f"{ws_base}/ws/live?{query}"
+
+    html = """
+    <div id="grid" style="display:grid;grid-template-columns:repeat(__COLS__,1fr);gap:8px;font-family:sans-serif"></div>
+    <script>
+    const cams = __CAMS__;
+    const wsUrl = __URL__;
+    const slots = {};
+    const grid = document.getElementById("grid");
+    for (const cam of cams) {
+      const box = document.createElement("div");
+      const title = document.createElement("div");
+      title.style.fontWeight = "bold";
+      title.textContent = cam;
+      const img = document.createElement("img");
+      img.style.width = "100%";
+      img.alt = "đang kết nối...";
+      const status = document.createElement("div");
+      status.style.fontSize = "0.9em";
+      box.append(title, img, status);
+      grid.append(box);
+      slots[cam] = {img, status};
+    }
+    function connect() {
+      const ws = new WebSocket(wsUrl);
+      ws.binaryType = "arraybuffer";
+      ws.onmessage = (ev) => {
+        if (typeof ev.data === "string") {
+          const m = JSON.parse(ev.data);
+          const s = slots[m.cam_id];
+          if (!s) return;
+          if (m.note) { s.status.textContent = "⚠ " + m.note; s.status.style.color = "orange"; }
+          else if (m.detected) { s.status.textContent = "🚨 PHÁT HIỆN NGƯỜI! conf=" + m.max_confidence.toFixed(2); s.status.style.color = "red"; }
+          else { s.status.textContent = "✅ Không phát hiện người"; s.status.style.color = "green"; }
+          return;
+        }
+        const u8 = new Uint8Array(ev.data);
+        const nl = u8.indexOf(10);
+        const cam = new TextDecoder().decode(u8.subarray(0, nl));
+        const s = slots[cam];
+        if (!s) return;
+        const old = s.img.src;
+        s.img.src = URL.createObjectURL(new Blob([u8.subarray(nl + 1)], {type: "image/jpeg"}));
+        if (old.startsWith("blob:")) URL.revokeObjectURL(old);
+      };
+      ws.onclose = () => {
+        for (const cam of cams) slots[cam].status.textContent = "Mất kết nối, đang thử lại...";
+        setTimeout(connect, 2000);
+      };
+    }
+    connect();
+    </script>
+    """
+    html = (html.replace("__COLS__", str(columns))
+                .replace("__CAMS__", json.dumps(list(cam_ids)))
+                .replace("__URL__", json.dumps(ws_url)))
+    components.html(html, height=height)
+
 # ---- nếu chưa đăng nhập -> hiện màn hình login và dừng ----
 if not st.session_state.logged_in:
     st.title("Đăng nhập hệ thống giám sát an ninh")
@@ -146,70 +218,14 @@ if page == "Live & Control":
                 key="single_ai_live_enable"
             )
             fps_single = st.slider(
-                "FPS hiển thị (tối đa 10)",
-                1, 10, 5,
+                "FPS hiển thị (tối đa 15)",
+                1, 15, 5,
                 key="single_fps_slider"
             )
 
-            live_placeholder = st.empty()
-            detect_status_placeholder = st.empty()  # để hiển thị trạng thái PHÁT HIỆN / OK
-
             if live_mode:
-                delay = 1.0 / float(fps_single)
-                for i in range(100):
-                    if ai_live_mode:
-                        # gọi detect_only_frame để lấy ảnh có vẽ bbox + kết quả AI
-                        try:
-                            dr = requests.get(
-                                f"{BACKEND}/api/detect_only_frame/{cam_id}",
-                                timeout=4
-                            )
-                            if dr.status_code == 200:
-                                det_json = dr.json()
-                                img_ai = render_ai_frame_from_b64(det_json.get("annotated_jpeg_b64"))
-                                if img_ai is not None:
-                                    live_placeholder.image(
-                                        img_ai,
-                                        caption=f"{cam_id} AI live frame {i}",
-                                        width='stretch'
-                                    )
-                                else:
-                                    live_placeholder.warning("Không decode được ảnh AI.")
-                                # cập nhật trạng thái phát hiện
-                                if det_json.get("note"):
-                                    detect_status_placeholder.warning(det_json["note"])
-                                elif det_json.get("detected"):
-                                    detect_status_placeholder.warning(
-                                        f"🚨 PHÁT HIỆN NGƯỜI! conf={det_json.get('max_confidence',0):.2f}"
-                                    )
-                                else:
-                                    detect_status_placeholder.success("✅ Không phát hiện người")
-                            else:
-                                live_placeholder.warning("Detect API lỗi")
-                        except Exception as e:
-                            live_placeholder.error(f"Lỗi detect live: {e}")
-                    else:
-                        # chế độ live thường (không AI)
-                        try:
-                            frame_resp = requests.get(
-                                f"{BACKEND}/api/stream_frame/{cam_id}",
-                                timeout=3
-                            )
-                            if frame_resp.status_code == 200:
-                                img_bytes = frame_resp.content
-                                live_placeholder.image(
-                                    Image.open(io.BytesIO(img_bytes)),
-                                    caption=f"{cam_id} live frame {i}",
-                                    width='stretch'
-                                )
-                            else:
-                                live_placeholder.warning("Không lấy được frame từ camera.")
-                                break
-                        except Exception as e:
-                            live_placeholder.error(f"Lỗi kết nối: {e}")
-                            break
-
-                    time.sleep(delay)
+                # backend đẩy frame liên tục qua WebSocket, không poll từng frame
+                render_live_stream([cam_id], fps_single, ai=ai_live_mode)
 
             st.markdown("### 👁️ Phát hiện người (Detect Now)")
             if st.button("Detect Now"):
@@ -243,12 +259,12 @@ if page == "Live & Control":
                                 st.success("✅ Không phát hiện người.")
 
                             # hiển thị ảnh snapshot nếu có
-                            if det.get("saved_image"):
+                            if det.get("saved_image_id"):
                                 st.write("Ảnh snapshot:")
                                 try:
                                     img_bytes = requests.get(
                                         f"{BACKEND}/api/event_image",
-                                        params={"path": det["saved_image"]},
+                                        params={"id": det["saved_image_id"]},
                                         timeout=5
                                     ).content
                                     st.image(
@@ -313,6 +329,109 @@ if page == "Live & Control":
 
             st.divider()
 
+            # ---- Detect nền phía server ----
+            st.markdown("### 🛰 Detect nền (chạy cả khi không mở dashboard)")
+            try:
+                bg_status = requests.get(f"{BACKEND}/api/detect/status", timeout=3).json()
+                bg_cam = bg_status.get("cameras", {}).get(cam_id, {})
+                detector_state = bg_status.get("detector", "ready")
+            except Exception:
+                bg_cam = {}
+                detector_state = "ready"
+
+            if detector_state != "ready":
+                st.info(f"⏳ Detector đang khởi động ({detector_state}), detect sẽ chạy khi sẵn sàng.")
+
+            bg_enabled = st.checkbox(
+                "Bật detect nền cho camera này",
+                value=bool(bg_cam.get("enabled", False)),
+                key=f"bg_detect_enable_{cam_id}"
+            )
+            bg_fps = st.slider(
+                "Số lần detect mỗi giây",
+                1, 10,
+                int(round(bg_cam.get("fps", 2) or 2)),
+                key=f"bg_detect_fps_{cam_id}"
+            )
+            size_options = [320, 416, 512, 640]
+            cur_size = int(bg_cam.get("infer_size", 640) or 640)
+            bg_size = st.select_slider(
+                "Kích thước ảnh đưa vào model (nhỏ = nhanh hơn)",
+                options=size_options,
+                value=cur_size if cur_size in size_options else 640,
+                key=f"bg_detect_size_{cam_id}"
+            )
+
+            # Vùng detect (ROI) dạng hình chữ nhật, toạ độ 0..1 (1.0 = hết khung hình)
+            cur_roi = bg_cam.get("roi") or [[0, 0], [1, 0], [1, 1], [0, 1]]
+            xs = [p[0] for p in cur_roi]
+            ys = [p[1] for p in cur_roi]
+            roi_x = st.slider("ROI ngang (trái - phải)", 0.0, 1.0,
+                              (float(min(xs)), float(max(xs))), 0.05, key=f"bg_roi_x_{cam_id}")
+            roi_y = st.slider("ROI dọc (trên - dưới)", 0.0, 1.0,
+                              (float(min(ys)), float(max(ys))), 0.05, key=f"bg_roi_y_{cam_id}")
+            if roi_x == (0.0, 1.0) and roi_y == (0.0, 1.0):
+                bg_roi = None
+            else:
+                bg_roi = [[roi_x[0], roi_y[0]], [roi_x[1], roi_y[0]],
+                          [roi_x[1], roi_y[1]], [roi_x[0], roi_y[1]]]
+
+            if st.button("💾 Lưu cấu hình detect nền"):
+                try:
+                    r = requests.post(
+                        f"{BACKEND}/api/detect/config/{cam_id}",
+                        json={"enabled": bg_enabled, "fps": bg_fps,
+                              "infer_size": bg_size, "roi": bg_roi},
+                        timeout=5
+                    )
+                    if r.status_code == 200:
+                        st.success("Đã lưu cấu hình detect nền")
+                    else:
+                        st.error(f"Lỗi lưu cấu hình: {r.status_code} {r.text[:200]}")
+                except Exception as e:
+                    st.error(f"Gửi cấu hình lỗi: {e}")
+
+            if bg_cam.get("enabled") and bg_cam.get("effective_fps") is not None:
+                lag_txt = f", trễ ~{bg_cam['lag_ms']:.0f} ms" if bg_cam.get("lag_ms") is not None else ""
+                st.caption(f"Thực tế: {bg_cam['effective_fps']} lần/giây{lag_txt} "
+                           f"(tự giảm khi server quá tải)")
+
+            if bg_cam.get("last_result_ts"):
+                if bg_cam.get("detected"):
+                    st.warning(f"🚨 Lần detect nền gần nhất: CÓ NGƯỜI (conf={bg_cam.get('max_confidence', 0):.2f})")
+                else:
+                    st.caption("Lần detect nền gần nhất: không có người.")
+
+            # ---- Clip theo sự kiện (pre-roll + post-roll) ----
+            try:
+                clip_status = requests.get(f"{BACKEND}/api/event_record/status/{cam_id}", timeout=3).json()
+            except Exception:
+                clip_status = {}
+            clip_enabled = st.checkbox(
+                f"🎞 Ghi clip khi có người ({clip_status.get('preroll_s', 10):.0f}s trước + "
+                f"{clip_status.get('postroll_s', 10):.0f}s sau)",
+                value=bool(clip_status.get("enabled", False)),
+                key=f"event_record_{cam_id}"
+            )
+            if clip_enabled != bool(clip_status.get("enabled", False)):
+                try:
+                    requests.post(
+                        f"{BACKEND}/api/event_record/config/{cam_id}",
+                        json={"enabled": clip_enabled},
+                        timeout=5
+                    )
+                except Exception as e:
+                    st.error(f"Gửi cấu hình clip lỗi: {e}")
+            if clip_status.get("enabled"):
+                st.caption(
+                    f"Pre-roll: {clip_status.get('buffered_s', 0)}s "
+                    f"({clip_status.get('buffered_kb', 0)} KB RAM), "
+                    f"đã ghi {clip_status.get('clips', 0)} clip"
+                    + ("  🔴 đang ghi clip" if clip_status.get("recording") else "")
+                )
+
+            st.divider()
+
             # ---- Ghi hình thủ công ----
             st.markdown("### ⏺ Ghi hình thủ công (có timestamp)")
 
@@ -348,7 +467,10 @@ if page == "Live & Control":
                         if r.status_code == 200:
                             data = r.json()
                             if data.get("status") == "recording_started":
-                                st.success(f"🚀 Bắt đầu ghi: {data.get('file')}")
+                                st.success(
+                                    f"🚀 Bắt đầu ghi vào {data.get('dir')} "
+                                    f"(mỗi đoạn {int(data.get('segment_s') or 0)}s)"
+                                )
                             elif data.get("status") == "already_recording":
                                 st.warning("⚠ Camera này đang ghi rồi.")
                             else:
@@ -368,7 +490,7 @@ if page == "Live & Control":
                         if r.status_code == 200:
                             data = r.json()
                             if data.get("status") == "recording_stopped":
-                                st.success(f"💾 Đã lưu file: {data.get('file')}")
+                                st.success(f"💾 Đã lưu {len(data.get('segments') or [])} đoạn, đoạn cuối: {data.get('file')}")
                             else:
                                 st.write(data)
                         else:
@@ -376,7 +498,7 @@ if page == "Live & Control":
                     except Exception as e:
                         st.error(f"Stop record request fail: {e}")
 
-            st.caption("Video .mp4 có timestamp sẽ xuất hiện ở tab 'Recordings' sau khi bạn Stop.")
+            st.caption("Video có timestamp được chia đoạn; mỗi đoạn xuất hiện ở tab 'Recordings' khi ghi xong (hoặc khi Stop).")
 
 
     # --------------------------------------------------------
@@ -559,11 +681,11 @@ if page == "Live & Control":
                         st.success("✅ Không phát hiện người.")
 
                     # show snapshot có bounding box
-                    if det.get("saved_image"):
+                    if det.get("saved_image_id"):
                         try:
                             img_bytes = requests.get(
                                 f"{BACKEND}/api/event_image",
-                                params={"path": det["saved_image"]},
+                                params={"id": det["saved_image_id"]},
                                 timeout=5
                             ).content
                             st.image(
@@ -582,8 +704,8 @@ if page == "Live & Control":
         st.markdown("### 👀 Xem nhiều cam (live / snapshot)")
 
         fps_multi = st.slider(
-            "FPS hiển thị tất cả cam (tối đa 10)",
-            1, 10, 5,
+            "FPS hiển thị tất cả cam (tối đa 15)",
+            1, 15, 5,
             key="multi_fps_slider"
         )
         live_multi = st.checkbox(
@@ -698,38 +820,95 @@ if page == "Live & Control":
             for idx, cam_id_slot in enumerate(selected_multi):
                 render_one_cam(idx, cam_id_slot, frame_idx=None, just_once=True)
 
-        # Live loop
+        # Live: 1 kết nối WebSocket cho tất cả cam đã chọn
         if live_multi:
-            delay_multi = 1.0 / float(fps_multi)
-            for frame_idx in range(100):  # ~100 frame cho mỗi lần bật
-                for idx, cam_id_slot in enumerate(selected_multi):
-                    render_one_cam(idx, cam_id_slot, frame_idx=frame_idx, just_once=False)
-                time.sleep(delay_multi)
+            n_rows = (len(selected_multi) + 1) // 2
+            render_live_stream(
+                selected_multi,
+                fps_multi,
+                ai=ai_multi_live,
+                columns=2 if len(selected_multi) > 1 else 1,
+                height=400 * n_rows,
+            )
 
 # ============================================================
 # PAGE: Events
 # ============================================================
 elif page == "Events":
     st.subheader("Sự kiện phát hiện người")
-    ev_resp = requests.get(f"{BACKEND}/api/events").json()
+
+    # Lọc + phân trang (cursor = id event cuối trang trước)
+    EV_PAGE_SIZE = 20
+    try:
+        ev_cam_ids = [c["cam_id"] for c in requests.get(f"{BACKEND}/api/cameras", timeout=5).json()["cameras"]]
+    except Exception:
+        ev_cam_ids = []
+    col_f1, col_f2 = st.columns(2)
+    with col_f1:
+        ev_cam = st.selectbox("Camera", ["Tất cả"] + ev_cam_ids, key="ev_cam_filter")
+    with col_f2:
+        ev_min_conf = st.slider("Độ tin cậy tối thiểu", 0.0, 1.0, 0.0, 0.05, key="ev_min_conf")
+
+    if "ev_cursors" not in st.session_state:
+        st.session_state.ev_cursors = [None]
+    if st.session_state.get("ev_filter_prev") != (ev_cam, ev_min_conf):
+        st.session_state.ev_cursors = [None]
+        st.session_state.ev_filter_prev = (ev_cam, ev_min_conf)
+
+    ev_params = {"limit": EV_PAGE_SIZE}
+    if ev_cam != "Tất cả":
+        ev_params["cam_id"] = ev_cam
+    if ev_min_conf > 0:
+        ev_params["min_conf"] = ev_min_conf
+    if st.session_state.ev_cursors[-1] is not None:
+        ev_params["cursor"] = st.session_state.ev_cursors[-1]
+    ev_resp = requests.get(f"{BACKEND}/api/events", params=ev_params).json()
     events = ev_resp["events"]
 
+    ev_page_no = len(st.session_state.ev_cursors)
+    col_p, col_n, col_c = st.columns([1, 1, 2])
+    with col_p:
+        if ev_page_no > 1 and st.button("⬅️ Mới hơn", key="ev_prev"):
+            st.session_state.ev_cursors.pop()
+            st.rerun()
+    with col_n:
+        if ev_resp.get("next_cursor") is not None and st.button("Cũ hơn ➡️", key="ev_next"):
+            st.session_state.ev_cursors.append(ev_resp["next_cursor"])
+            st.rerun()
+    with col_c:
+        st.caption(f"Trang {ev_page_no}")
+
     if not events:
         st.info("Chưa có sự kiện nào.")
     else:
+        # Ảnh nạp thẳng từ backend bằng URL (browser tự cache theo ETag / Cache-Control):
+        # danh sách chỉ tải thumbnail, ảnh gốc + clip chỉ tải khi mở event đó.
         for ev in events:
-            with st.expander(
-                f"[{ev['ts']}] Cam {ev['cam_id']}  conf={ev['confidence']:.2f}"
-            ):
-                img_bytes = requests.get(
-                    f"{BACKEND}/api/event_image",
-                    params={"path": ev["img_path"]}
-                ).content
-                st.image(
-                    Image.open(io.BytesIO(img_bytes)),
-                    caption=ev["img_path"],
-                    width='stretch'
+            col_thumb, col_info = st.columns([1, 3])
+            with col_thumb:
+                if ev.get("img_id"):
+                    st.image(
+                        f"{BACKEND}/api/event_thumb?id={ev['img_id']}",
+                        width='stretch'
+                    )
+            with col_info:
+                st.markdown(
+                    f"**[{ev['ts']}] Cam {ev['cam_id']}**  conf={ev['confidence']:.2f}"
+                    + ("  ⏱ đứng lâu" if ev.get("reason") == "dwell" else "")
+                    + ("  🎞" if ev.get("clip_id") else "")
                 )
+                ev_key = ev["id"]
+                if st.toggle("Mở chi tiết", key=f"ev_open_{ev_key}"):
+                    if ev.get("img_id"):
+                        st.image(
+                            f"{BACKEND}/api/event_image?id={ev['img_id']}",
+                            caption=ev["img_path"],
+                            width='stretch'
+                        )
+                    if ev.get("clip_id"):
+                        clip_url = f"{BACKEND}/api/preview_video?id={ev['clip_id']}"
+                        st.video(clip_url)
+                        st.caption(f"🎞 {ev['clip_path']} (clip xuất hiện sau khi hết post-roll)")
 
 # ============================================================
 # PAGE: Recordings
@@ -737,47 +916,71 @@ elif page == "Events":
 elif page == "Recordings":
     st.subheader("📼 Video đã ghi")
 
-    # lấy danh sách file từ backend
-    rec_resp = requests.get(f"{BACKEND}/api/recordings").json()
-    recs = rec_resp.get("recordings", [])
+    rec_kind = st.radio("Loại video", ["Ghi hình", "Clip sự kiện"], horizontal=True)
+    rec_endpoint, rec_key = ("clips", "clips") if rec_kind == "Clip sự kiện" else ("recordings", "recordings")
+
+    # Phân trang bằng cursor: chỉ tải REC_PAGE_SIZE video mỗi lần, kho video lớn cũng không chậm
+    REC_PAGE_SIZE = 50
+    if "rec_cursors" not in st.session_state:
+        st.session_state.rec_cursors = [None]  # cursor của từng trang đã xem
+
+    rec_cam_prev = st.session_state.get("rec_cam_filter_prev")
+    rec_cam = st.session_state.get("rec_cam_filter", "Tất cả")
+    if (rec_kind, rec_cam) != rec_cam_prev:
+        st.session_state.rec_cursors = [None]
+        st.session_state.rec_cam_filter_prev = (rec_kind, rec_cam)
+
+    params = {"limit": REC_PAGE_SIZE}
+    if st.session_state.rec_cursors[-1]:
+        params["cursor"] = st.session_state.rec_cursors[-1]
+    if rec_cam != "Tất cả":
+        params["cam_id"] = rec_cam
+    rec_resp = requests.get(f"{BACKEND}/api/{rec_endpoint}", params=params).json()
+    recs = rec_resp.get(rec_key, [])
+
+    st.selectbox("Camera", ["Tất cả"] + rec_resp.get("cameras", []), key="rec_cam_filter")
 
     if len(recs) == 0:
         st.info("Chưa có video ghi hình nào.")
         st.stop()
 
-    # Chọn 1 file để xem
-    # recs: bạn đang trả dạng list các dict/paths? 
-    # Giả sử mỗi phần tử là path tuyệt đối hoặc tương đối. 
-    # Ta sẽ hiển thị tên file = os.path.basename()
-    file_display_names = []
-    for r in recs:
-        # nếu recordings là chuỗi path thì dùng luôn r,
-        # còn nếu là dict {"file": "..."} thì adapt lại
-        if isinstance(r, dict) and "file" in r:
-            fpath = r["file"]
-        else:
-            fpath = str(r)
-        file_display_names.append(fpath)
-
-    chosen_file = st.selectbox(
+    def _rec_label(r):
+        dur = f"{r['duration_s']:.0f}s" if r.get("duration_s") is not None else "?"
+        return f"[{r['ts']}] {r['cam_id']} ({dur}, {r['size_kb']} KB) - {r['file']}"
+
+    chosen = st.selectbox(
         "Chọn video để xem:",
-        options=file_display_names,
+        options=recs,
+        format_func=_rec_label,
         index=0
     )
+    chosen_id = chosen["media_id"]
 
     # Nút tải về
-    dl_url = f"{BACKEND}/api/download_video?file={urllib.parse.quote(chosen_file)}"
+    dl_url = f"{BACKEND}/api/download_video?id={chosen_id}"
     st.markdown(f"[⬇️ Tải video]({dl_url})")
 
     # Phát trực tiếp trên trang
-    preview_url = f"{BACKEND}/api/preview_video?file={urllib.parse.quote(chosen_file)}"
+    preview_url = f"{BACKEND}/api/preview_video?id={chosen_id}"
     st.markdown("### ▶️ Xem trực tiếp")
     st.video(preview_url)
 
     st.markdown("---")
-    st.write("Danh sách tất cả video có sẵn:")
-    for f in file_display_names:
-        st.write("-", f)
+    page_no = len(st.session_state.rec_cursors)
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if page_no > 1 and st.button("⬅️ Mới hơn"):
+            st.session_state.rec_cursors.pop()
+            st.rerun()
+    with col_page:
+        st.caption(f"Trang {page_no}")
+    with col_next:
+        if rec_resp.get("next_cursor") and st.button("Cũ hơn ➡️"):
+            st.session_state.rec_cursors.append(rec_resp["next_cursor"])
+            st.rerun()
+
+    for r in recs:
+        st.write("-", _rec_label(r))
 
 
 # ============================================================